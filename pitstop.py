@@ -1,20 +1,714 @@
+import functools
+import logging
+import os
 import sqlite3
+import sys
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
 from ttkbootstrap.style import Style
 from tkinter import messagebox
-from datetime import datetime, timedelta
-import csv
+from datetime import datetime
 from tkinter import filedialog
 import uuid
-import os
-import shutil
-from tkinter import Text, END
+from tkinter import Text, END, Menu
 import time
+import threading
+import queue
+from concurrent.futures import Future
+import pitstop_db as db
+
+class DatabaseExecutor:
+    """Run database work on background threads over a db.ConnectionPool.
+
+    submit(func, *args) queues func(conn, *args) and returns a Future; on_done(result)
+    or on_error(exception) is then called on the Tk thread. Writes run one at a time
+    on the pool's writer in submission order; read=True jobs go to `readers` threads
+    on read-only connections and run alongside them. A read submitted with a key
+    supersedes the previous read with that key, and cancel() interrupts a running
+    query. debounce=True holds a job back for debounce_ms first, so a burst of
+    keystrokes only queries for the last one. Superseded and cancelled reads are
+    dropped quietly; a write that does not complete always reaches on_error, so a
+    save never disappears unnoticed. on_error is the handler for jobs submitted
+    without one; with neither, the error is logged. on_busy(True/False) reports
+    when work is pending.
+    """
+
+    def __init__(self, root, pool, readers=2, poll_ms=25, debounce_ms=250, on_busy=None, on_error=None):
+        self.root = root
+        self.pool = pool
+        self.poll_ms = poll_ms
+        self.debounce_ms = debounce_ms
+        self.on_busy = on_busy
+        self.on_error = on_error
+        self._pending = 0
+        self._keyed = {}
+        self._running = {}
+        self._writes = queue.Queue()
+        self._reads = queue.Queue()
+        self._results = queue.Queue()
+        self._lock = threading.Lock()
+        threading.Thread(target=self._worker, args=(self._writes, pool.writer), name='pitstop-db-writer', daemon=True).start()
+        for index in range(readers):
+            threading.Thread(target=self._worker, args=(self._reads, pool.reader), name=f'pitstop-db-reader-{index}', daemon=True).start()
+
+    def submit(self, func, *args, read=False, key=None, debounce=False, on_done=None, on_error=None):
+        if db.instrumentation is not None:
+            label = db.instrumentation.current_operation() or key or getattr(func, '__name__', 'job')
+            func, on_done = traced_job(label, func, on_done)
+        future = Future()
+        if key is not None and read:
+            previous = self._keyed.get(key)
+            if previous is not None:
+                self.cancel(previous)
+            self._keyed[key] = future
+        job = (future, read, func, args, on_done, on_error)
+        if debounce:
+            self.root.after(self.debounce_ms, self._enqueue, job)
+        else:
+            self._enqueue(job)
+        return future
+
+    def _enqueue(self, job):
+        future, read = job[:2]
+        if read and future.cancelled():
+            # Superseded while it was held back
+            self._forget(future)
+            return
+        (self._reads if read else self._writes).put(job)
+        self._pending += 1
+        if self._pending == 1:
+            if self.on_busy:
+                self.on_busy(True)
+            self.root.after(self.poll_ms, self._poll)
+
+    def _forget(self, future):
+        for key, keyed in list(self._keyed.items()):
+            if keyed is future:
+                del self._keyed[key]
+
+    def cancel(self, future):
+        # Pending jobs are dropped; a running one has its statement interrupted
+        if not future.cancel():
+            with self._lock:
+                conn = self._running.get(future)
+                if conn is not None:
+                    conn.interrupt()
+        return future.cancelled()
+
+    def _worker(self, jobs, connection):
+        while True:
+            future, read, func, args, on_done, on_error = jobs.get()
+            if future.set_running_or_notify_cancel():
+                try:
+                    # The pool rolls back whatever a failed job left open
+                    with connection() as conn:
+                        with self._lock:
+                            self._running[future] = conn
+                        future.set_result(func(conn, *args))
+                except BaseException as e:
+                    future.set_exception(e)
+                finally:
+                    with self._lock:
+                        self._running.pop(future, None)
+            self._results.put((future, read, on_done, on_error))
+
+    def _poll(self):
+        try:
+            while True:
+                try:
+                    future, read, on_done, on_error = self._results.get_nowait()
+                except queue.Empty:
+                    break
+                self._pending -= 1
+                self._deliver(future, read, on_done, on_error)
+        finally:
+            # A failing callback must not stop the results of later jobs arriving
+            if self._pending:
+                self.root.after(self.poll_ms, self._poll)
+            elif self.on_busy:
+                self.on_busy(False)
+
+    def _deliver(self, future, read, on_done, on_error):
+        self._forget(future)
+        error = db.OperationCancelled('Cancelled before it ran') if future.cancelled() else future.exception()
+        if error is None:
+            if on_done:
+                on_done(future.result())
+            return
+        cancelled = isinstance(error, db.OperationCancelled) or (isinstance(error, sqlite3.OperationalError) and 'interrupted' in str(error))
+        if cancelled and read:
+            return
+        on_error = on_error or self.on_error
+        if on_error:
+            on_error(error)
+        else:
+            logging.getLogger('pitstop').error('Database job failed', exc_info=error)
+
+def traced_job(label, func, on_done):
+    # Wrap a background job so its queue wait, query, Tk-side handling and total time are filed under label
+    submitted = time.perf_counter()
+
+    def run(conn, *args):
+        db.instrumentation.record('wait', label, (time.perf_counter() - submitted) * 1000)
+        with db.timed('query', label):
+            return func(conn, *args)
+
+    def done(result):
+        with db.timed('ui', label):
+            on_done(result)
+        db.instrumentation.record('total', label, (time.perf_counter() - submitted) * 1000)
+    return run, done if on_done else None
+
+def traced_loader(method):
+    # With instrumentation on, time the loader and file the jobs it starts under its name
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with db.loader(method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def typed_cell(text):
+    try:
+        return int(text)
+    except (TypeError, ValueError):
+        return text
+
+class VirtualTreeview(ttk.Treeview):
+    """Treeview that keeps its rows in a Python list and only creates Tk items for the visible window.
+
+    Rows are (iid, values, tags, parent[, sort_values]) tuples with children
+    flattened right after their parent; sort_values carries typed keys when the
+    displayed values are formatted. focus/selection_set/item/parent/see/yview
+    answer from the model, so callers can treat off-screen rows as if they existed.
+    put_rows/delete_rows patch single rows after a write without a full reload.
+    """
+
+    OVERSCAN = 5
+
+    def __init__(self, master=None, trace_name='tree', **kw):
+        super().__init__(master, **kw)
+        self.trace_name = trace_name
+        self._rows = []
+        self._index = {}
+        self._positions = {}
+        self._stale = 0
+        self._window = []
+        self._offset = 0
+        self._focus_key = ''
+        self._selection_key = ''
+        self._reported_focus = ''
+        self._tk_focus = ''
+        self._tk_selection = ()
+        self._row_height = None
+        self._header_height = 0
+        self._yscroll = None
+        self._sort = None
+        super().bind('<Configure>', lambda e: self._render(), add='+')
+        for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+            super().bind(sequence, self._on_wheel, add='+')
+        for sequence, step in (('<Up>', -1), ('<Down>', 1), ('<Prior>', 'page-up'), ('<Next>', 'page-down'), ('<Home>', 'home'), ('<End>', 'end')):
+            super().bind(sequence, lambda e, s=step: self._on_key(s), add='+')
+
+    def set_rows(self, rows):
+        # Replace the whole model; like rebuilding a plain Treeview, this clears the selection
+        with db.timed('tree', f'{self.trace_name} model'):
+            self._rows = [self._model_row(row) for row in rows]
+        self._focus_key = self._selection_key = self._reported_focus = ''
+        super().selection_set(())
+        with db.timed('tree', f'{self.trace_name} sort'):
+            self._apply_sort()
+        with db.timed('tree', f'{self.trace_name} render'):
+            self._render()
+
+    def rows(self):
+        return self._rows
+
+    def put_rows(self, rows):
+        # Insert or replace rows (each parent followed by its children), keeping scroll, focus and selection
+        with db.timed('tree', f'{self.trace_name} patch'):
+            for group in db.group_rows(self._model_row(row) for row in rows):
+                position = self._remove_group(group[0][0])
+                if self._sort is not None:
+                    position = self._sorted_position(group[0])
+                elif position is None:
+                    position = len(self._rows)
+                self._insert_group(position, group)
+        with db.timed('tree', f'{self.trace_name} render'):
+            self._render()
+
+    def delete_rows(self, iids):
+        # Drop rows (and their children) from the model, keeping scroll, focus and selection
+        for iid in iids:
+            self._remove_group(str(iid))
+        self._render()
+
+    def _model_row(self, row):
+        return row if len(row) == 5 else tuple(row) + (None,)
+
+    def _position(self, iid):
+        # Positions are cached per iid; an edit only invalidates those from its position on,
+        # and they are re-indexed once on the next lookup that needs one of them
+        iid = str(iid)
+        position = self._positions.get(iid)
+        if position is not None and position < len(self._rows) and self._rows[position][0] == iid:
+            return position
+        if iid not in self._index:
+            return None
+        self._positions.update((row[0], position) for position, row in enumerate(self._rows[self._stale:], self._stale))
+        self._stale = len(self._rows)
+        return self._positions[iid]
+
+    def _insert_group(self, position, group):
+        self._rows[position:position] = group
+        self._index.update((row[0], row) for row in group)
+        self._stale = min(self._stale, position)
+        # Keep the rows in view where they are
+        if self._offset > position:
+            self._offset += len(group)
+
+    def _remove_group(self, iid):
+        position = self._position(iid)
+        if position is None:
+            return None
+        end = position + 1
+        while end < len(self._rows) and self._rows[end][3] == iid:
+            end += 1
+        for row in self._rows[position:end]:
+            del self._index[row[0]]
+            self._positions.pop(row[0], None)
+        del self._rows[position:end]
+        self._stale = min(self._stale, position)
+        if self._offset > position:
+            self._offset = max(position, self._offset - (end - position))
+        return position
+
+    def _sorted_position(self, row):
+        # Binary search for the first group that sorts after row; children share their parent's key
+        column, reverse = self._sort
+        key = self._sort_key(row, column)
+        low, high = 0, len(self._rows)
+        while low < high:
+            middle = (low + high) // 2
+            other = self._rows[middle]
+            other_key = self._sort_key(self._index[other[3]] if other[3] else other, column)
+            if (other_key < key) if reverse else (other_key > key):
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def _sort_key(self, row, column):
+        return db.sort_key((row[4] or row[1])[column])
+
+    def sort_by(self, column, reverse=False):
+        # column=None keeps rows in the order they are given, e.g. pages sorted by the database
+        self._sort = None if column is None else (list(self['columns']).index(column), reverse)
+        self._apply_sort()
+        self._render()
+
+    def _apply_sort(self):
+        if self._sort is not None:
+            self._rows = db.sort_rows(self._rows, *self._sort)
+        self._index = {row[0]: row for row in self._rows}
+        self._positions = {}
+        self._stale = 0
+
+    def configure(self, cnf=None, **kw):
+        # The scrollbar tracks the model, not the handful of materialized items
+        for option in ('yscroll', 'yscrollcommand'):
+            if option in kw:
+                self._yscroll = kw.pop(option)
+        return super().configure(cnf, **kw)
+
+    config = configure
+
+    def bind(self, sequence=None, func=None, add=None):
+        if sequence == '<<TreeviewSelect>>' and callable(func):
+            func = self._select_filter(func)
+        return super().bind(sequence, func, add)
+
+    def _select_filter(self, func):
+        # Re-materializing the window re-selects the focused row; only report real changes
+        def handler(event):
+            key = self.focus()
+            if key == self._reported_focus:
+                return None
+            self._reported_focus = key
+            return func(event)
+        return handler
+
+    def focus(self, item=None):
+        if item is None:
+            self._sync_from_tk()
+            return self._focus_key if self._focus_key in self._index else ''
+        self._sync_from_tk()
+        self._focus_key = str(item)
+        self.see(self._focus_key)
+        if super().exists(self._focus_key):
+            super().focus(self._focus_key)
+            self._tk_focus = self._focus_key
+        return None
+
+    def selection(self):
+        self._sync_from_tk()
+        return (self._selection_key,) if self._selection_key in self._index else ()
+
+    def selection_set(self, *items):
+        if len(items) == 1 and isinstance(items[0], (tuple, list)):
+            items = items[0]
+        self._sync_from_tk()
+        self._selection_key = str(items[0]) if items else ''
+        if self._selection_key:
+            self.see(self._selection_key)
+        if self._selection_key and super().exists(self._selection_key):
+            super().selection_set(self._selection_key)
+        else:
+            super().selection_set(())
+        self._tk_selection = super().selection()
+
+    def item(self, item, option=None, **kw):
+        row = self._index.get(str(item))
+        if row is not None and not kw and not super().exists(str(item)):
+            iid, values, tags = row[:3]
+            data = {'text': '', 'image': '', 'values': values, 'open': False, 'tags': tags}
+            return data if option is None else data[option]
+        return super().item(item, option, **kw)
+
+    def parent(self, item):
+        row = self._index.get(str(item))
+        if row is None:
+            return super().parent(item)
+        return row[3]
+
+    def see(self, item):
+        position = self._position(item)
+        if position is None:
+            return
+        count = self._visible_rows()
+        if position < self._offset:
+            self._offset = position
+        elif position >= self._offset + count:
+            self._offset = position - count + 1
+        else:
+            return
+        self._render()
+
+    def yview(self, *args):
+        total = len(self._rows)
+        count = self._visible_rows()
+        if not args:
+            return (self._offset / total, min(1.0, (self._offset + count) / total)) if total else (0.0, 1.0)
+        if args[0] == 'moveto':
+            self._offset = int(float(args[1]) * total)
+        elif args[0] == 'scroll':
+            amount = int(args[1])
+            self._offset += amount * count if args[2] == 'pages' else amount
+        self._render()
+        return None
+
+    def _visible_rows(self):
+        if self._window:
+            bbox = super().bbox(self._window[0])
+            if bbox:
+                self._header_height, self._row_height = bbox[1], bbox[3]
+        height = self.winfo_height()
+        if self._row_height and height > 1:
+            return max(1, (height - self._header_height) // self._row_height)
+        return int(self.cget('height'))
+
+    def _sync_from_tk(self):
+        # Adopt focus/selection changes the user made in Tk since we last looked,
+        # before the items carrying them go away
+        tk_focus = super().focus()
+        if tk_focus and tk_focus != self._tk_focus:
+            self._focus_key = tk_focus
+        tk_selection = super().selection()
+        if tk_selection and tk_selection != self._tk_selection:
+            self._selection_key = tk_selection[0]
+        self._tk_focus, self._tk_selection = tk_focus, tk_selection
+
+    def _render(self):
+        self._sync_from_tk()
+        count = self._visible_rows()
+        self._offset = max(0, min(self._offset, len(self._rows) - count))
+        if self._window:
+            super().delete(*self._window)
+        window = self._rows[self._offset:self._offset + count + self.OVERSCAN]
+        for iid, values, tags in (row[:3] for row in window):
+            super().insert('', 'end', iid=iid, values=values, tags=tags)
+        self._window = [row[0] for row in window]
+        if super().exists(self._focus_key):
+            super().focus(self._focus_key)
+        if super().exists(self._selection_key):
+            super().selection_set(self._selection_key)
+        self._tk_focus, self._tk_selection = super().focus(), super().selection()
+        super().yview_moveto(0)
+        if self._yscroll:
+            self._yscroll(*self.yview())
+
+    def _on_wheel(self, event):
+        step = -3 if event.num == 4 or getattr(event, 'delta', 0) > 0 else 3
+        self.yview('scroll', step, 'units')
+        return 'break'
+
+    def _on_key(self, step):
+        if not self._rows:
+            return 'break'
+        position = self._position(self.focus())
+        if position is None:
+            position = -1
+        count = self._visible_rows()
+        if step == 'home':
+            position = 0
+        elif step == 'end':
+            position = len(self._rows) - 1
+        elif step == 'page-up':
+            position -= count
+        elif step == 'page-down':
+            position += count
+        else:
+            position += step
+        iid = self._rows[max(0, min(len(self._rows) - 1, position))][0]
+        self.focus(iid)
+        self.selection_set(iid)
+        return 'break'
+
+class Pager(ttk.Frame):
+    """Keyset paging controls for a listing shown in a VirtualTreeview.
+
+    fetch_page is pitstop_db.fetch_parts_page or fetch_services_page. Next/Prev
+    pass the sort keys of the page on screen back to the database, so every page
+    costs the same however deep it is; Go jumps to a sort key value. on_page(rows,
+    vehicle_id) shows a page. The bar is only packed while the tree shows a paged
+    listing (not search results).
+    """
+
+    def __init__(self, master, app, tree, key, table, fetch_page, sort_keys, vehicle_id, on_page):
+        super().__init__(master)
+        self.app = app
+        self.tree = tree
+        self.key = key
+        self.table = table
+        self.fetch_page = fetch_page
+        self.sort_keys = sort_keys
+        self.vehicle_id = vehicle_id
+        self.on_page = on_page
+        self.enabled = ttk.BooleanVar(value=False)
+        self.sort_column = 'ID'
+        self.reverse = False
+        self._first = self._last = None
+        self._offset = None
+        self._rows = 0
+        self._total = None
+        self._request = (0, None, {})
+        self.listing = False
+
+        self.first_button = ttk.Button(self, text='« First', command=self.load, bootstyle=(SECONDARY, OUTLINE))
+        self.prev_button = ttk.Button(self, text='‹ Prev', command=self.prev, bootstyle=(SECONDARY, OUTLINE))
+        self.next_button = ttk.Button(self, text='Next ›', command=self.next, bootstyle=(SECONDARY, OUTLINE))
+        self.last_button = ttk.Button(self, text='Last »', command=self.end, bootstyle=(SECONDARY, OUTLINE))
+        for button in (self.first_button, self.prev_button, self.next_button, self.last_button):
+            button.pack(side='left', padx=2)
+        self.status_label = ttk.Label(self, text='')
+        self.status_label.pack(side='left', padx=10)
+        ttk.Button(self, text='Go', command=self.jump, bootstyle=(SECONDARY, OUTLINE)).pack(side='right', padx=2)
+        self.jump_entry = ttk.Entry(self, width=14, bootstyle=SECONDARY)
+        self.jump_entry.pack(side='right', padx=2)
+        self.jump_entry.bind('<Return>', lambda e: self.jump())
+        self.jump_label = ttk.Label(self, text='Go to ID:')
+        self.jump_label.pack(side='right', padx=2)
+
+    def active(self):
+        return self.enabled.get() and self.listing
+
+    def set_listing(self, visible):
+        self.listing = visible
+        if visible:
+            self.pack(side='bottom', fill='x', pady=(5, 0), before=self.tree)
+        else:
+            self.pack_forget()
+
+    def reset(self):
+        self.sort_column = 'ID'
+        self.reverse = False
+        self.jump_label.configure(text='Go to ID:')
+        self.set_listing(False)
+
+    def sort_by(self, column, reverse):
+        self.sort_column = column
+        self.reverse = reverse
+        self.jump_label.configure(text=f'Go to {column}:')
+        self.load()
+
+    def load(self):
+        # First page, plus a fresh row count estimate for the status line
+        self._estimate()
+        self._fetch(0)
+
+    def reload(self):
+        # Read the page on screen again after a write; patching the written rows into
+        # it would append rows that belong on other pages
+        self._estimate()
+        offset, ends_at, position = self._request
+        self._fetch(offset, ends_at, **position)
+
+    def _estimate(self):
+        self._total = None
+        self.app.read_db(db.estimate_rows, self.table, self.vehicle_id(), key=f'{self.key}_count', on_done=self._set_total)
+
+    def next(self):
+        self._fetch(None if self._offset is None else self._offset + self._rows, after=self._last)
+
+    def prev(self):
+        self._fetch(None, ends_at=self._offset, before=self._first)
+
+    def end(self):
+        self._fetch(None, end=True)
+
+    def jump(self):
+        text = self.jump_entry.get().strip()
+        if not text:
+            return self.load()
+        # The jump value has to have the type of the page key it is compared with
+        value = text
+        if self.sort_column in db.NUMERIC_PAGE_COLUMNS:
+            try:
+                value = int(text)
+            except ValueError:
+                messagebox.showerror('Error', f'{self.sort_column} must be a whole number')
+                return None
+        elif self.sort_column == 'Date':
+            try:
+                value = db.from_display_date(text)
+            except ValueError:
+                pass
+        self._fetch(None, start=value)
+
+    def _fetch(self, offset, ends_at=None, **position):
+        self._request = (offset, ends_at, position)
+        vehicle_id = self.vehicle_id()
+        sort_column, reverse, fetch_page = self.sort_column, self.reverse, self.fetch_page
+        self.app.read_db(lambda conn: fetch_page(conn, vehicle_id, sort_column, reverse, **position), key=self.key,
+                         on_done=lambda page: self._show(page, vehicle_id, offset, ends_at))
+
+    def _show(self, page, vehicle_id, offset, ends_at):
+        rows, first, last, has_prev, has_next = page
+        if not has_prev:
+            offset = 0
+        elif offset is None and ends_at is not None:
+            offset = ends_at - len(rows)
+        elif offset is None and not has_next and self._total is not None:
+            offset = max(self._total - len(rows), 0)
+        self._first, self._last, self._offset, self._rows = first, last, offset, len(rows)
+        self.tree.sort_by(None)
+        self.on_page(rows, vehicle_id)
+        for button, enabled in ((self.first_button, has_prev), (self.prev_button, has_prev),
+                                (self.next_button, has_next), (self.last_button, has_next)):
+            button.configure(state='normal' if enabled else 'disabled')
+        self.set_listing(True)
+        self._update_status()
+
+    def _set_total(self, total):
+        self._total = total
+        self._update_status()
+
+    def _update_status(self):
+        total = f' of ~{self._total:,}' if self._total is not None else ''
+        if self._offset is not None and self._rows:
+            self.status_label.configure(text=f'Rows {self._offset + 1:,}–{self._offset + self._rows:,}{total}')
+        else:
+            self.status_label.configure(text=f'{self._rows:,} rows{total}')
+
+class StatsWindow(ttk.Toplevel):
+    """Live view of db.instrumentation, one row per timed operation, refreshed every second.
+
+    Categories: sql (single statements), loader (the Tk-thread part of a load_*,
+    refresh_* or filter_* method), wait/query/ui/total (the phases of the
+    background jobs a loader started, filed under its name), rows (shaping
+    results into tree rows) and tree (VirtualTreeview model, sort and render).
+    Selecting a row shows its histogram.
+    """
+
+    COLUMNS = ('Category', 'Operation', 'Count', 'Total ms', 'Mean', 'p50', 'p95', 'Max', 'SQL/call')
+    REFRESH_MS = 1000
+
+    def __init__(self, master, instrumentation):
+        super().__init__(title='PitStop - Performance', master=master)
+        self.geometry('1100x550')
+        self.instrumentation = instrumentation
+        self._iids = {}
+        self._stats = {}
+        self._refresh_job = None
+
+        frame = ttk.Frame(self, padding=10)
+        frame.pack(fill='both', expand=True)
+        header = ttk.Frame(frame)
+        header.pack(fill='x', pady=(0, 5))
+        ttk.Label(header, text=f'Slow log (>= {instrumentation.slow_ms:g} ms): {instrumentation.log_path}',
+                  bootstyle=SECONDARY).pack(side='left')
+        ttk.Button(header, text='Reset', command=self.reset, bootstyle=(SECONDARY, OUTLINE)).pack(side='right')
+
+        self.histogram_label = ttk.Label(frame, text='', font=('Courier', 9), justify='left')
+        self.histogram_label.pack(side='bottom', fill='x', pady=(5, 0))
+        self.tree = ttk.Treeview(frame, columns=self.COLUMNS, show='headings', bootstyle='primary')
+        for column in self.COLUMNS:
+            self.tree.heading(column, text=column)
+            self.tree.column(column, width=480 if column == 'Operation' else 70, stretch=column == 'Operation',
+                             anchor='w' if column in ('Category', 'Operation') else 'e')
+        scrollbar = ttk.Scrollbar(frame, orient='vertical', command=self.tree.yview, bootstyle=PRIMARY)
+        self.tree.configure(yscroll=scrollbar.set)
+        scrollbar.pack(side='right', fill='y')
+        self.tree.pack(fill='both', expand=True)
+        self.tree.bind('<<TreeviewSelect>>', lambda e: self.show_histogram())
+        self.refresh()
+
+    def refresh(self):
+        # Update rows in place so scrolling and the selection survive each refresh
+        for index, stat in enumerate(self.instrumentation.stats()):
+            key = (stat['category'], stat['name'])
+            values = (stat['category'], stat['name'], stat['count'], f"{stat['total_ms']:.1f}", f"{stat['mean_ms']:.2f}",
+                      f"{stat['p50_ms']:.2f}", f"{stat['p95_ms']:.2f}", f"{stat['max_ms']:.2f}",
+                      f"{stat['statements'] / stat['count']:.1f}" if stat['statements'] else '')
+            iid = self._iids.get(key)
+            if iid is None:
+                iid = self._iids[key] = str(len(self._iids))
+                self.tree.insert('', index, iid=iid, values=values)
+            else:
+                self.tree.item(iid, values=values)
+                self.tree.move(iid, '', index)
+            self._stats[iid] = stat
+        self.show_histogram()
+        self._refresh_job = self.after(self.REFRESH_MS, self.refresh)
+
+    def show_histogram(self):
+        stat = self._stats.get(self.tree.focus())
+        if stat is None:
+            self.histogram_label.configure(text='Select an operation to see its histogram')
+            return
+        labels = [f'<= {bound:g} ms' for bound in db.HISTOGRAM_BOUNDS] + [f'> {db.HISTOGRAM_BOUNDS[-1]:g} ms']
+        widest = max(stat['buckets'])
+        lines = [f'{label:>12} {count:>8}  ' + '#' * max(1, count * 40 // widest)
+                 for label, count in zip(labels, stat['buckets']) if count]
+        self.histogram_label.configure(text=f"{stat['category']} {stat['name'][:150]}\n" + '\n'.join(lines))
+
+    def reset(self):
+        self.instrumentation.reset()
+        self.tree.delete(*self.tree.get_children())
+        self._iids = {}
+        self._stats = {}
+        self.show_histogram()
+
+    def destroy(self):
+        if self._refresh_job is not None:
+            self.after_cancel(self._refresh_job)
+            self._refresh_job = None
+        super().destroy()
 
 class CarManagementApp:
-    def __init__(self, root):
+    def __init__(self, root, trace=False):
         self.root = root
+        self.started = time.perf_counter()
+        self.startup_times = {}
         self.root.title("PitStop - Car Parts and Service Manager")
         self.root.geometry("1200x800")
 
@@ -23,18 +717,38 @@ class CarManagementApp:
         style.configure('Overdue.Treeview', background='#ffcccc')
         style.configure('AltPart.Treeview.Row', font=('Helvetica', 10, 'italic'))
 
-        # Initialize database
-        db_dir = os.path.join(os.environ.get('XDG_DATA_HOME', os.path.expanduser('~/.local/share')), 'pitstop')
-        os.makedirs(db_dir, exist_ok=True)
-        db_path = os.path.join(db_dir, 'pitstop.db')
-        self.conn = sqlite3.connect(db_path)
-        self.migrate_database()
-        self.create_tables()
+        # Initialize database: one WAL writer plus read-only connections for loaders and searches
+        self.db_path = db.database_path()
+        if trace:
+            # Before the pool opens its connections, so they are timed too
+            db.enable_instrumentation(self.db_path)
+        self.db_pool = db.ConnectionPool(self.db_path)
+        # Vehicles, service types and part headers for selections and combos, answered from memory
+        self.lookups = db.LookupCache(self.db_path)
+        self.db_pool.watch(self.lookups.after_write)
 
         # Main container
         self.main_frame = ttk.Frame(self.root, padding=10)
         self.main_frame.pack(fill='both', expand=True)
 
+        # Busy indicator for background database work
+        self.status_frame = ttk.Frame(self.main_frame)
+        self.status_frame.pack(side='bottom', fill='x')
+        self.busy_bar = ttk.Progressbar(self.status_frame, mode='indeterminate', length=120, bootstyle=INFO)
+        self.cancel_button = ttk.Button(self.status_frame, text='Cancel', command=self.cancel_db_work, bootstyle=(SECONDARY, OUTLINE))
+        self.progress_label = ttk.Label(self.status_frame, text='')
+        if db.instrumentation is not None:
+            ttk.Button(self.status_frame, text='Performance', command=self.show_stats, bootstyle=(INFO, OUTLINE)).pack(side='left', pady=2)
+        self.stats_window = None
+        self._busy = self._busy_shown = False
+        self._progress = None
+        self._progress_report = None
+        self._progress_job = None
+        self._progress_cancel = threading.Event()
+
+        # All database work runs on these workers
+        self.db_executor = DatabaseExecutor(self.root, self.db_pool, on_busy=self.set_busy, on_error=self.show_db_error)
+
         # Notebook for tabs
         self.notebook = ttk.Notebook(self.main_frame, bootstyle=PRIMARY)
         self.parts_tab = ttk.Frame(self.notebook)
@@ -59,28 +773,65 @@ class CarManagementApp:
         }
 
         self.vehicle_filter_id = None
+        self.services_query = (None, None)
         self._last_select_time = 0
         self._debounce_interval = 0.2  # 200ms debounce interval
-        self.id_to_display_map = {}
-
-        # Initialize tabs
-        self.setup_parts_tab()
-        self.setup_vehicles_tab()
-        self.setup_services_tab()
-        self.setup_service_types_tab()
-        self.setup_about_tab()
-
+        self.vehicle_id_map = {}
+        self.service_type_vars = {}
+        self.service_type_list_map = {}
+        self.part_id_map = {}
+        self.pagers = {}
+
+        # Tabs are built, and load their data, on first visit so the window paints right away
+        self.tab_setups = {
+            str(self.parts_tab): self.setup_parts_tab,
+            str(self.vehicles_tab): self.setup_vehicles_tab,
+            str(self.services_tab): self.setup_services_tab,
+            str(self.service_types_tab): self.setup_service_types_tab,
+            str(self.about_tab): self.setup_about_tab
+        }
+        self.built_tabs = set()
         self.current_tab = self.notebook.select()
+        self.build_tab(self.current_tab)
         self.notebook.bind('<<NotebookTabChanged>>', self.on_tab_change)
+        self.main_frame.bind('<Map>', self.on_first_map)
+
+    def build_tab(self, tab):
+        if str(tab) not in self.built_tabs:
+            self.built_tabs.add(str(tab))
+            self.tab_setups[str(tab)]()
+
+    def tab_built(self, tab):
+        return str(tab) in self.built_tabs
+
+    def on_first_map(self, event):
+        # The window is drawn once the idle redraws queued by mapping it have run
+        self.main_frame.unbind('<Map>')
+        self.root.after_idle(lambda: self.record_startup('first paint'))
+
+    def record_startup(self, milestone):
+        if milestone not in self.startup_times:
+            self.startup_times[milestone] = (time.perf_counter() - self.started) * 1000
+            if hasattr(self, 'startup_label'):
+                self.startup_label.configure(text=self.startup_text())
+
+    def startup_text(self):
+        return 'Startup: ' + ', '.join(f'{milestone} {ms:.0f} ms' for milestone, ms in self.startup_times.items())
 
     def on_tab_change(self, event):
         new_tab = self.notebook.select()
+        # A tab built just now has started its own loads
+        first_visit = not self.tab_built(new_tab)
+        self.build_tab(new_tab)
         parts_tab_str = str(self.parts_tab)
         if self.current_tab == parts_tab_str and new_tab != parts_tab_str:
             self.vehicle_filter_id = None
             self.parts_search_entry.delete(0, END)
-        if new_tab == parts_tab_str:
+        if new_tab == parts_tab_str and not first_visit:
             self.refresh_parts()
+        if new_tab == str(self.about_tab):
+            stats = self.lookups.stats()
+            self.cache_label.configure(text=f"Lookup cache: {stats['hits']} hits, {stats['misses']} misses")
         self.current_tab = new_tab
 
     def setup_about_tab(self):
@@ -102,246 +853,124 @@ class CarManagementApp:
                  font=('Helvetica', 12), 
                  justify='left',
                  wraplength=600).pack(anchor='center', pady=20)
+        self.startup_label = ttk.Label(about_frame, text=self.startup_text(), font=('Helvetica', 9), bootstyle=SECONDARY)
+        self.startup_label.pack(anchor='center')
+        self.cache_label = ttk.Label(about_frame, text='', font=('Helvetica', 9), bootstyle=SECONDARY)
+        self.cache_label.pack(anchor='center')
+
+    def run_db(self, func, *args, key=None, on_done=None, on_error=None):
+        # func(conn, *args) runs on the database writer; on_done(result) runs back on the Tk thread
+        future = self.db_executor.submit(func, *args, key=key, on_done=on_done, on_error=on_error)
+        return self.track_progress_job(future, args)
+
+    def read_db(self, func, *args, key=None, debounce=False, on_done=None, on_error=None):
+        # Like run_db, on a read-only connection that does not wait for writes
+        future = self.db_executor.submit(func, *args, read=True, key=key, debounce=debounce, on_done=on_done, on_error=on_error)
+        return self.track_progress_job(future, args)
+
+    def track_progress_job(self, future, args):
+        # The job handed the current progress_reporter() is the one the Cancel button stops
+        if self._progress_report is not None and any(arg is self._progress_report for arg in args):
+            self._progress_job = future
+        return future
+
+    def show_db_error(self, error):
+        if isinstance(error, db.PitStopError):
+            messagebox.showerror('Error', str(error))
+        else:
+            messagebox.showerror('Database Error', f'Error: {error}')
 
-    def migrate_database(self):
-        cursor = self.conn.cursor()
-        # Check if parts table needs migration for unique constraint on (part_number, vehicle_id)
-        cursor.execute("PRAGMA table_info(parts)")
-        columns = {col[1]: col for col in cursor.fetchall()}
-        if 'part_number' in columns and 'vehicle_id' in columns:
-            # Create temp table with UNIQUE constraint on (part_number, vehicle_id)
-            cursor.execute('''
-                CREATE TABLE parts_temp (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    manufacturer TEXT,
-                    part_number TEXT NOT NULL,
-                    description TEXT,
-                    price INTEGER DEFAULT 0,
-                    vehicle_id INTEGER NOT NULL,
-                    FOREIGN KEY (vehicle_id) REFERENCES vehicles(id),
-                    UNIQUE (part_number, vehicle_id)
-                )
-            ''')
-            # Copy data
-            cursor.execute('''
-                INSERT INTO parts_temp (id, name, manufacturer, part_number, description, price, vehicle_id)
-                SELECT id, name, manufacturer, part_number, description, COALESCE(price, 0), vehicle_id
-                FROM parts
-            ''')
-            cursor.execute('DROP TABLE parts')
-            cursor.execute('ALTER TABLE parts_temp RENAME TO parts')
-
-        # Check if alt_parts table needs migration for unique constraint on (part_number, part_id)
-        cursor.execute("PRAGMA table_info(alt_parts)")
-        columns = {col[1]: col for col in cursor.fetchall()}
-        if 'part_number' in columns and 'part_id' in columns:
-            # Create temp table with UNIQUE constraint on (part_number, part_id)
-            cursor.execute('''
-                CREATE TABLE alt_parts_temp (
-                    alt_id TEXT PRIMARY KEY,
-                    part_id INTEGER NOT NULL,
-                    manufacturer TEXT,
-                    part_number TEXT NOT NULL,
-                    FOREIGN KEY (part_id) REFERENCES parts(id),
-                    UNIQUE (part_number, part_id)
-                )
-            ''')
-            # Copy data
-            cursor.execute('''
-                INSERT INTO alt_parts_temp (alt_id, part_id, manufacturer, part_number)
-                SELECT alt_id, part_id, manufacturer, part_number
-                FROM alt_parts
-            ''')
-            cursor.execute('DROP TABLE alt_parts')
-            cursor.execute('ALTER TABLE alt_parts_temp RENAME TO alt_parts')
-
-        # Migrate services to remove service_type_id and use junction
-        cursor.execute("PRAGMA table_info(services)")
-        columns = [col[1] for col in cursor.fetchall()]
-        if 'service_type_id' in columns:
-            # Create junction table
-            cursor.execute('''
-                CREATE TABLE service_service_types (
-                    service_id INTEGER,
-                    service_type_id INTEGER,
-                    PRIMARY KEY (service_id, service_type_id),
-                    FOREIGN KEY (service_id) REFERENCES services(id),
-                    FOREIGN KEY (service_type_id) REFERENCES service_types(id)
-                )
-            ''')
-            # Insert existing data
-            cursor.execute('''
-                INSERT INTO service_service_types (service_id, service_type_id)
-                SELECT id, service_type_id FROM services WHERE service_type_id IS NOT NULL
-            ''')
-            # Create temp services without service_type_id
-            cursor.execute('''
-                CREATE TABLE services_temp (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    vehicle_id INTEGER NOT NULL,
-                    date TEXT NOT NULL,
-                    odometer INTEGER,
-                    description TEXT,
-                    cost INTEGER DEFAULT 0,
-                    service_interval_miles INTEGER,
-                    service_interval_days INTEGER,
-                    FOREIGN KEY (vehicle_id) REFERENCES vehicles(id)
-                )
-            ''')
-            # Copy data
-            cursor.execute('''
-                INSERT INTO services_temp (id, vehicle_id, date, odometer, description, cost, service_interval_miles, service_interval_days)
-                SELECT id, vehicle_id, date, odometer, description, COALESCE(cost, 0), service_interval_miles, service_interval_days
-                FROM services
-            ''')
-            cursor.execute('DROP TABLE services')
-            cursor.execute('ALTER TABLE services_temp RENAME TO services')
-
-        self.conn.commit()
-
-    def create_tables(self):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS parts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                manufacturer TEXT,
-                part_number TEXT NOT NULL,
-                description TEXT,
-                price INTEGER DEFAULT 0,
-                vehicle_id INTEGER NOT NULL,
-                FOREIGN KEY (vehicle_id) REFERENCES vehicles(id),
-                UNIQUE (part_number, vehicle_id)
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS alt_parts (
-                alt_id TEXT PRIMARY KEY,
-                part_id INTEGER NOT NULL,
-                manufacturer TEXT,
-                part_number TEXT NOT NULL,
-                FOREIGN KEY (part_id) REFERENCES parts(id),
-                UNIQUE (part_number, part_id)
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS vehicles (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                year INTEGER,
-                model TEXT
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS service_types (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS services (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                vehicle_id INTEGER NOT NULL,
-                date TEXT NOT NULL,
-                odometer INTEGER,
-                description TEXT,
-                cost INTEGER DEFAULT 0,
-                service_interval_miles INTEGER,
-                service_interval_days INTEGER,
-                FOREIGN KEY (vehicle_id) REFERENCES vehicles(id)
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS service_service_types (
-                service_id INTEGER,
-                service_type_id INTEGER,
-                PRIMARY KEY (service_id, service_type_id),
-                FOREIGN KEY (service_id) REFERENCES services(id),
-                FOREIGN KEY (service_type_id) REFERENCES service_types(id)
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS service_parts (
-                service_id INTEGER,
-                part_id INTEGER,
-                alt_part_id TEXT,
-                quantity_used INTEGER,
-                PRIMARY KEY (service_id, part_id, alt_part_id),
-                FOREIGN KEY (service_id) REFERENCES services(id),
-                FOREIGN KEY (part_id) REFERENCES parts(id),
-                FOREIGN KEY (alt_part_id) REFERENCES alt_parts(alt_id)
-            )
-        ''')
-        self.conn.commit()
+    def set_busy(self, busy):
+        # Only show the indicator for work that takes noticeably long
+        self._busy = busy
+        if busy:
+            self.root.after(200, self._show_busy)
+        else:
+            self._progress = self._progress_report = self._progress_job = None
+            if self._busy_shown:
+                self._busy_shown = False
+                self.busy_bar.stop()
+                self.busy_bar.configure(mode='indeterminate', value=0)
+                self.busy_bar.pack_forget()
+                self.cancel_button.pack_forget()
+                self.progress_label.configure(text='')
+                self.progress_label.pack_forget()
+                self.root.configure(cursor='')
+
+    def _show_busy(self):
+        if self._busy and not self._busy_shown:
+            self._busy_shown = True
+            self.busy_bar.pack(side='right', padx=5, pady=2)
+            self.progress_label.pack(side='right', padx=5, pady=2)
+            self.busy_bar.start(10)
+            self.root.configure(cursor='watch')
+            self._update_progress()
+
+    def _update_progress(self):
+        # Long jobs report (label, done, total) through progress_reporter(); show it as a percentage
+        if not self._busy_shown:
+            return
+        # Only a job with a progress reporter can be cancelled
+        cancellable = self._progress_job is not None and not self._progress_job.done()
+        if cancellable and not self.cancel_button.winfo_ismapped():
+            self.cancel_button.pack(side='right', padx=5, pady=2, before=self.busy_bar)
+        elif not cancellable and self.cancel_button.winfo_ismapped():
+            self.cancel_button.pack_forget()
+        progress = self._progress
+        if progress and progress[2]:
+            label, done, total = progress
+            if str(self.busy_bar.cget('mode')) != 'determinate':
+                self.busy_bar.stop()
+                self.busy_bar.configure(mode='determinate', maximum=100)
+            self.busy_bar.configure(value=done * 100 / total)
+            self.progress_label.configure(text=f'{label} {done * 100 // total}%')
+        self.root.after(100, self._update_progress)
+
+    def progress_reporter(self, label):
+        # report(done, total) is called on a worker thread; it raises to abort the job once Cancel is pressed
+        self._progress_cancel.clear()
+        progress = self._progress = [label, 0, 0]
+
+        def report(done, total):
+            if self._progress_cancel.is_set():
+                raise db.OperationCancelled(f'{label} cancelled')
+            progress[1:] = done, total
+        self._progress_report = report
+        self._progress_job = None
+        return report
+
+    def cancel_db_work(self):
+        # Stops the export/import/backup that reports progress; other queued work, saves included, carries on
+        if self._progress_job is not None:
+            self._progress_cancel.set()
+            self.db_executor.cancel(self._progress_job)
+
+    def show_stats(self):
+        if self.stats_window is not None and self.stats_window.winfo_exists():
+            self.stats_window.lift()
+        else:
+            self.stats_window = StatsWindow(self.root, db.instrumentation)
 
     def sort_column(self, tree, col, tab_name):
         current_col = self.sort_column_state[tab_name]['column']
         current_reverse = self.sort_column_state[tab_name]['reverse']
         reverse = not current_reverse if col == current_col else False
 
-        items = []
-        for item in tree.get_children(''):
-            value = tree.set(item, col)
-            full_values = tree.item(item, 'values')
-            tags = tree.item(item, 'tags')
-            children = [(tree.set(child, col), tree.item(child, 'values'), tree.item(child, 'tags'), child)
-                        for child in tree.get_children(item)]
-            items.append((value, full_values, tags, item, children))
-
-        if tab_name == 'parts':
-            if col == 'ID' or col == 'Price':
-                key_func = lambda x: int(x[0]) if x[0] else 0
-            else:
-                key_func = lambda x: x[0].lower() if x[0] else ''
-        elif tab_name == 'vehicles':
-            if col == 'ID' or col == 'Year':
-                key_func = lambda x: int(x[0]) if x[0] else 0
-            else:
-                key_func = lambda x: x[0].lower() if x[0] else ''
-        elif tab_name == 'services':
-            if col == 'ID':
-                key_func = lambda x: int(x[0]) if x[0] else 0
-            elif col == 'Date':
-                def date_key(val):
-                    try:
-                        return datetime.strptime(val, '%d/%m/%Y') if val else datetime.min
-                    except ValueError:
-                        return datetime.min
-                key_func = lambda x: date_key(x[0])
-            elif col == 'Next Service':
-                def next_service_key(val):
-                    if 'Date: ' in val:
-                        try:
-                            date_part = val.split('Date: ')[1].split(' or ')[0]
-                            return datetime.strptime(date_part, '%d/%m/%Y') if date_part else datetime.min
-                        except (ValueError, IndexError):
-                            return datetime.min
-                    return datetime.min
-                key_func = lambda x: next_service_key(x[0])
-            elif col in ('Odometer', 'Cost', 'Interval Miles', 'Interval Days'):
-                key_func = lambda x: int(x[0]) if x[0] else 0
-            else:
-                key_func = lambda x: x[0].lower() if x[0] else ''
-        elif tab_name == 'service_parts':
-            if col in ('Part ID', 'Quantity Used'):
-                key_func = lambda x: (x[0] if x[0] else '0')  # Handle alt_id (text)
-            else:
-                key_func = lambda x: x[0].lower() if x[0] else ''
-        elif tab_name == 'service_types':
-            if col == 'ID':
-                key_func = lambda x: int(x[0]) if x[0] else 0
-            else:
-                key_func = lambda x: x[0].lower() if x[0] else ''
-
-        items.sort(key=lambda x: key_func(x[0]), reverse=reverse)
-
-        for item in tree.get_children(''):
-            tree.delete(item)
-        for _, values, tags, item_id, children in items:
-            new_item = tree.insert('', 'end', iid=item_id, values=values, tags=tags)
-            for _, child_values, child_tags, _ in children:
-                tree.insert(new_item, 'end', values=child_values, tags=child_tags)
+        pager = self.pagers.get(tab_name)
+        if pager is not None and pager.active():
+            # Paged listings are ordered by the database, a page at a time
+            if col not in pager.sort_keys:
+                messagebox.showinfo('Sort', f"Paged listings can't be sorted by {col}. Turn off Paged to sort by it.")
+                return
+            pager.sort_by(col, reverse)
+        elif isinstance(tree, VirtualTreeview):
+            # Sorts the cached row model; the tree re-applies it after every reload
+            tree.sort_by(col, reverse)
+        else:
+            items = [(tree.set(item, col), item) for item in tree.get_children('')]
+            items.sort(key=lambda x: db.sort_key(typed_cell(x[0])), reverse=reverse)
+            for index, (_, item) in enumerate(items):
+                tree.move(item, '', index)
 
         self.sort_column_state[tab_name]['column'] = col
         self.sort_column_state[tab_name]['reverse'] = reverse
@@ -360,11 +989,15 @@ class CarManagementApp:
 
         ttk.Button(search_frame, text='Show All', command=self.show_all_parts, bootstyle=INFO).pack(side='right', padx=5)
         ttk.Button(search_frame, text='Export to CSV', command=self.export_parts, bootstyle=INFO).pack(side='right', padx=5)
+        import_menu = Menu(search_frame, tearoff=0)
+        import_menu.add_command(label='Parts...', command=lambda: self.import_csv('parts'))
+        import_menu.add_command(label='Alternative Parts...', command=lambda: self.import_csv('alt_parts'))
+        ttk.Menubutton(search_frame, text='Import CSV', menu=import_menu, bootstyle=INFO).pack(side='right', padx=5)
 
         tree_frame = ttk.LabelFrame(self.parts_container, text='Parts Inventory', bootstyle=INFO, padding=10)
         tree_frame.pack(side='left', fill='both', expand=True, padx=5)
 
-        self.parts_tree = ttk.Treeview(tree_frame, columns=('ID', 'Name', 'Manufacturer', 'Part Number', 'Description', 'Price', 'Vehicle'), show='headings', bootstyle='primary')
+        self.parts_tree = VirtualTreeview(tree_frame, trace_name='parts', columns=('ID', 'Name', 'Manufacturer', 'Part Number', 'Description', 'Price', 'Vehicle'), show='headings', bootstyle='primary')
         self.parts_tree.heading('ID', text='ID', anchor='center')
         self.parts_tree.heading('Name', text='Name', anchor='center')
         self.parts_tree.heading('Manufacturer', text='Manufacturer', anchor='center')
@@ -390,6 +1023,12 @@ class CarManagementApp:
         self.parts_tree.configure(yscroll=scrollbar.set)
         scrollbar.pack(side='right', fill='y')
 
+        self.parts_pager = self.pagers['parts'] = Pager(
+            tree_frame, self, self.parts_tree, 'parts', 'parts', db.fetch_parts_page, db.PARTS_PAGE_KEYS,
+            lambda: self.vehicle_filter_id, lambda parts, vehicle_id: self.populate_parts_tree(parts))
+        ttk.Checkbutton(search_frame, text='Paged', variable=self.parts_pager.enabled, command=self.toggle_parts_paging,
+                        bootstyle='round-toggle').pack(side='right', padx=5)
+
         form_frame = ttk.LabelFrame(self.parts_container, text='Manage Part', bootstyle=INFO, padding=10)
         form_frame.pack(side='right', fill='y', padx=5, pady=5)
 
@@ -454,15 +1093,25 @@ class CarManagementApp:
         self.refresh_parts()
         self.parts_tree.bind('<<TreeviewSelect>>', self.select_part)
 
+    @traced_loader
     def filter_parts(self, event):
-        self.refresh_parts()
+        search_term = self.parts_search_entry.get().lower()
+        if not search_term and self.parts_pager.enabled.get():
+            return self.refresh_parts()
+        self.parts_pager.set_listing(False)
+        vehicle_id = self.vehicle_filter_id
+        self.read_db(db.fetch_parts, vehicle_id, search_term, key='parts', debounce=True, on_done=self.populate_parts_tree)
 
     def show_all_parts(self):
         self.vehicle_filter_id = None
         self.parts_search_entry.delete(0, END)
         self.refresh_parts()
 
+    @traced_loader
     def refresh_parts(self):
+        # Tabs that have not been visited yet load everything when they are built
+        if not self.tab_built(self.parts_tab):
+            return
         search_term = self.parts_search_entry.get().lower()
         if search_term:
             self.filter_parts_with_search(search_term)
@@ -470,58 +1119,52 @@ class CarManagementApp:
             self.load_parts_filtered()
 
     def load_parts_filtered(self):
-        for item in self.parts_tree.get_children():
-            self.parts_tree.delete(item)
-        cursor = self.conn.cursor()
-        query = '''
-            SELECT p.id, p.name, p.manufacturer, p.part_number, p.description, p.price,
-                   COALESCE(v.name || (CASE WHEN v.year IS NOT NULL AND v.model IS NOT NULL THEN ' (' || v.year || ' ' || v.model || ')' ELSE '' END), 'N/A')
-            FROM parts p
-            LEFT JOIN vehicles v ON p.vehicle_id = v.id
-        '''
-        params = []
-        if self.vehicle_filter_id is not None:
-            query += ' WHERE p.vehicle_id = ?'
-            params.append(self.vehicle_filter_id)
-        query += ' ORDER BY p.id ASC'
-        cursor.execute(query, params)
-        for row in cursor.fetchall():
-            values = tuple('' if x is None else x for x in row)
-            part_id = values[0]
-            main_item = self.parts_tree.insert('', 'end', iid=part_id, values=values)
-            cursor.execute('SELECT alt_id, manufacturer, part_number FROM alt_parts WHERE part_id = ? ORDER BY alt_id ASC', (part_id,))
-            for alt_row in cursor.fetchall():
-                self.parts_tree.insert(main_item, 'end', values=(alt_row[0], '', alt_row[1], alt_row[2], '', '', values[6]), tags=('alt_part',))
-            self.parts_tree.item(main_item, open=True)
+        if self.parts_pager.enabled.get():
+            self.parts_pager.load()
+            return
+        self.read_db(db.fetch_parts, self.vehicle_filter_id, key='parts', on_done=self.populate_parts_tree)
 
     def filter_parts_with_search(self, search_term):
-        for item in self.parts_tree.get_children():
-            self.parts_tree.delete(item)
-        cursor = self.conn.cursor()
-        query = '''
-            SELECT DISTINCT p.id, p.name, p.manufacturer, p.part_number, p.description, p.price,
-                   COALESCE(v.name || (CASE WHEN v.year IS NOT NULL AND v.model IS NOT NULL THEN ' (' || v.year || ' ' || v.model || ')' ELSE '' END), 'N/A')
-            FROM parts p
-            LEFT JOIN alt_parts ap ON p.id = ap.part_id
-            LEFT JOIN vehicles v ON p.vehicle_id = v.id
-            WHERE lower(p.name) LIKE ? OR lower(p.part_number) LIKE ?
-            OR lower(ap.manufacturer) LIKE ? OR lower(ap.part_number) LIKE ?
-            OR lower(v.name) LIKE ? OR lower(v.model) LIKE ?
-        '''
-        params = [f'%{search_term}%'] * 6
-        if self.vehicle_filter_id is not None:
-            query += ' AND p.vehicle_id = ?'
-            params.append(self.vehicle_filter_id)
-        query += ' ORDER BY p.id ASC'
-        cursor.execute(query, params)
-        for row in cursor.fetchall():
-            values = tuple('' if x is None else x for x in row)
-            part_id = values[0]
-            main_item = self.parts_tree.insert('', 'end', iid=part_id, values=values)
-            cursor.execute('SELECT alt_id, manufacturer, part_number FROM alt_parts WHERE part_id = ? ORDER BY alt_id ASC', (part_id,))
-            for alt_row in cursor.fetchall():
-                self.parts_tree.insert(main_item, 'end', values=(alt_row[0], '', alt_row[1], alt_row[2], '', '', values[6]), tags=('alt_part',))
-            self.parts_tree.item(main_item, open=True)
+        self.parts_pager.set_listing(False)
+        self.read_db(db.fetch_parts, self.vehicle_filter_id, search_term, key='parts', on_done=self.populate_parts_tree)
+
+    def populate_parts_tree(self, parts):
+        with db.timed('rows', 'parts'):
+            rows = self.part_rows(parts)
+        self.parts_tree.set_rows(rows)
+        self.record_startup('parts loaded')
+
+    def toggle_parts_paging(self):
+        # Either way the listing starts over in id order
+        self.parts_pager.reset()
+        self.sort_column_state['parts'] = {'column': None, 'reverse': False}
+        self.parts_tree.sort_by(None)
+        self.refresh_parts()
+
+    def part_rows(self, parts):
+        rows = []
+        for values, alt_parts in parts:
+            part_iid = str(values[0])
+            rows.append((part_iid, values, (), ''))
+            for alt_row in alt_parts:
+                rows.append((f'alt-{alt_row[0]}', (alt_row[0], '', alt_row[1], alt_row[2], '', '', values[6]), ('alt_part',), part_iid))
+        return rows
+
+    @traced_loader
+    def refresh_part_rows(self, part_ids):
+        if not self.tab_built(self.parts_tab):
+            return
+        if self.parts_pager.active():
+            return self.parts_pager.reload()
+        # Patch only the written parts into the view, under the current vehicle filter and search
+        part_ids = [int(id_) for id_ in part_ids]
+        search_term = self.parts_search_entry.get().lower()
+        self.read_db(db.fetch_parts, self.vehicle_filter_id, search_term or None, part_ids,
+                     on_done=lambda parts: self.patch_part_rows(part_ids, parts))
+
+    def patch_part_rows(self, part_ids, parts):
+        self.parts_tree.delete_rows(set(part_ids) - {values[0] for values, _ in parts})
+        self.parts_tree.put_rows(self.part_rows(parts))
 
     def add_part(self):
         name = self.part_name_entry.get()
@@ -547,16 +1190,12 @@ class CarManagementApp:
             except ValueError:
                 messagebox.showerror('Error', 'Price must be an integer if provided')
                 return
-        cursor = self.conn.cursor()
-        try:
-            cursor.execute('INSERT INTO parts (name, manufacturer, part_number, description, price, vehicle_id) VALUES (?, ?, ?, ?, ?, ?)',
-                           (name, manufacturer, part_number, description or None, price_value, vehicle_id))
-            self.conn.commit()
-            self.refresh_parts()
-            self.clear_part_entries()
-        except sqlite3.IntegrityError:
-            messagebox.showerror('Error', 'Part number already exists for this vehicle. Please use a unique part number.')
-            return
+        self.run_db(db.add_part, name, manufacturer, part_number, description, price_value, vehicle_id, on_done=self.part_saved)
+
+    def part_saved(self, part_id):
+        self.lookups.invalidate('parts', [part_id])
+        self.refresh_part_rows([part_id])
+        self.clear_part_entries()
 
     def _debounce(self):
         current_time = time.time()
@@ -598,23 +1237,8 @@ class CarManagementApp:
             self.part_price_entry.delete(0, ttk.END)
             self.part_price_entry.insert(0, values[5] if values[5] else '')
 
-            cursor = self.conn.cursor()
-            cursor.execute('SELECT vehicle_id FROM parts WHERE id = ?', (values[0],))
-            result = cursor.fetchone()
-            vehicle_id = result[0] if result else None
-
-            if vehicle_id:
-                vehicle_display = self.id_to_display_map.get(vehicle_id, '')
-                if not vehicle_display:
-                    cursor.execute('SELECT name, year, model FROM vehicles WHERE id = ?', (vehicle_id,))
-                    vehicle = cursor.fetchone()
-                    if vehicle:
-                        vehicle_display = f"{vehicle_id} - {vehicle[0]}{f' ({vehicle[1]} {vehicle[2]})' if vehicle[1] and vehicle[2] else ''}"
-                        self.id_to_display_map[vehicle_id] = vehicle_display
-                self.part_vehicle_combo.set(vehicle_display)
-            else:
-                self.part_vehicle_combo.set('')
-
+            part = self.lookups.part(values[0])
+            self.part_vehicle_combo.set(self.vehicle_label(part[3]) if part else '')
             self.load_alt_parts(selected)
 
         except Exception as e:
@@ -653,17 +1277,7 @@ class CarManagementApp:
             except ValueError:
                 messagebox.showerror('Error', 'Price must be an integer if provided')
                 return
-        cursor = self.conn.cursor()
-        # Check if the new part_number is unique for this vehicle (excluding the current part)
-        cursor.execute('SELECT id FROM parts WHERE part_number = ? AND vehicle_id = ? AND id != ?', (part_number, vehicle_id, id_))
-        if cursor.fetchone():
-            messagebox.showerror('Error', 'Part number already exists for this vehicle. Please use a unique part number.')
-            return
-        cursor.execute('UPDATE parts SET name=?, manufacturer=?, part_number=?, description=?, price=?, vehicle_id=? WHERE id=?',
-                       (name, manufacturer, part_number, description or None, price_value, vehicle_id, id_))
-        self.conn.commit()
-        self.refresh_parts()
-        self.clear_part_entries()
+        self.run_db(db.update_part, id_, name, manufacturer, part_number, description, price_value, vehicle_id, on_done=self.part_saved)
 
     def delete_part(self):
         selected = self.parts_tree.focus()
@@ -671,12 +1285,11 @@ class CarManagementApp:
             messagebox.showerror('Error', 'Select a main part to delete')
             return
         id_ = self.parts_tree.item(selected, 'values')[0]
-        cursor = self.conn.cursor()
-        cursor.execute('DELETE FROM parts WHERE id=?', (id_,))
-        cursor.execute('DELETE FROM service_parts WHERE part_id=?', (id_,))
-        cursor.execute('DELETE FROM alt_parts WHERE part_id=?', (id_,))
-        self.conn.commit()
-        self.refresh_parts()
+        self.run_db(db.delete_part, id_, on_done=self.part_deleted)
+
+    def part_deleted(self, part_id):
+        self.lookups.invalidate('parts', [part_id])
+        self.parts_tree.delete_rows([part_id])
         self.clear_part_entries()
 
     def clear_part_entries(self):
@@ -691,12 +1304,14 @@ class CarManagementApp:
         for item in self.alt_parts_tree.get_children():
             self.alt_parts_tree.delete(item)
 
+    @traced_loader
     def load_alt_parts(self, part_id):
+        self.read_db(db.fetch_alt_parts, part_id, key='alt_parts', on_done=self.populate_alt_parts_tree)
+
+    def populate_alt_parts_tree(self, alt_parts):
         for item in self.alt_parts_tree.get_children():
             self.alt_parts_tree.delete(item)
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT alt_id, manufacturer, part_number FROM alt_parts WHERE part_id = ? ORDER BY alt_id ASC', (part_id,))
-        for row in cursor.fetchall():
+        for row in alt_parts:
             self.alt_parts_tree.insert('', 'end', values=row)
 
     def add_alt_part(self):
@@ -710,32 +1325,13 @@ class CarManagementApp:
         if not manufacturer or not part_number:
             messagebox.showerror('Error', 'Manufacturer and Part Number are required for alternative parts')
             return
-        cursor = self.conn.cursor()
-        # Get vehicle_id for the part
-        cursor.execute('SELECT vehicle_id FROM parts WHERE id = ?', (part_id,))
-        vehicle_id = cursor.fetchone()[0]
-        # Check if part_number is unique for this vehicle in parts and alt_parts
-        cursor.execute('SELECT id FROM parts WHERE part_number = ? AND vehicle_id = ?', (part_number, vehicle_id))
-        if cursor.fetchone():
-            messagebox.showerror('Error', 'Part number already exists for this vehicle in main parts.')
-            return
-        cursor.execute('SELECT alt_id FROM alt_parts WHERE part_number = ? AND part_id IN (SELECT id FROM parts WHERE vehicle_id = ?)', (part_number, vehicle_id))
-        if cursor.fetchone():
-            messagebox.showerror('Error', 'Part number already exists for this vehicle in alternative parts.')
+        self.run_db(db.add_alt_part, part_id, manufacturer, part_number, on_done=lambda alt_id: self.alt_parts_changed(part_id))
+
+    def alt_parts_changed(self, part_id):
+        if not part_id:
             return
-        # Find the next available alt_id (e.g., 1a, 1b, etc.)
-        cursor.execute('SELECT alt_id FROM alt_parts WHERE part_id = ? ORDER BY alt_id ASC', (part_id,))
-        existing_ids = [row[0] for row in cursor.fetchall()]
-        used_letters = [alt_id[len(str(part_id)):] for alt_id in existing_ids if alt_id.startswith(str(part_id))]
-        next_letter = 'a'
-        while next_letter in used_letters:
-            next_letter = chr(ord(next_letter) + 1)
-        alt_id = f"{part_id}{next_letter}"
-        cursor.execute('INSERT INTO alt_parts (alt_id, part_id, manufacturer, part_number) VALUES (?, ?, ?, ?)',
-                       (alt_id, part_id, manufacturer, part_number))
-        self.conn.commit()
         self.load_alt_parts(part_id)
-        self.refresh_parts()
+        self.refresh_part_rows([part_id])
         self.alt_manufacturer_entry.delete(0, ttk.END)
         self.alt_part_number_entry.delete(0, ttk.END)
 
@@ -746,40 +1342,50 @@ class CarManagementApp:
             return
         values = self.alt_parts_tree.item(selected, 'values')
         alt_id = values[0]
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM service_parts WHERE alt_part_id = ?', (alt_id,))
-        if cursor.fetchone()[0] > 0:
-            messagebox.showerror('Error', 'Cannot delete alternative part used in services')
-            return
-        cursor.execute('DELETE FROM alt_parts WHERE alt_id = ?', (alt_id,))
-        self.conn.commit()
-        part_id = self.parts_tree.focus()
-        if part_id:
-            self.load_alt_parts(part_id)
-            self.refresh_parts()
+        self.run_db(db.remove_alt_part, alt_id, on_done=self.alt_parts_changed)
 
     def export_parts(self):
         file_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv")])
         if not file_path:
             return
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT p.id, p.name, p.manufacturer, p.part_number, p.description, p.price,
-                   COALESCE(v.name || (CASE WHEN v.year IS NOT NULL AND v.model IS NOT NULL THEN ' (' || v.year || ' ' || v.model || ')' ELSE '' END), 'N/A')
-            FROM parts p
-            LEFT JOIN vehicles v ON p.vehicle_id = v.id
-        ''')
-        parts = cursor.fetchall()
-        with open(file_path, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(['ID', 'Name', 'Manufacturer', 'Part Number', 'Description', 'Price', 'Vehicle'])
-            for row in parts:
-                writer.writerow(row)
-        messagebox.showinfo('Export Successful', 'Parts exported to CSV successfully')
-
-    def backup_database(self):
+        self.read_db(db.export_parts_csv, file_path, self.progress_reporter('Exporting'),
+                     on_done=lambda count: messagebox.showinfo('Export Successful', f'{count} parts exported to CSV successfully'))
+
+    def import_csv(self, kind):
+        """Bulk-import a user-selected CSV of `kind` (a key of db.IMPORTERS)."""
+        file_path = filedialog.askopenfilename(
+            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
+            title="Select CSV to Import"
+        )
+        if not file_path:
+            return
+        # Rows that fail validation are listed next to the input instead of stopping the import
+        rejects_path = os.path.splitext(file_path)[0] + '.rejects.csv'
+        self.run_db(
+            db.import_csv, kind, file_path, rejects_path, self.progress_reporter('Importing'),
+            on_done=lambda result: self.csv_imported(kind, rejects_path, *result),
+            on_error=lambda e: messagebox.showerror('Import Failed', f'Error during import: {str(e)}')
+        )
+
+    def csv_imported(self, kind, rejects_path, imported, rejected):
+        if kind in ('parts', 'vehicles', 'service_types'):
+            self.lookups.invalidate(kind)
+        if kind in ('parts', 'alt_parts'):
+            self.refresh_parts()
+            self.reset_part_picker()
+        elif kind == 'vehicles':
+            self.load_vehicles()
+        elif kind == 'service_types':
+            self.load_service_types()
+        else:
+            self.load_services()
+        message = f'{imported} rows imported'
+        if rejected:
+            message += f'\n{rejected} rows rejected, see {rejects_path}'
+        messagebox.showinfo('Import Complete', message)
+
+    def backup_database(self, compact=False):
         """Backup the entire database to a user-selected file."""
-        db_path = os.path.join(os.environ.get('XDG_DATA_HOME', os.path.expanduser('~/.local/share')), 'pitstop', 'pitstop.db')
         file_path = filedialog.asksaveasfilename(
             defaultextension=".db",
             filetypes=[("SQLite Database", "*.db"), ("All files", "*.*")],
@@ -787,42 +1393,62 @@ class CarManagementApp:
         )
         if not file_path:
             return
-        try:
-            shutil.copy2(db_path, file_path)
-            messagebox.showinfo('Backup Successful', f'Database backed up to {file_path}')
-        except Exception as e:
-            messagebox.showerror('Backup Failed', f'Error during backup: {str(e)}')
+        # Copied from a read snapshot in page steps, so edits carry on while it runs
+        self.read_db(
+            db.backup_database, file_path, compact, 1024, self.progress_reporter('Backing up'),
+            on_done=lambda _: messagebox.showinfo('Backup Successful', f'Database backed up to {file_path}'),
+            on_error=lambda e: messagebox.showerror('Backup Failed', f'Error during backup: {str(e)}')
+        )
 
     def restore_database(self):
         """Restore the database from a user-selected backup file."""
-        db_path = os.path.join(os.environ.get('XDG_DATA_HOME', os.path.expanduser('~/.local/share')), 'pitstop', 'pitstop.db')
         file_path = filedialog.askopenfilename(
             filetypes=[("SQLite Database", "*.db"), ("All files", "*.*")],
             title="Select Database Backup to Restore"
         )
         if not file_path:
             return
-        try:
-            # Close the current connection
-            self.conn.close()
-            # Replace the current database with the backup
-            shutil.copy2(file_path, db_path)
-            # Reconnect to the database
-            self.conn = sqlite3.connect(db_path)
-            self.create_tables()  # Ensure table structure is intact
-            self.refresh_parts()
-            self.load_vehicles()
-            self.load_service_types()
-            self.load_services()
-            self.load_vehicle_combo()
-            self.load_service_types_checkboxes()
-            self.load_part_combo()
-            messagebox.showinfo('Restore Successful', f'Database restored from {file_path}')
-        except Exception as e:
-            messagebox.showerror('Restore Failed', f'Error during restore: {str(e)}')
-            # Reconnect to original database if restore fails
-            self.conn = sqlite3.connect(db_path)
-            self.create_tables()
+        # Copied into the live database on the worker, then brought up to the current schema
+        self.run_db(
+            db.restore_database, file_path,
+            on_done=lambda _: self.database_restored(file_path),
+            on_error=lambda e: messagebox.showerror('Restore Failed', f'Error during restore: {str(e)}')
+        )
+
+    def snapshot_database(self):
+        """Add an incremental snapshot to a user-selected backup directory."""
+        backup_dir = filedialog.askdirectory(title="Select Snapshot Directory")
+        if not backup_dir:
+            return
+        # Only blocks that changed since an earlier snapshot in backup_dir are written
+        self.read_db(
+            db.snapshot_backup, backup_dir, self.progress_reporter('Snapshot'),
+            on_done=lambda manifest_path: messagebox.showinfo('Backup Successful', f'Snapshot saved to {manifest_path}'),
+            on_error=lambda e: messagebox.showerror('Backup Failed', f'Error during backup: {str(e)}')
+        )
+
+    def restore_snapshot(self):
+        """Restore the database from a user-selected snapshot manifest."""
+        manifest_path = filedialog.askopenfilename(
+            filetypes=[("Snapshot Manifest", "*.json"), ("All files", "*.*")],
+            title="Select Snapshot to Restore"
+        )
+        if not manifest_path:
+            return
+        self.run_db(
+            db.restore_snapshot, manifest_path, self.progress_reporter('Restoring'),
+            on_done=lambda _: self.database_restored(manifest_path),
+            on_error=lambda e: messagebox.showerror('Restore Failed', f'Error during restore: {str(e)}')
+        )
+
+    def database_restored(self, file_path):
+        self.lookups.clear()
+        self.refresh_parts()
+        self.load_vehicles()
+        self.load_service_types()
+        self.load_services()
+        self.reset_part_picker()
+        messagebox.showinfo('Restore Successful', f'Database restored from {file_path}')
 
     def setup_vehicles_tab(self):
         self.vehicles_container = ttk.Frame(self.vehicles_tab, padding=10)
@@ -831,7 +1457,7 @@ class CarManagementApp:
         tree_frame = ttk.LabelFrame(self.vehicles_container, text='Vehicles', bootstyle=INFO, padding=10)
         tree_frame.pack(side='left', fill='both', expand=True, padx=5)
 
-        self.vehicles_tree = ttk.Treeview(tree_frame, columns=('ID', 'Name', 'Year', 'Model'), show='headings', bootstyle='primary')
+        self.vehicles_tree = VirtualTreeview(tree_frame, trace_name='vehicles', columns=('ID', 'Name', 'Year', 'Model'), show='headings', bootstyle='primary')
         self.vehicles_tree.heading('ID', text='ID', anchor='center')
         self.vehicles_tree.heading('Name', text='Vehicle Name', anchor='center')
         self.vehicles_tree.heading('Year', text='Year', anchor='center')
@@ -870,6 +1496,7 @@ class CarManagementApp:
         ttk.Button(button_frame, text='Add Vehicle', command=self.add_vehicle, bootstyle=SUCCESS).pack(side='left', fill='x', expand=True, padx=2)
         ttk.Button(button_frame, text='Update Vehicle', command=self.update_vehicle, bootstyle=WARNING).pack(side='left', fill='x', expand=True, padx=2)
         ttk.Button(button_frame, text='Delete Vehicle', command=self.delete_vehicle, bootstyle=DANGER).pack(side='left', fill='x', expand=True, padx=2)
+        ttk.Button(form_frame, text='Import CSV', command=lambda: self.import_csv('vehicles'), bootstyle=INFO).pack(fill='x', pady=2)
 
         self.load_vehicles()
         self.vehicles_tree.bind('<<TreeviewSelect>>', self.select_vehicle)
@@ -884,16 +1511,25 @@ class CarManagementApp:
             self.notebook.select(self.parts_tab)
             self.refresh_parts()
 
+    @traced_loader
     def load_vehicles(self):
-        for item in self.vehicles_tree.get_children():
-            self.vehicles_tree.delete(item)
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM vehicles ORDER BY id ASC')
-        for row in cursor.fetchall():
-            values = tuple('' if x is None else x for x in row)
-            self.vehicles_tree.insert('', 'end', values=values)
+        if self.tab_built(self.vehicles_tab):
+            self.read_db(db.fetch_vehicles, key='vehicles', on_done=lambda rows: self.vehicles_tree.set_rows(self.table_rows(rows)))
         self.load_vehicle_combo()
 
+    def table_rows(self, rows):
+        return [(str(row[0]), tuple('' if x is None else x for x in row), (), '') for row in rows]
+
+    @traced_loader
+    def refresh_table_rows(self, tree, fetch, ids):
+        # Patch single vehicle/service type rows into their tree after a write
+        ids = [int(id_) for id_ in ids]
+        self.read_db(fetch, ids, on_done=lambda rows: self.patch_table_rows(tree, ids, rows))
+
+    def patch_table_rows(self, tree, ids, rows):
+        tree.delete_rows(set(ids) - {row[0] for row in rows})
+        tree.put_rows(self.table_rows(rows))
+
     def add_vehicle(self):
         name = self.vehicle_name_entry.get()
         year = self.vehicle_year_entry.get()
@@ -911,11 +1547,12 @@ class CarManagementApp:
             except ValueError:
                 messagebox.showerror('Error', 'Year must be an integer if provided')
                 return
-        cursor = self.conn.cursor()
-        cursor.execute('INSERT INTO vehicles (name, year, model) VALUES (?, ?, ?)',
-                       (name, year_value, model or None))
-        self.conn.commit()
-        self.load_vehicles()
+        self.run_db(db.add_vehicle, name, year_value, model, on_done=self.vehicle_saved)
+
+    def vehicle_saved(self, vehicle_id):
+        self.lookups.invalidate('vehicles', [vehicle_id])
+        self.refresh_table_rows(self.vehicles_tree, db.fetch_vehicles, [vehicle_id])
+        self.load_vehicle_combo()
         self.clear_vehicle_entries()
 
     def select_vehicle(self, event):
@@ -952,12 +1589,13 @@ class CarManagementApp:
             except ValueError:
                 messagebox.showerror('Error', 'Year must be an integer if provided')
                 return
-        cursor = self.conn.cursor()
-        cursor.execute('UPDATE vehicles SET name=?, year=?, model=? WHERE id=?',
-                       (name, year_value, model or None, id_))
-        self.conn.commit()
-        self.load_vehicles()
-        self.clear_vehicle_entries()
+        self.run_db(db.update_vehicle, id_, name, year_value, model, on_done=self.vehicle_updated)
+
+    def vehicle_updated(self, vehicle_id):
+        self.vehicle_saved(vehicle_id)
+        # The vehicle name is shown on its parts and services too
+        self.read_db(db.part_ids_for_vehicle, vehicle_id, on_done=self.refresh_part_rows)
+        self.read_db(db.service_ids_for_vehicle, vehicle_id, on_done=self.refresh_service_rows)
 
     def delete_vehicle(self):
         selected = self.vehicles_tree.focus()
@@ -965,18 +1603,12 @@ class CarManagementApp:
             messagebox.showerror('Error', 'Select a vehicle to delete')
             return
         id_ = self.vehicles_tree.item(selected, 'values')[0]
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM parts WHERE vehicle_id=?', (id_,))
-        if cursor.fetchone()[0] > 0:
-            messagebox.showerror('Error', 'Cannot delete vehicle with associated parts')
-            return
-        cursor.execute('SELECT COUNT(*) FROM services WHERE vehicle_id=?', (id_,))
-        if cursor.fetchone()[0] > 0:
-            messagebox.showerror('Error', 'Cannot delete vehicle with associated services')
-            return
-        cursor.execute('DELETE FROM vehicles WHERE id=?', (id_,))
-        self.conn.commit()
-        self.load_vehicles()
+        self.run_db(db.delete_vehicle, id_, on_done=self.vehicle_deleted)
+
+    def vehicle_deleted(self, vehicle_id):
+        self.lookups.invalidate('vehicles', [vehicle_id])
+        self.vehicles_tree.delete_rows([vehicle_id])
+        self.load_vehicle_combo()
         self.clear_vehicle_entries()
         if hasattr(self, 'service_vehicle_combo'):
             self.clear_service_entries()
@@ -994,7 +1626,7 @@ class CarManagementApp:
         tree_frame = ttk.LabelFrame(self.service_types_container, text='Service Types', bootstyle=INFO, padding=10)
         tree_frame.pack(side='left', fill='both', expand=True, padx=5)
 
-        self.service_types_tree = ttk.Treeview(tree_frame, columns=('ID', 'Name'), show='headings', bootstyle='primary')
+        self.service_types_tree = VirtualTreeview(tree_frame, trace_name='service_types', columns=('ID', 'Name'), show='headings', bootstyle='primary')
         self.service_types_tree.heading('ID', text='ID', anchor='center')
         self.service_types_tree.heading('Name', text='Service Type Name', anchor='center')
         self.service_types_tree.column('ID', width=60, anchor='center')
@@ -1021,18 +1653,16 @@ class CarManagementApp:
         ttk.Button(button_frame, text='Add Service Type', command=self.add_service_type, bootstyle=SUCCESS).pack(side='left', fill='x', expand=True, padx=2)
         ttk.Button(button_frame, text='Update Service Type', command=self.update_service_type, bootstyle=WARNING).pack(side='left', fill='x', expand=True, padx=2)
         ttk.Button(button_frame, text='Delete Service Type', command=self.delete_service_type, bootstyle=DANGER).pack(side='left', fill='x', expand=True, padx=2)
+        ttk.Button(form_frame, text='Import CSV', command=lambda: self.import_csv('service_types'), bootstyle=INFO).pack(fill='x', pady=2)
 
         self.load_service_types()
         self.service_types_tree.bind('<<TreeviewSelect>>', self.select_service_type)
 
+    @traced_loader
     def load_service_types(self):
-        for item in self.service_types_tree.get_children():
-            self.service_types_tree.delete(item)
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM service_types ORDER BY id ASC')
-        for row in cursor.fetchall():
-            values = tuple('' if x is None else x for x in row)
-            self.service_types_tree.insert('', 'end', values=values)
+        if self.tab_built(self.service_types_tab):
+            self.read_db(db.fetch_service_types, key='service_types',
+                         on_done=lambda rows: self.service_types_tree.set_rows(self.table_rows(rows)))
         self.load_service_types_checkboxes()
 
     def add_service_type(self):
@@ -1040,10 +1670,12 @@ class CarManagementApp:
         if not name:
             messagebox.showerror('Error', 'Service Type Name is required')
             return
-        cursor = self.conn.cursor()
-        cursor.execute('INSERT INTO service_types (name) VALUES (?)', (name,))
-        self.conn.commit()
-        self.load_service_types()
+        self.run_db(db.add_service_type, name, on_done=self.service_type_saved)
+
+    def service_type_saved(self, type_id):
+        self.lookups.invalidate('service_types', [type_id])
+        self.refresh_table_rows(self.service_types_tree, db.fetch_service_types, [type_id])
+        self.load_service_types_checkboxes()
         self.clear_service_type_entries()
 
     def select_service_type(self, event):
@@ -1063,11 +1695,12 @@ class CarManagementApp:
         if not name:
             messagebox.showerror('Error', 'Service Type Name is required')
             return
-        cursor = self.conn.cursor()
-        cursor.execute('UPDATE service_types SET name=? WHERE id=?', (name, id_))
-        self.conn.commit()
-        self.load_service_types()
-        self.clear_service_type_entries()
+        self.run_db(db.update_service_type, id_, name, on_done=self.service_type_updated)
+
+    def service_type_updated(self, type_id):
+        self.service_type_saved(type_id)
+        # Services list their type names
+        self.read_db(db.service_ids_for_type, type_id, on_done=self.refresh_service_rows)
 
     def delete_service_type(self):
         selected = self.service_types_tree.focus()
@@ -1075,14 +1708,12 @@ class CarManagementApp:
             messagebox.showerror('Error', 'Select a service type to delete')
             return
         id_ = self.service_types_tree.item(selected, 'values')[0]
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM service_service_types WHERE service_type_id=?', (id_,))
-        if cursor.fetchone()[0] > 0:
-            messagebox.showerror('Error', 'Cannot delete service type used in services')
-            return
-        cursor.execute('DELETE FROM service_types WHERE id=?', (id_,))
-        self.conn.commit()
-        self.load_service_types()
+        self.run_db(db.delete_service_type, id_, on_done=self.service_type_deleted)
+
+    def service_type_deleted(self, type_id):
+        self.lookups.invalidate('service_types', [type_id])
+        self.service_types_tree.delete_rows([type_id])
+        self.load_service_types_checkboxes()
         self.clear_service_type_entries()
 
     def clear_service_type_entries(self):
@@ -1090,7 +1721,7 @@ class CarManagementApp:
 
     def validate_date(self, date_str):
         try:
-            datetime.strptime(date_str, '%d/%m/%Y')
+            datetime.strptime(date_str, db.DISPLAY_DATE_FORMAT)
             return True
         except ValueError:
             return False
@@ -1108,15 +1739,27 @@ class CarManagementApp:
         self.services_search_entry.pack(side='left', fill='x', expand=True, padx=5)
         self.services_search_entry.bind('<KeyRelease>', self.filter_services)
 
-        ttk.Button(search_frame, text='Backup DB', command=self.backup_database, bootstyle=INFO).pack(side='right', padx=5)
-        ttk.Button(search_frame, text='Restore DB', command=self.restore_database, bootstyle=INFO).pack(side='right', padx=5)
-        ttk.Button(search_frame, text='Export to CSV', command=self.export_services, bootstyle=INFO).pack(side='right', padx=5)
+        backup_menu = Menu(search_frame, tearoff=0)
+        backup_menu.add_command(label='Full Copy...', command=self.backup_database)
+        backup_menu.add_command(label='Compacted Copy...', command=lambda: self.backup_database(compact=True))
+        backup_menu.add_command(label='Incremental Snapshot...', command=self.snapshot_database)
+        ttk.Menubutton(search_frame, text='Backup DB', menu=backup_menu, bootstyle=INFO).pack(side='right', padx=5)
+        restore_menu = Menu(search_frame, tearoff=0)
+        restore_menu.add_command(label='From File...', command=self.restore_database)
+        restore_menu.add_command(label='From Snapshot...', command=self.restore_snapshot)
+        ttk.Menubutton(search_frame, text='Restore DB', menu=restore_menu, bootstyle=INFO).pack(side='right', padx=5)
+        export_menu = Menu(search_frame, tearoff=0)
+        export_menu.add_command(label='CSV...', command=self.export_services)
+        export_menu.add_command(label='NumPy Arrays (.npz)...', command=lambda: self.export_analytics('npz'))
+        export_menu.add_command(label='Parquet...', command=lambda: self.export_analytics('parquet'))
+        ttk.Menubutton(search_frame, text='Export', menu=export_menu, bootstyle=INFO).pack(side='right', padx=5)
+        ttk.Button(search_frame, text='Import CSV', command=lambda: self.import_csv('services'), bootstyle=INFO).pack(side='right', padx=5)
 
         # Left frame for services tree
         tree_frame = ttk.LabelFrame(self.services_container, text='Service Records', bootstyle=INFO, padding=10)
         tree_frame.pack(side='left', fill='both', expand=True, padx=5)
 
-        self.services_tree = ttk.Treeview(tree_frame, columns=('ID', 'Vehicle', 'Types', 'Date', 'Odometer', 'Description', 'Cost', 'Interval Miles', 'Interval Days', 'Next Service'), show='headings', bootstyle='primary')
+        self.services_tree = VirtualTreeview(tree_frame, trace_name='services', columns=('ID', 'Vehicle', 'Types', 'Date', 'Odometer', 'Description', 'Cost', 'Interval Miles', 'Interval Days', 'Next Service'), show='headings', bootstyle='primary')
         self.services_tree.heading('ID', text='ID', anchor='center')
         self.services_tree.heading('Vehicle', text='Vehicle', anchor='center')
         self.services_tree.heading('Types', text='Service Types', anchor='center')
@@ -1146,6 +1789,12 @@ class CarManagementApp:
         self.services_tree.configure(yscroll=scrollbar.set)
         scrollbar.pack(side='right', fill='y')
 
+        self.services_pager = self.pagers['services'] = Pager(
+            tree_frame, self, self.services_tree, 'services', 'services', db.fetch_services_page, db.SERVICES_PAGE_KEYS,
+            self.selected_vehicle_id, self.populate_services_tree)
+        ttk.Checkbutton(search_frame, text='Paged', variable=self.services_pager.enabled, command=self.toggle_services_paging,
+                        bootstyle='round-toggle').pack(side='right', padx=5)
+
         # Right frame for form and parts used
         right_frame = ttk.Frame(self.services_container, padding=10)
         right_frame.pack(side='right', fill='y', padx=5)
@@ -1180,7 +1829,7 @@ class CarManagementApp:
         ttk.Label(form_frame, text='Date (DD/MM/YYYY):', font=('Helvetica', 12)).pack(anchor='w', pady=2)
         self.service_date_entry = ttk.Entry(form_frame, bootstyle=SECONDARY, font=('Helvetica', 12))
         self.service_date_entry.pack(fill='x', pady=2)
-        self.service_date_entry.insert(0, datetime.now().strftime('%d/%m/%Y'))
+        self.service_date_entry.insert(0, datetime.now().strftime(db.DISPLAY_DATE_FORMAT))
 
         ttk.Label(form_frame, text='Odometer:', font=('Helvetica', 12)).pack(anchor='w', pady=2)
         self.service_odometer_entry = ttk.Entry(form_frame, bootstyle=SECONDARY, font=('Helvetica', 12))
@@ -1233,9 +1882,12 @@ class CarManagementApp:
         add_part_frame.pack(fill='x', pady=5)
 
         ttk.Label(add_part_frame, text='Select Part:', font=('Helvetica', 9)).pack(side='left', padx=5)
-        self.part_combo = ttk.Combobox(add_part_frame, state='readonly', bootstyle=SECONDARY, font=('Helvetica', 9))
+        # Type-ahead: matches for the typed part number or name fill the list (Down opens it)
+        self.part_combo = ttk.Combobox(add_part_frame, bootstyle=SECONDARY, font=('Helvetica', 9))
         self.part_combo.pack(side='left', fill='x', expand=True, padx=5)
-        self.load_part_combo()
+        self.part_combo.bind('<KeyRelease>', self.filter_part_choices)
+        self.part_choices_vehicle_id = None
+        self.reset_part_picker()
 
         ttk.Label(add_part_frame, text='Qty:', font=('Helvetica', 9)).pack(side='left', padx=5)
         self.part_qty_used_entry = ttk.Entry(add_part_frame, width=5, bootstyle=SECONDARY, font=('Helvetica', 9))
@@ -1250,25 +1902,36 @@ class CarManagementApp:
         self.services_tree.bind('<<TreeviewSelect>>', self.select_service)
 
     def load_vehicle_combo(self):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT id, name, year, model FROM vehicles ORDER BY id ASC')
-        vehicles = [(f"{row[0]} - {row[1]}{f' ({row[2]} {row[3]})' if row[2] and row[3] else ''}", row[0]) for row in cursor.fetchall()]
+        self.populate_vehicle_combo(self.lookups.vehicles())
+
+    def populate_vehicle_combo(self, rows):
+        vehicles = [(self.vehicle_display(row), row[0]) for row in rows]
         self.vehicle_id_map = {v[0]: v[1] for v in vehicles}
-        self.id_to_display_map = {v[1]: v[0] for v in vehicles}
         if hasattr(self, 'service_vehicle_combo'):
             self.service_vehicle_combo['values'] = [v[0] for v in vehicles]
         if hasattr(self, 'part_vehicle_combo'):
             self.part_vehicle_combo['values'] = [v[0] for v in vehicles]
 
+    def vehicle_display(self, vehicle):
+        vehicle_id, name, year, model = vehicle
+        return f"{vehicle_id} - {name}{f' ({year} {model})' if year and model else ''}"
+
+    def vehicle_label(self, vehicle_id):
+        vehicle = self.lookups.vehicle(vehicle_id) if vehicle_id else None
+        return self.vehicle_display(vehicle) if vehicle else ''
+
     def load_service_types_checkboxes(self):
+        if not self.tab_built(self.services_tab):
+            return
+        self.populate_service_types_checkboxes(self.lookups.service_types())
+
+    def populate_service_types_checkboxes(self, rows):
         # Clear existing checkboxes
         for widget in self.service_types_frame.winfo_children():
             widget.destroy()
         self.service_type_vars = {}
         self.service_type_list_map = {}
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT id, name FROM service_types ORDER BY id ASC')
-        for row in cursor.fetchall():
+        for row in rows:
             service_type_id, name = row
             display = f"{service_type_id} - {name}"
             var = ttk.BooleanVar(value=False)
@@ -1284,206 +1947,122 @@ class CarManagementApp:
             )
             chk.pack(anchor='w', padx=10, pady=3, fill='x')
 
-    def load_part_combo(self, vehicle_id=None):
-        cursor = self.conn.cursor()
+    def reset_part_picker(self, vehicle_id=None):
+        # Start over with the first few parts of the service's vehicle; typing narrows it down
+        if not self.tab_built(self.services_tab):
+            return
+        self.part_choices_vehicle_id = vehicle_id
+        self.part_combo.set('')
+        self.read_db(db.search_part_choices, None, vehicle_id, key='part_choices', on_done=self.populate_part_choices)
+
+    @traced_loader
+    def filter_part_choices(self, event):
+        if event.keysym in ('Up', 'Down', 'Return', 'Escape', 'Tab'):
+            return
+        search_term = self.part_combo.get().strip()
+        if search_term in self.part_id_map:
+            return
+        vehicle_id = self.part_choices_vehicle_id
+        self.read_db(db.search_part_choices, search_term, vehicle_id, key='part_choices', debounce=True,
+                     on_done=self.populate_part_choices)
+
+    def populate_part_choices(self, choices):
         parts = []
-        query = 'SELECT id, name FROM parts'
-        params = []
-        if vehicle_id:
-            query += ' WHERE vehicle_id = ?'
-            params.append(vehicle_id)
-        query += ' ORDER BY id ASC'
-        cursor.execute(query, params)
-        for row in cursor.fetchall():
-            parts.append((f"{row[0]} - {row[1]}", row[0], None))
-        if vehicle_id:
-            query = '''
-                SELECT ap.alt_id, p.name, ap.manufacturer, ap.part_number
-                FROM alt_parts ap
-                JOIN parts p ON ap.part_id = p.id
-                WHERE p.vehicle_id = ?
-                ORDER BY ap.alt_id ASC
-            '''
-            cursor.execute(query, (vehicle_id,))
-            for row in cursor.fetchall():
-                parts.append((f"{row[0]} - {row[1]} (Alt: {row[2]} {row[3]})", row[0][:-1], row[0]))
-        parts.sort(key=lambda x: (int(x[1]), x[2] or ''))
+        for part_id, alt_id, name, part_number, alt_manufacturer, alt_part_number in choices:
+            if alt_id:
+                parts.append((f"{alt_id} - {name} (Alt: {alt_manufacturer} {alt_part_number})", part_id, alt_id))
+            else:
+                parts.append((f"{part_id} - {name} ({part_number})", part_id, None))
         self.part_combo['values'] = [p[0] for p in parts]
         self.part_id_map = {p[0]: (p[1], p[2]) for p in parts}
-        self.part_combo.set('')
 
-    def load_services(self):
-        for item in self.services_tree.get_children():
-            self.services_tree.delete(item)
-        cursor = self.conn.cursor()
+    def selected_vehicle_id(self):
+        if not self.tab_built(self.vehicles_tab):
+            return None
         selected_vehicle = self.vehicles_tree.focus()
-        vehicle_id = None
         if selected_vehicle:
-            vehicle_id = self.vehicles_tree.item(selected_vehicle, 'values')[0]
-        query_base = '''
-            SELECT s.id, COALESCE(v.name || (CASE WHEN v.model IS NOT NULL THEN ' (' || v.model || ')' ELSE '' END), v.name) AS vehicle_display, 
-                   GROUP_CONCAT(st.name, ', ') AS service_types, s.date, s.odometer, s.description, s.cost, s.service_interval_miles, s.service_interval_days
-            FROM services s
-            JOIN vehicles v ON s.vehicle_id = v.id
-            LEFT JOIN service_service_types sst ON s.id = sst.service_id
-            LEFT JOIN service_types st ON sst.service_type_id = st.id
-            {where_clause}
-            GROUP BY s.id
-            {having_clause}
-            ORDER BY s.id ASC
-        '''
-        where_clause = ''
-        having_clause = ''
-        params = []
-        if vehicle_id:
-            where_clause = 'WHERE s.vehicle_id = ?'
-            params = [vehicle_id]
-        query = query_base.format(where_clause=where_clause, having_clause=having_clause)
-        cursor.execute(query, params)
-        current_date = datetime.now()
-        for row in cursor.fetchall():
-            row = tuple('' if x is None else x for x in row)
-            service_id, vehicle_name, service_types, date, odometer, description, cost, interval_miles, interval_days = row
-            next_service = self.calculate_next_service(date, odometer, interval_miles, interval_days)
-            is_overdue = False
-            if interval_days or interval_miles:
-                cursor.execute('''
-                    SELECT date, odometer
-                    FROM services
-                    WHERE vehicle_id = (SELECT vehicle_id FROM services WHERE id = ?)
-                    AND id != ?
-                    ORDER BY date DESC LIMIT 1
-                ''', (service_id, service_id))
-                last_service = cursor.fetchone()
-                try:
-                    service_date = datetime.strptime(date, '%d/%m/%Y')
-                except ValueError:
-                    continue
-                if last_service:
-                    last_date, last_odometer = last_service
-                    try:
-                        last_date = datetime.strptime(last_date, '%d/%m/%Y')
-                    except ValueError:
-                        continue
-                    if interval_days and (current_date - last_date).days > interval_days:
-                        is_overdue = True
-                    if interval_miles and last_odometer and odometer and (int(odometer) - int(last_odometer)) > interval_miles:
-                        is_overdue = True
-                else:
-                    if interval_days and (current_date - service_date).days > interval_days:
-                        is_overdue = True
-            tag = 'overdue' if is_overdue else ''
-            self.services_tree.insert('', 'end', values=(service_id, vehicle_name, service_types, date, odometer, description, cost, interval_miles, interval_days, next_service), tags=(tag,))
+            return self.vehicles_tree.item(selected_vehicle, 'values')[0]
+        return None
+
+    @traced_loader
+    def load_services(self):
+        if not self.tab_built(self.services_tab):
+            return
+        if self.services_pager.enabled.get():
+            self.services_pager.load()
+            return
+        vehicle_id = self.selected_vehicle_id()
+        self.read_db(db.fetch_services, vehicle_id, key='services',
+                     on_done=lambda services: self.populate_services_tree(services, vehicle_id))
+
+    def populate_services_tree(self, services, vehicle_id=None, search_term=None):
+        # Remember what the view shows so writes can patch it under the same filter
+        self.services_query = (vehicle_id, search_term)
+        with db.timed('rows', 'services'):
+            rows = self.service_rows(services)
+        self.services_tree.set_rows(rows)
         self.services_tree.tag_configure('overdue', background='#ffcccc')
 
-    def calculate_next_service(self, date, odometer, interval_miles, interval_days):
+    def toggle_services_paging(self):
+        self.services_pager.reset()
+        self.sort_column_state['services'] = {'column': None, 'reverse': False}
+        self.services_tree.sort_by(None)
+        self.load_services()
+
+    def service_rows(self, services):
+        return [(str(row[0]), self.service_display_values(row, next_date, next_odometer), ('overdue',) if is_overdue else (), '',
+                 row + (next_date or '',))
+                for row, next_date, next_odometer, is_overdue in services]
+
+    @traced_loader
+    def refresh_service_rows(self, service_ids):
+        # Patch only the given services into the view; callers pass every service of an
+        # affected vehicle because overdue status depends on the vehicle's latest service
+        if not self.tab_built(self.services_tab):
+            return
+        if self.services_pager.active():
+            return self.services_pager.reload()
+        vehicle_id, search_term = self.services_query
+        service_ids = [int(id_) for id_ in service_ids]
+        self.read_db(db.fetch_services, vehicle_id, search_term, service_ids,
+                     on_done=lambda services: self.patch_service_rows(service_ids, services))
+
+    def patch_service_rows(self, service_ids, services):
+        self.services_tree.delete_rows(set(service_ids) - {row[0] for row, _, _, _ in services})
+        self.services_tree.put_rows(self.service_rows(services))
+
+    def service_display_values(self, row, next_date, next_odometer):
         next_service = []
-        if date:
-            try:
-                service_date = datetime.strptime(date, '%d/%m/%Y')
-                if interval_days:
-                    next_date = service_date + timedelta(days=interval_days)
-                    next_service.append(f"Date: {next_date.strftime('%d/%m/%Y')}")
-                if interval_miles and odometer:
-                    next_odometer = int(odometer) + interval_miles
-                    next_service.append(f"Miles: {next_odometer}")
-            except ValueError:
-                return ''
-        return ' or '.join(next_service) if next_service else ''
+        if next_date:
+            next_service.append(f"Date: {next_date.strftime(db.DISPLAY_DATE_FORMAT)}")
+        if next_odometer:
+            next_service.append(f"Miles: {next_odometer}")
+        return row[:3] + (db.to_display_date(row[3]),) + row[4:] + (' or '.join(next_service),)
 
+    @traced_loader
     def filter_services(self, event):
         search_term = self.services_search_entry.get().lower()
-        for item in self.services_tree.get_children():
-            self.services_tree.delete(item)
-        cursor = self.conn.cursor()
-        selected_vehicle = self.vehicles_tree.focus()
-        vehicle_id = None
-        if selected_vehicle:
-            vehicle_id = self.vehicles_tree.item(selected_vehicle, 'values')[0]
-        query_base = '''
-            SELECT s.id, COALESCE(v.name || (CASE WHEN v.model IS NOT NULL THEN ' (' || v.model || ')' ELSE '' END), v.name) AS vehicle_display, 
-                   GROUP_CONCAT(st.name, ', ') AS service_types, s.date, s.odometer, s.description, s.cost, s.service_interval_miles, s.service_interval_days
-            FROM services s
-            JOIN vehicles v ON s.vehicle_id = v.id
-            LEFT JOIN service_service_types sst ON s.id = sst.service_id
-            LEFT JOIN service_types st ON sst.service_type_id = st.id
-            {where_clause}
-            GROUP BY s.id
-            {having_clause}
-            ORDER BY s.id ASC
-        '''
-        where_clause = ''
-        having_clause = ''
-        params = []
-        if search_term:
-            where_clause = 'WHERE (lower(v.name) LIKE ? OR lower(v.model) LIKE ? OR lower(s.description) LIKE ?)'
-            params += [f'%{search_term}%', f'%{search_term}%', f'%{search_term}%']
-            having_clause = 'HAVING lower(service_types) LIKE ?'
-            params.append(f'%{search_term}%')
-        if vehicle_id:
-            if where_clause:
-                where_clause += ' AND s.vehicle_id = ?'
-            else:
-                where_clause = 'WHERE s.vehicle_id = ?'
-            params.append(vehicle_id)
-        query = query_base.format(where_clause=where_clause, having_clause=having_clause)
-        cursor.execute(query, params)
-        current_date = datetime.now()
-        for row in cursor.fetchall():
-            row = tuple('' if x is None else x for x in row)
-            service_id, vehicle_name, service_types, date, odometer, description, cost, interval_miles, interval_days = row
-            next_service = self.calculate_next_service(date, odometer, interval_miles, interval_days)
-            is_overdue = False
-            if interval_days or interval_miles:
-                cursor.execute('''
-                    SELECT date, odometer
-                    FROM services
-                    WHERE vehicle_id = (SELECT vehicle_id FROM services WHERE id = ?)
-                    AND id != ?
-                    ORDER BY date DESC LIMIT 1
-                ''', (service_id, service_id))
-                last_service = cursor.fetchone()
-                try:
-                    service_date = datetime.strptime(date, '%d/%m/%Y')
-                except ValueError:
-                    continue
-                if last_service:
-                    last_date, last_odometer = last_service
-                    try:
-                        last_date = datetime.strptime(last_date, '%d/%m/%Y')
-                    except ValueError:
-                        continue
-                    if interval_days and (current_date - last_date).days > interval_days:
-                        is_overdue = True
-                    if interval_miles and last_odometer and odometer and (int(odometer) - int(last_odometer)) > interval_miles:
-                        is_overdue = True
-                else:
-                    if interval_days and (current_date - service_date).days > interval_days:
-                        is_overdue = True
-            tag = 'overdue' if is_overdue else ''
-            self.services_tree.insert('', 'end', values=(service_id, vehicle_name, service_types, date, odometer, description, cost, interval_miles, interval_days, next_service), tags=(tag,))
-        self.services_tree.tag_configure('overdue', background='#ffcccc')
+        if not search_term and self.services_pager.enabled.get():
+            return self.load_services()
+        self.services_pager.set_listing(False)
+        vehicle_id = self.selected_vehicle_id()
+        self.read_db(db.fetch_services, vehicle_id, search_term, key='services', debounce=True,
+                     on_done=lambda services: self.populate_services_tree(services, vehicle_id, search_term))
 
     def export_services(self):
         file_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv")])
         if not file_path:
             return
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT s.id, COALESCE(v.name || (CASE WHEN v.model IS NOT NULL THEN ' (' || v.model || ')' ELSE '' END), v.name) AS vehicle_display, 
-                   GROUP_CONCAT(st.name, ', ') AS service_types, s.date, s.odometer, s.description, s.cost, s.service_interval_miles, s.service_interval_days
-            FROM services s
-            JOIN vehicles v ON s.vehicle_id = v.id
-            LEFT JOIN service_service_types sst ON s.id = sst.service_id
-            LEFT JOIN service_types st ON sst.service_type_id = st.id
-            GROUP BY s.id
-        ''')
-        with open(file_path, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(['ID', 'Vehicle', 'Types', 'Date', 'Odometer', 'Description', 'Cost', 'Interval Miles', 'Interval Days'])
-            for row in cursor.fetchall():
-                writer.writerow(row)
-        messagebox.showinfo('Export Successful', 'Services exported to CSV successfully')
+        self.read_db(db.export_services_csv, file_path, self.progress_reporter('Exporting'),
+                     on_done=lambda count: messagebox.showinfo('Export Successful', f'{count} services exported to CSV successfully'))
+
+    def export_analytics(self, file_format):
+        """Export the service history as typed columns (.npz or .parquet) into a user-selected directory."""
+        directory = filedialog.askdirectory(title="Select Export Directory")
+        if not directory:
+            return
+        self.read_db(db.export_analytics, directory, file_format, self.progress_reporter('Exporting'),
+                     on_done=lambda paths: messagebox.showinfo('Export Successful', 'Exported ' + ', '.join(os.path.basename(path) for path in paths)))
 
     def add_service(self):
         vehicle_selection = self.service_vehicle_combo.get()
@@ -1532,32 +2111,14 @@ class CarManagementApp:
             except ValueError:
                 messagebox.showerror('Error', 'Cost must be an integer if provided')
                 return
-        cursor = self.conn.cursor()
-        cursor.execute('INSERT INTO services (vehicle_id, date, odometer, description, cost, service_interval_miles, service_interval_days) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                       (vehicle_id, date, odometer_value, description or None, cost_value, interval_miles_value, interval_days_value))
-        service_id = cursor.lastrowid
-        for type_id in selected_types:
-            cursor.execute('INSERT INTO service_service_types (service_id, service_type_id) VALUES (?, ?)', (service_id, type_id))
-        self.conn.commit()
-        self.load_services()
-        self.clear_service_entries()
-        self.clear_service_parts_tree()
+        self.run_db(db.add_service, vehicle_id, db.from_display_date(date), odometer_value, description, cost_value,
+                    interval_miles_value, interval_days_value, selected_types, on_done=self.services_changed)
 
     def select_service(self, event):
         selected = self.services_tree.focus()
         if selected:
             values = self.services_tree.item(selected, 'values')
-            cursor = self.conn.cursor()
-            cursor.execute('SELECT vehicle_id FROM services WHERE id = ?', (values[0],))
-            vehicle_id = cursor.fetchone()[0]
-            cursor.execute('SELECT name, year, model FROM vehicles WHERE id = ?', (vehicle_id,))
-            vehicle = cursor.fetchone()
-            vehicle_display = f"{vehicle_id} - {vehicle[0]}{f' ({vehicle[1]} {vehicle[2]})' if vehicle[1] and vehicle[2] else ''}"
-            self.service_vehicle_combo.set(vehicle_display)
-            cursor.execute('SELECT service_type_id FROM service_service_types WHERE service_id = ?', (values[0],))
-            selected_ids = [row[0] for row in cursor.fetchall()]
-            for tid, var in self.service_type_vars.items():
-                var.set(tid in selected_ids)
+            self.read_db(db.service_links, values[0], key='service_links', on_done=self.show_service_links)
             self.service_date_entry.delete(0, ttk.END)
             self.service_date_entry.insert(0, values[3])
             self.service_odometer_entry.delete(0, ttk.END)
@@ -1571,26 +2132,24 @@ class CarManagementApp:
             self.service_cost_entry.delete(0, ttk.END)
             self.service_cost_entry.insert(0, values[6] if values[6] else '')
             self.load_service_parts(values[0])
-            self.load_part_combo(vehicle_id=vehicle_id)
         else:
-            self.load_part_combo()
+            self.reset_part_picker()
+
+    def show_service_links(self, links):
+        vehicle_id, selected_ids = links
+        self.service_vehicle_combo.set(self.vehicle_label(vehicle_id))
+        for tid, var in self.service_type_vars.items():
+            var.set(tid in selected_ids)
+        self.reset_part_picker(vehicle_id)
 
+    @traced_loader
     def load_service_parts(self, service_id):
+        self.read_db(db.fetch_service_parts, service_id, key='service_parts', on_done=self.populate_service_parts_tree)
+
+    def populate_service_parts_tree(self, service_parts):
         for item in self.service_parts_tree.get_children():
             self.service_parts_tree.delete(item)
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT COALESCE(sp.alt_part_id, sp.part_id) AS part_id, p.name, 
-                   COALESCE(ap.manufacturer, p.manufacturer) AS manufacturer, 
-                   COALESCE(ap.part_number, p.part_number) AS part_number, 
-                   sp.quantity_used
-            FROM service_parts sp
-            JOIN parts p ON sp.part_id = p.id
-            LEFT JOIN alt_parts ap ON sp.alt_part_id = ap.alt_id
-            WHERE sp.service_id = ?
-            ORDER BY sp.part_id ASC, sp.alt_part_id ASC
-        ''', (service_id,))
-        for row in cursor.fetchall():
+        for row in service_parts:
             values = tuple('' if x is None else x for x in row)
             self.service_parts_tree.insert('', 'end', values=values)
 
@@ -1604,7 +2163,10 @@ class CarManagementApp:
         if not part_selection:
             messagebox.showerror('Error', 'Select a part')
             return
-        part_id, alt_part_id = self.part_id_map.get(part_selection)
+        if part_selection not in self.part_id_map:
+            messagebox.showerror('Error', 'Select a part from the list')
+            return
+        part_id, alt_part_id = self.part_id_map[part_selection]
         qty_used = self.part_qty_used_entry.get()
         qty_used_value = 1  # Default to 1 if empty
         if qty_used:
@@ -1616,22 +2178,9 @@ class CarManagementApp:
             except ValueError:
                 messagebox.showerror('Error', 'Quantity must be a positive integer if provided')
                 return
-        cursor = self.conn.cursor()
-        # Check if the part (main or alternative) is already added to this service
-        if alt_part_id:
-            cursor.execute('SELECT COUNT(*) FROM service_parts WHERE service_id = ? AND alt_part_id = ?', (service_id, alt_part_id))
-        else:
-            cursor.execute('SELECT COUNT(*) FROM service_parts WHERE service_id = ? AND part_id = ? AND alt_part_id IS NULL', (service_id, part_id))
-        if cursor.fetchone()[0] > 0:
-            messagebox.showerror('Error', 'This part or alternative part is already added to the service')
-            return
-        try:
-            cursor.execute('INSERT INTO service_parts (service_id, part_id, alt_part_id, quantity_used) VALUES (?, ?, ?, ?)',
-                           (service_id, part_id, alt_part_id, qty_used_value))
-            self.conn.commit()
-        except sqlite3.IntegrityError:
-            messagebox.showerror('Error', 'An unexpected error occurred while adding the part to the service')
-            return
+        self.run_db(db.add_service_part, service_id, part_id, alt_part_id, qty_used_value, on_done=self.service_part_added)
+
+    def service_part_added(self, service_id):
         self.load_service_parts(service_id)
         self.part_qty_used_entry.delete(0, ttk.END)
 
@@ -1646,13 +2195,7 @@ class CarManagementApp:
             messagebox.showerror('Error', 'Select a part to remove')
             return
         part_id = self.service_parts_tree.item(selected_part, 'values')[0]
-        cursor = self.conn.cursor()
-        if part_id.isdigit():
-            cursor.execute('DELETE FROM service_parts WHERE service_id=? AND part_id=? AND alt_part_id IS NULL', (service_id, part_id))
-        else:
-            cursor.execute('DELETE FROM service_parts WHERE service_id=? AND alt_part_id=?', (service_id, part_id))
-        self.conn.commit()
-        self.load_service_parts(service_id)
+        self.run_db(db.remove_service_part, service_id, part_id, on_done=self.load_service_parts)
 
     def update_service(self):
         selected = self.services_tree.focus()
@@ -1706,14 +2249,11 @@ class CarManagementApp:
             except ValueError:
                 messagebox.showerror('Error', 'Cost must be an integer if provided')
                 return
-        cursor = self.conn.cursor()
-        cursor.execute('UPDATE services SET vehicle_id=?, date=?, odometer=?, description=?, cost=?, service_interval_miles=?, service_interval_days=? WHERE id=?',
-                       (vehicle_id, date, odometer_value, description or None, cost_value, interval_miles_value, interval_days_value, id_))
-        cursor.execute('DELETE FROM service_service_types WHERE service_id=?', (id_,))
-        for type_id in selected_types:
-            cursor.execute('INSERT INTO service_service_types (service_id, service_type_id) VALUES (?, ?)', (id_, type_id))
-        self.conn.commit()
-        self.load_services()
+        self.run_db(db.update_service, id_, vehicle_id, db.from_display_date(date), odometer_value, description, cost_value,
+                    interval_miles_value, interval_days_value, selected_types, on_done=self.service_updated)
+
+    def service_updated(self, affected):
+        self.refresh_service_rows(affected)
         self.clear_service_entries()
 
     def delete_service(self):
@@ -1722,12 +2262,10 @@ class CarManagementApp:
             messagebox.showerror('Error', 'Select a service to delete')
             return
         id_ = self.services_tree.item(selected, 'values')[0]
-        cursor = self.conn.cursor()
-        cursor.execute('DELETE FROM services WHERE id=?', (id_,))
-        cursor.execute('DELETE FROM service_parts WHERE service_id=?', (id_,))
-        cursor.execute('DELETE FROM service_service_types WHERE service_id=?', (id_,))
-        self.conn.commit()
-        self.load_services()
+        self.run_db(db.delete_service, id_, on_done=self.services_changed)
+
+    def services_changed(self, affected):
+        self.refresh_service_rows(affected)
         self.clear_service_entries()
         self.clear_service_parts_tree()
 
@@ -1737,20 +2275,21 @@ class CarManagementApp:
         for var in self.service_type_vars.values():
             var.set(False)
         self.service_date_entry.delete(0, ttk.END)
-        self.service_date_entry.insert(0, datetime.now().strftime('%d/%m/%Y'))
+        self.service_date_entry.insert(0, datetime.now().strftime(db.DISPLAY_DATE_FORMAT))
         self.service_odometer_entry.delete(0, ttk.END)
         self.service_interval_miles_entry.delete(0, ttk.END)
         self.service_interval_days_entry.delete(0, ttk.END)
         self.service_desc_entry.delete('1.0', END)
         self.service_cost_entry.delete(0, ttk.END)
         self.clear_service_parts_tree()
-        self.load_part_combo()
+        self.reset_part_picker()
 
     def clear_service_parts_tree(self):
         for item in self.service_parts_tree.get_children():
             self.service_parts_tree.delete(item)
 
 if __name__ == "__main__":
+    # Opt-in timing of every query, loader and tree refresh (see StatsWindow)
     root = ttk.Window()
-    app = CarManagementApp(root)
+    app = CarManagementApp(root, trace='--trace' in sys.argv[1:] or db.instrumentation_requested())
     root.mainloop()
\ No newline at end of file
@@ -9,6 +9,9 @@ Source0:        pitstop.py
 Source1:        pitstop
 Source2:        pitstop.desktop
 Source3:        README.md
+Source4:        pitstop_db.py
+Source5:        pitstop_cli.py
+Source6:        pitstop_bench.py
 
 BuildArch:      noarch
 
@@ -16,6 +19,8 @@ BuildRequires:  python3-devel
 Requires:       python3
 Requires:       python3-tkinter
 #Requires:       python3-ttkbootstrap
+Recommends:     python3-numpy
+Suggests:       python3-pyarrow
 
 %description
 PitStop is a Python-based GUI application for managing car parts, vehicles, service records, and service types. It uses a SQLite database to store data and provides a user-friendly interface with features like searching, sorting, CSV export, and overdue service highlighting.
@@ -26,6 +31,9 @@ cp %{SOURCE0} .
 cp %{SOURCE1} .
 cp %{SOURCE2} .
 cp %{SOURCE3} .
+cp %{SOURCE4} .
+cp %{SOURCE5} .
+cp %{SOURCE6} .
 
 %build
 # No build step required for Python script
@@ -37,6 +45,9 @@ mkdir -p %{buildroot}%{_localstatedir}/lib/pitstop
 mkdir -p %{buildroot}%{_datadir}/applications
 
 install -m 644 pitstop.py %{buildroot}%{_datadir}/pitstop/pitstop.py
+install -m 644 pitstop_db.py %{buildroot}%{_datadir}/pitstop/pitstop_db.py
+install -m 644 pitstop_cli.py %{buildroot}%{_datadir}/pitstop/pitstop_cli.py
+install -m 644 pitstop_bench.py %{buildroot}%{_datadir}/pitstop/pitstop_bench.py
 install -m 755 pitstop %{buildroot}%{_bindir}/pitstop
 install -m 644 pitstop.desktop %{buildroot}%{_datadir}/applications/pitstop.desktop
 
@@ -46,6 +57,9 @@ desktop-file-validate %{buildroot}%{_datadir}/applications/pitstop.desktop
 %files
 %{_bindir}/pitstop
 %{_datadir}/pitstop/pitstop.py
+%{_datadir}/pitstop/pitstop_db.py
+%{_datadir}/pitstop/pitstop_cli.py
+%{_datadir}/pitstop/pitstop_bench.py
 %{_datadir}/applications/pitstop.desktop
 %doc README.md
 
@@ -0,0 +1,880 @@
+"""Headless benchmarks for PitStop's database hot paths.
+
+Run from the source tree with: python3 pitstop_bench.py [plans|generate|suite|compare]
+(or `pitstop bench ...`). The suite writes JSON reports, so results can be
+compared release to release:
+
+    python3 pitstop_bench.py suite --scale medium -o 1.0.0.json
+    python3 pitstop_bench.py compare 1.0.0.json 1.1.0.json
+"""
+import argparse
+import ast
+import csv
+import importlib.util
+import json
+import os
+import platform
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import pitstop_db
+
+def _timed(func, *args, repeat=5):
+    # Best-of-N wall time in milliseconds
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def _populate_parts(conn, vehicles, parts):
+    cursor = conn.cursor()
+    cursor.executemany('INSERT INTO vehicles (name, year, model) VALUES (?, ?, ?)',
+                       ((f'Vehicle {i}', 2000 + i % 25, f'Model {i % 40}') for i in range(vehicles)))
+    cursor.executemany('INSERT INTO parts (name, manufacturer, part_number, description, price, vehicle_id) VALUES (?, ?, ?, ?, ?, ?)',
+                       ((f'Part {i}', f'Maker {i % 97}', f'PN-{i:07d}', None, i % 500, i % vehicles + 1) for i in range(parts)))
+    conn.commit()
+
+def _populate_alt_parts(conn, parts, per_part=2):
+    cursor = conn.cursor()
+    cursor.executemany('INSERT INTO alt_parts (alt_id, part_id, manufacturer, part_number) VALUES (?, ?, ?, ?)',
+                       ((f'{p}{chr(97 + i)}', p, f'Alt Maker {i}', f'ALT-{p:07d}-{i}')
+                        for p in range(1, parts + 1, 3) for i in range(per_part)))
+    conn.commit()
+
+def _populate_services(conn, vehicles, services, start=date(2015, 1, 1)):
+    cursor = conn.cursor()
+    cursor.executemany('INSERT INTO services (vehicle_id, date, odometer, description, cost, service_interval_miles, service_interval_days) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                       ((i % vehicles + 1, (start + timedelta(days=(i * 7) % 3650)).isoformat(), 1000 + i * 13 % 200000,
+                         f'Service {i}', i % 900, 5000 if i % 2 else None, 180 if i % 3 else None) for i in range(services)))
+    conn.commit()
+
+def _count_queries(conn, func, *args):
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        func(*args)
+    finally:
+        conn.set_trace_callback(None)
+    return len(statements)
+
+def _fetch_parts_per_row(conn):
+    # The pre-batching loader: one alt_parts query for every part row
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT p.id, p.name, p.manufacturer, p.part_number, p.description, p.price,
+               COALESCE(v.name || (CASE WHEN v.year IS NOT NULL AND v.model IS NOT NULL THEN ' (' || v.year || ' ' || v.model || ')' ELSE '' END), 'N/A')
+        FROM parts p
+        LEFT JOIN vehicles v ON p.vehicle_id = v.id
+        ORDER BY p.id ASC
+    ''')
+    parts = []
+    for row in cursor.fetchall():
+        cursor.execute('SELECT alt_id, manufacturer, part_number FROM alt_parts WHERE part_id = ? ORDER BY alt_id ASC', (row[0],))
+        parts.append((row, cursor.fetchall()))
+    return parts
+
+def bench_parts_loader(parts=10000):
+    """Compare query count and wall time of the batched parts loader with the per-row path."""
+    conn = sqlite3.connect(':memory:')
+    pitstop_db.migrate_database(conn)
+    _populate_parts(conn, 100, parts)
+    _populate_alt_parts(conn, parts)
+    result = {
+        'parts': parts,
+        'per_row_queries': _count_queries(conn, _fetch_parts_per_row, conn),
+        'per_row_ms': _timed(_fetch_parts_per_row, conn, repeat=1),
+        'batched_queries': _count_queries(conn, pitstop_db.fetch_parts, conn),
+        'batched_ms': _timed(pitstop_db.fetch_parts, conn, repeat=3),
+    }
+    conn.close()
+    return result
+
+def _search_parts_like(conn, search_term):
+    # The pre-FTS search: LIKE '%term%' over six columns, which no index can serve
+    return conn.execute('''
+        SELECT DISTINCT p.id
+        FROM parts p
+        LEFT JOIN alt_parts ap ON p.id = ap.part_id
+        LEFT JOIN vehicles v ON p.vehicle_id = v.id
+        WHERE lower(p.name) LIKE ? OR lower(p.part_number) LIKE ?
+        OR lower(ap.manufacturer) LIKE ? OR lower(ap.part_number) LIKE ?
+        OR lower(v.name) LIKE ? OR lower(v.model) LIKE ?
+    ''', [f'%{search_term}%'] * 6).fetchall()
+
+def bench_parts_search(parts=500000, search_term='pn-00123'):
+    """Compare a LIKE scan with the parts_fts index for a Parts Inventory search."""
+    conn = sqlite3.connect(':memory:')
+    pitstop_db.migrate_database(conn)
+    _populate_parts(conn, 100, parts)
+    _populate_alt_parts(conn, parts)
+    result = {
+        'parts': parts,
+        'like_ms': _timed(_search_parts_like, conn, search_term, repeat=3),
+        'fts_ms': _timed(pitstop_db.fetch_parts, conn, None, search_term),
+    }
+    conn.close()
+    return result
+
+def _load_all_part_choices(conn):
+    # The old part combobox: every part (and alternative) sorted into one list of display strings
+    choices = conn.execute('SELECT id, NULL, name, NULL, NULL FROM parts').fetchall()
+    choices += conn.execute('SELECT ap.part_id, ap.alt_id, p.name, ap.manufacturer, ap.part_number FROM alt_parts ap JOIN parts p ON ap.part_id = p.id').fetchall()
+    choices.sort(key=lambda choice: (int(choice[0]), choice[1] or ''))
+    return [f'{choice[1] or choice[0]} - {choice[2]}' for choice in choices]
+
+def bench_part_picker(parts=500000, search_term='pn-00123'):
+    """Compare filling the old all-parts combobox with one capped type-ahead lookup."""
+    conn = sqlite3.connect(':memory:')
+    pitstop_db.migrate_database(conn)
+    _populate_parts(conn, 100, parts)
+    _populate_alt_parts(conn, parts)
+    result = {
+        'parts': parts,
+        'load_all_ms': _timed(_load_all_part_choices, conn, repeat=1),
+        'prefix_ms': _timed(pitstop_db.search_part_choices, conn, search_term),
+        'word_ms': _timed(pitstop_db.search_part_choices, conn, 'part 12'),
+    }
+    conn.close()
+    return result
+
+def bench_paging(services=1000000, vehicles=200):
+    """Compare loading the whole Service Records listing with one keyset page near the start and end."""
+    conn = sqlite3.connect(':memory:')
+    pitstop_db.migrate_database(conn)
+    _populate_parts(conn, vehicles, 0)
+    _populate_services(conn, vehicles, services)
+    last_page = pitstop_db.fetch_services_page(conn, end=True)
+    result = {
+        'services': services,
+        'full_ms': _timed(pitstop_db.fetch_services, conn, repeat=1),
+        'first_page_ms': _timed(pitstop_db.fetch_services_page, conn),
+        'deep_page_ms': _timed(lambda: pitstop_db.fetch_services_page(conn, before=last_page[1])),
+        'date_page_ms': _timed(lambda: pitstop_db.fetch_services_page(conn, sort_column='Date', start='2020-01-01')),
+    }
+    conn.close()
+    return result
+
+def _fetch_services_per_row(conn):
+    # The pre-single-pass loader: one "last service" query for every row with an interval
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT s.id, s.date, s.odometer, s.service_interval_miles, s.service_interval_days
+        FROM services s ORDER BY s.id ASC
+    ''')
+    current_date = datetime.now()
+    overdue = []
+    for service_id, service_date, odometer, interval_miles, interval_days in cursor.fetchall():
+        is_overdue = False
+        if interval_days or interval_miles:
+            cursor.execute('''
+                SELECT date, odometer FROM services
+                WHERE vehicle_id = (SELECT vehicle_id FROM services WHERE id = ?) AND id != ?
+                ORDER BY date DESC LIMIT 1
+            ''', (service_id, service_id))
+            last_service = cursor.fetchone()
+            if last_service:
+                last_date = datetime.fromisoformat(last_service[0])
+                if interval_days and (current_date - last_date).days > interval_days:
+                    is_overdue = True
+                if interval_miles and last_service[1] and odometer and odometer - last_service[1] > interval_miles:
+                    is_overdue = True
+            elif interval_days and (current_date - datetime.fromisoformat(service_date)).days > interval_days:
+                is_overdue = True
+        overdue.append(is_overdue)
+    return overdue
+
+def bench_overdue(services=20000, vehicles=200):
+    """Compare the single-pass overdue computation with the per-row query path."""
+    conn = sqlite3.connect(':memory:')
+    pitstop_db.migrate_database(conn)
+    _populate_parts(conn, vehicles, 0)
+    _populate_services(conn, vehicles, services)
+    result = {
+        'services': services,
+        'per_row_queries': _count_queries(conn, _fetch_services_per_row, conn),
+        'per_row_ms': _timed(_fetch_services_per_row, conn, repeat=1),
+        'single_pass_queries': _count_queries(conn, pitstop_db.fetch_services, conn),
+        'single_pass_ms': _timed(pitstop_db.fetch_services, conn, repeat=3),
+    }
+    conn.close()
+    return result
+
+def bench_startup_migration(parts=400000):
+    """Time migrate_database on an up-to-date database; should not grow with the catalogue."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'pitstop.db')
+        conn = sqlite3.connect(db_path)
+        pitstop_db.migrate_database(conn)
+        _populate_parts(conn, 100, parts)
+        conn.close()
+
+        def reopen():
+            conn = sqlite3.connect(db_path)
+            pitstop_db.migrate_database(conn)
+            conn.close()
+
+        return {'parts': parts, 'startup_ms': _timed(reopen)}
+
+def _commit_latencies(conn, commits):
+    # One small write per commit, like a form save in the app
+    latencies = []
+    for i in range(commits):
+        start = time.perf_counter()
+        conn.execute('INSERT INTO vehicles (name, year, model) VALUES (?, ?, ?)', (f'Vehicle {i}', 2000, 'Model'))
+        conn.commit()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)]
+
+def bench_commit_latency(commits=500):
+    """Compare per-commit latency of a default connection with the WAL/tuned pitstop_db.connect()."""
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'default.db'))
+        pitstop_db.migrate_database(conn)
+        default_median, default_p95 = _commit_latencies(conn, commits)
+        conn.close()
+        conn = pitstop_db.connect(os.path.join(tmp, 'tuned.db'))
+        tuned_median, tuned_p95 = _commit_latencies(conn, commits)
+        conn.close()
+    return {'commits': commits, 'default_median_ms': default_median, 'default_p95_ms': default_p95,
+            'wal_median_ms': tuned_median, 'wal_p95_ms': tuned_p95}
+
+def bench_csv_import(parts=200000, services=200000, vehicles=100):
+    """Round-trip parts and services through export_*_csv() and import_csv() into a fresh database; rows per second."""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = sqlite3.connect(os.path.join(tmp, 'source.db'))
+        pitstop_db.migrate_database(source)
+        _populate_parts(source, vehicles, parts)
+        _populate_services(source, vehicles, services)
+        pitstop_db.export_parts_csv(source, os.path.join(tmp, 'parts.csv'))
+        pitstop_db.export_services_csv(source, os.path.join(tmp, 'services.csv'))
+        source.close()
+        conn = pitstop_db.connect(os.path.join(tmp, 'target.db'))
+        _populate_parts(conn, vehicles, 0)
+        result = {'parts': parts, 'services': services}
+        for kind, rows in (('parts', parts), ('services', services)):
+            start = time.perf_counter()
+            imported, rejected = pitstop_db.import_csv(conn, kind, os.path.join(tmp, f'{kind}.csv'))
+            result[f'{kind}_rows_per_s'] = imported / (time.perf_counter() - start)
+            result[f'{kind}_rejected'] = rejected
+        conn.close()
+    return result
+
+def bench_analytics_export(services=200000, vehicles=200):
+    """Compare exporting and loading the services history as CSV with the .npz columnar export."""
+    import numpy
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'pitstop.db'))
+        pitstop_db.migrate_database(conn)
+        _populate_parts(conn, vehicles, 0)
+        _populate_services(conn, vehicles, services)
+        csv_path = os.path.join(tmp, 'services.csv')
+
+        def load_csv():
+            with open(csv_path, newline='', encoding='utf-8') as csvfile:
+                return list(csv.reader(csvfile))
+
+        def load_npz():
+            with numpy.load(os.path.join(tmp, 'services.npz')) as arrays:
+                return {name: arrays[name] for name in arrays.files}
+
+        result = {
+            'services': services,
+            'csv_export_ms': _timed(pitstop_db.export_services_csv, conn, csv_path, repeat=1),
+            'csv_load_ms': _timed(load_csv, repeat=3),
+            'npz_export_ms': _timed(pitstop_db.export_analytics, conn, tmp, 'npz', repeat=1),
+            'npz_load_ms': _timed(load_npz, repeat=3),
+        }
+        conn.close()
+    return result
+
+# Tables that grow with the catalogue or service history; vehicles and service
+# types stay small enough that scanning them is fine.
+LARGE_TABLES = {'parts', 'alt_parts', 'services', 'service_parts', 'service_service_types'}
+
+def _literal_queries():
+    # Every SQL string literal passed to execute() in pitstop_db.py, outside the migrations
+    with open(pitstop_db.__file__, encoding='utf-8') as source:
+        tree = ast.parse(source.read())
+    queries = []
+    for function in ast.walk(tree):
+        if not isinstance(function, ast.FunctionDef) or function.name.startswith('_migration_') or function.name == 'migrate_database':
+            continue
+        for node in ast.walk(function):
+            if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr in ('execute', 'executemany')
+                    and node.args and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str)):
+                sql = node.args[0].value
+                # sqlite_stat1 only exists once ANALYZE has run
+                if sql.lstrip().split(None, 1)[0].upper() in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH') and 'sqlite_stat1' not in sql:
+                    queries.append((f'{function.name}:{node.lineno}', sql, [None] * sql.count('?')))
+    return queries
+
+def _traced_queries(conn):
+    # Statements built at runtime, captured by driving the repository read methods
+    calls = [
+        ('fetch_parts', lambda: pitstop_db.fetch_parts(conn)),
+        ('fetch_parts vehicle', lambda: pitstop_db.fetch_parts(conn, vehicle_id=3)),
+        ('fetch_parts search', lambda: pitstop_db.fetch_parts(conn, search_term='pn-0001')),
+        ('fetch_parts vehicle search', lambda: pitstop_db.fetch_parts(conn, vehicle_id=3, search_term='pn-0001')),
+        ('fetch_services', lambda: pitstop_db.fetch_services(conn)),
+        ('fetch_services vehicle', lambda: pitstop_db.fetch_services(conn, vehicle_id=3)),
+        ('fetch_services search', lambda: pitstop_db.fetch_services(conn, search_term='oil')),
+        ('fetch_parts patch', lambda: pitstop_db.fetch_parts(conn, part_ids=[5, 50])),
+        ('fetch_services patch', lambda: pitstop_db.fetch_services(conn, service_ids=[5, 50])),
+        ('service_ids_for_vehicle', lambda: pitstop_db.service_ids_for_vehicle(conn, 3)),
+        ('part_ids_for_vehicle', lambda: pitstop_db.part_ids_for_vehicle(conn, 3)),
+        ('service_ids_for_type', lambda: pitstop_db.service_ids_for_type(conn, 1)),
+        ('fetch_alt_parts', lambda: pitstop_db.fetch_alt_parts(conn, 5)),
+        ('search_part_choices', lambda: pitstop_db.search_part_choices(conn)),
+        ('search_part_choices vehicle', lambda: pitstop_db.search_part_choices(conn, vehicle_id=3)),
+        ('search_part_choices prefix', lambda: pitstop_db.search_part_choices(conn, 'pn-0001')),
+        ('search_part_choices vehicle prefix', lambda: pitstop_db.search_part_choices(conn, 'pn-0001', 3)),
+        ('fetch_parts_page', lambda: pitstop_db.fetch_parts_page(conn, after=(100, 100))),
+        ('fetch_parts_page name', lambda: pitstop_db.fetch_parts_page(conn, sort_column='Name', before=('Part 5', 6))),
+        ('fetch_parts_page vehicle', lambda: pitstop_db.fetch_parts_page(conn, 3, end=True)),
+        ('fetch_parts_page by vehicle', lambda: pitstop_db.fetch_parts_page(conn, sort_column='Vehicle', after=('Vehicle 5', 5, 100))),
+        ('fetch_services_page', lambda: pitstop_db.fetch_services_page(conn, after=(100, 100))),
+        ('fetch_services_page date', lambda: pitstop_db.fetch_services_page(conn, sort_column='Date', reverse=True, start='2016-01-01')),
+        ('fetch_services_page by vehicle', lambda: pitstop_db.fetch_services_page(conn, sort_column='Vehicle', start='vehicle 5')),
+        ('fetch_services_page vehicle date', lambda: pitstop_db.fetch_services_page(conn, 3, 'Date', after=('2016-01-01', 100))),
+        ('estimate_rows', lambda: pitstop_db.estimate_rows(conn, 'services')),
+        ('estimate_rows vehicle', lambda: pitstop_db.estimate_rows(conn, 'services', 3)),
+        ('fetch_vehicles', lambda: pitstop_db.fetch_vehicles(conn, [3])),
+        ('fetch_service_types', lambda: pitstop_db.fetch_service_types(conn, [1])),
+        ('fetch_service_parts', lambda: pitstop_db.fetch_service_parts(conn, 5)),
+    ]
+    queries = []
+    for label, call in calls:
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            call()
+        finally:
+            conn.set_trace_callback(None)
+        # Statements SQLite runs internally (triggers, FTS shadow tables) are traced as comments
+        queries += [(label, sql, []) for sql in statements if not sql.lstrip().startswith('--')]
+    return queries
+
+def _plan_regressions(conn, sql, params):
+    plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+    # A listing (no WHERE) or a LIKE substring search has to walk its driving table once;
+    # any other scan of a large table, or an automatic index, means a missing index.
+    driving_scan_allowed = not re.search(r'\bWHERE\b', sql, re.I) or re.search(r'\bLIKE\b', sql, re.I)
+    problems = []
+    for detail in plan:
+        if 'AUTOMATIC' in detail:
+            problems.append(detail)
+            continue
+        match = re.match(r'SCAN (\w+)', detail)
+        if not match:
+            continue
+        table = match.group(1)
+        aliases = dict(re.findall(r'\b(?:FROM|JOIN)\s+(\w+)\s+(?:AS\s+)?(\w+)', sql, re.I))
+        aliases = {alias: name for name, alias in aliases.items()}
+        if aliases.get(table, table) not in LARGE_TABLES:
+            continue
+        if driving_scan_allowed:
+            driving_scan_allowed = False
+            continue
+        problems.append(detail)
+    return plan, problems
+
+def check_query_plans(parts=20000, services=20000):
+    """Run EXPLAIN QUERY PLAN over every query the app issues; return the ones that scan a large table."""
+    conn = sqlite3.connect(':memory:')
+    pitstop_db.migrate_database(conn)
+    _populate_parts(conn, 100, parts)
+    _populate_alt_parts(conn, parts)
+    _populate_services(conn, 100, services)
+    regressions = []
+    for label, sql, params in _literal_queries() + _traced_queries(conn):
+        plan, problems = _plan_regressions(conn, sql, params)
+        if problems:
+            regressions.append({'query': label, 'sql': ' '.join(sql.split()), 'plan': plan, 'problems': problems})
+    conn.close()
+    return regressions
+
+def _table_digests(conn):
+    # The rows of every table a snapshot stores (FTS content through its virtual table), for comparing two databases
+    tables = pitstop_db._snapshot_tables(conn.execute("SELECT type, name, sql FROM sqlite_master").fetchall())
+    return {table: sorted(conn.execute(f'SELECT * FROM "{table}"').fetchall(), key=repr) for table in tables}
+
+def check_snapshot_round_trip(parts=5000, services=5000):
+    """Snapshot an ANALYZEd database, change it, restore the snapshot; return the tables that came back different."""
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = pitstop_db.connect(os.path.join(tmp, 'pitstop.db'))
+        _populate_parts(conn, 50, parts)
+        _populate_alt_parts(conn, parts)
+        _populate_services(conn, 50, services)
+        conn.execute('ANALYZE')
+        conn.commit()
+        expected = _table_digests(conn)
+        manifest = pitstop_db.snapshot_backup(conn, os.path.join(tmp, 'snapshots'))
+        pitstop_db.add_vehicle(conn, 'After snapshot', 2026, 'Model')
+        pitstop_db.delete_part(conn, 1)
+        pitstop_db.restore_snapshot(conn, manifest)
+        restored = _table_digests(conn)
+        conn.close()
+    return sorted(table for table in expected.keys() | restored.keys() if expected.get(table) != restored.get(table))
+
+# Synthetic databases. Everything is drawn from one seeded random.Random, so
+# the same sizes and seed always produce the same database.
+SCALES = {
+    'small': {'vehicles': 20, 'parts': 2000, 'alt_parts': 1500, 'services': 1000, 'service_parts': 2000, 'service_types': 12},
+    'medium': {'vehicles': 200, 'parts': 50000, 'alt_parts': 40000, 'services': 100000, 'service_parts': 200000, 'service_types': 20},
+    'large': {'vehicles': 2000, 'parts': 500000, 'alt_parts': 400000, 'services': 1000000, 'service_parts': 2000000, 'service_types': 30},
+}
+
+# Bumped when the layout of bench_suite() reports changes
+SUITE_FORMAT = 1
+
+MAKES = {
+    'Toyota': ['Corolla', 'Hilux', 'RAV4', 'Yaris'], 'Ford': ['Focus', 'Fiesta', 'Ranger', 'Transit'],
+    'Volkswagen': ['Golf', 'Polo', 'Passat'], 'Honda': ['Civic', 'Jazz', 'CR-V'], 'Mazda': ['3', '6', 'MX-5', 'CX-5'],
+    'Subaru': ['Impreza', 'Outback', 'Forester'], 'Skoda': ['Octavia', 'Fabia'], 'Volvo': ['V70', 'XC60', '240'],
+}
+PART_NAMES = ['Oil filter', 'Air filter', 'Cabin filter', 'Fuel filter', 'Brake pads', 'Brake disc', 'Spark plug',
+              'Timing belt', 'Water pump', 'Thermostat', 'Alternator belt', 'Wiper blade', 'Headlight bulb',
+              'Shock absorber', 'Control arm', 'Tie rod end', 'Wheel bearing', 'Clutch kit', 'Battery', 'Glow plug']
+MANUFACTURERS = ['Bosch', 'Mann', 'Mahle', 'NGK', 'Denso', 'Gates', 'Brembo', 'TRW', 'Febi', 'Valeo', 'SKF', 'Sachs']
+SERVICE_TYPES = ['Oil change', 'Tyre rotation', 'Brake service', 'Timing belt', 'Coolant flush', 'Inspection',
+                 'Air conditioning', 'Wheel alignment', 'Battery', 'Spark plugs', 'Transmission fluid', 'Suspension']
+SERVICE_WORDS = ['Replaced', 'Checked', 'Adjusted', 'Cleaned', 'Topped up', 'Inspected']
+
+def generate_database(path, vehicles, parts, alt_parts, services, service_parts, service_types, seed=0, progress=None):
+    """Build a new PitStop database at path filled with reproducible synthetic data.
+
+    Rows are shaped like the app's own: part numbers unique per vehicle, alt ids
+    like "12a", services whose odometer grows with the date. Refuses to overwrite
+    an existing file. progress(done, total) is called once per table.
+    """
+    if os.path.exists(path):
+        raise FileExistsError(f'{path} already exists')
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    try:
+        pitstop_db.migrate_database(conn)
+        conn.execute('PRAGMA synchronous = OFF')
+        cursor = conn.cursor()
+        steps = 6
+
+        makes = sorted(MAKES)
+        vehicle_rows = []
+        for i in range(vehicles):
+            make = rng.choice(makes)
+            vehicle_rows.append((f'{make} {i + 1}', rng.randint(1985, 2025), rng.choice(MAKES[make])))
+        cursor.executemany('INSERT INTO vehicles (name, year, model) VALUES (?, ?, ?)', vehicle_rows)
+        if progress:
+            progress(1, steps)
+
+        type_names = [SERVICE_TYPES[i] if i < len(SERVICE_TYPES) else f'Service type {i + 1}' for i in range(service_types)]
+        cursor.executemany('INSERT INTO service_types (name) VALUES (?)', ((name,) for name in type_names))
+        if progress:
+            progress(2, steps)
+
+        parts_by_vehicle = [[] for _ in range(vehicles)]
+
+        def part_rows():
+            for part_id in range(1, parts + 1):
+                vehicle_id = rng.randint(1, vehicles)
+                parts_by_vehicle[vehicle_id - 1].append(part_id)
+                maker = rng.choice(MANUFACTURERS)
+                yield (rng.choice(PART_NAMES), maker, f'{maker[:2].upper()}-{part_id:07d}',
+                       rng.choice([None, '', f'Fits {vehicle_rows[vehicle_id - 1][2]}']), rng.randint(2, 600), vehicle_id)
+
+        cursor.executemany('INSERT INTO parts (name, manufacturer, part_number, description, price, vehicle_id) VALUES (?, ?, ?, ?, ?, ?)', part_rows())
+        if progress:
+            progress(3, steps)
+
+        alt_letters = {}
+
+        def alt_part_rows():
+            for n in range(alt_parts if parts else 0):
+                part_id = rng.randint(1, parts)
+                letter = alt_letters.get(part_id, 0)
+                if letter >= 26:
+                    continue
+                alt_letters[part_id] = letter + 1
+                maker = rng.choice(MANUFACTURERS)
+                yield f'{part_id}{chr(97 + letter)}', part_id, maker, f'{maker[:2].upper()}-A{n:07d}'
+
+        cursor.executemany('INSERT INTO alt_parts (alt_id, part_id, manufacturer, part_number) VALUES (?, ?, ?, ?)', alt_part_rows())
+        if progress:
+            progress(4, steps)
+
+        # Each vehicle drives a steady distance per day, so odometer readings follow the dates
+        first_day = date(2010, 1, 1)
+        days = (date(2026, 1, 1) - first_day).days
+        mileage = [(rng.randint(0, 150000), rng.uniform(10, 80)) for _ in range(vehicles)]
+        service_vehicles = []
+
+        def service_rows():
+            for _ in range(services):
+                vehicle_id = rng.randint(1, vehicles)
+                service_vehicles.append(vehicle_id)
+                day = rng.randrange(days)
+                start, per_day = mileage[vehicle_id - 1]
+                yield (vehicle_id, (first_day + timedelta(days=day)).isoformat(), int(start + day * per_day),
+                       f'{rng.choice(SERVICE_WORDS)} {rng.choice(PART_NAMES).lower()}', rng.randint(0, 1500),
+                       rng.choice([None, 5000, 10000, 15000]), rng.choice([None, 180, 365, 730]))
+
+        cursor.executemany('INSERT INTO services (vehicle_id, date, odometer, description, cost, service_interval_miles, service_interval_days) '
+                           'VALUES (?, ?, ?, ?, ?, ?, ?)', service_rows())
+        cursor.executemany('INSERT INTO service_service_types (service_id, service_type_id) VALUES (?, ?)',
+                           ((service_id, type_id) for service_id in range(1, services + 1)
+                            for type_id in rng.sample(range(1, service_types + 1), min(rng.randint(0, 2), service_types))))
+        if progress:
+            progress(5, steps)
+
+        def service_part_rows():
+            per_service, extra = divmod(service_parts, services) if services else (0, 0)
+            for service_id, vehicle_id in enumerate(service_vehicles, 1):
+                candidates = parts_by_vehicle[vehicle_id - 1]
+                count = min(per_service + (service_id <= extra), len(candidates))
+                for part_id in rng.sample(candidates, count):
+                    letters = alt_letters.get(part_id, 0)
+                    alt_id = f'{part_id}{chr(97 + rng.randrange(letters))}' if letters and rng.random() < 0.3 else None
+                    yield service_id, part_id, alt_id, rng.randint(1, 4)
+
+        cursor.executemany('INSERT INTO service_parts (service_id, part_id, alt_part_id, quantity_used) VALUES (?, ?, ?, ?)', service_part_rows())
+        conn.commit()
+        if progress:
+            progress(6, steps)
+    except BaseException:
+        conn.close()
+        os.remove(path)
+        raise
+    conn.close()
+    return table_counts(path)
+
+def table_counts(path):
+    conn = sqlite3.connect(path)
+    try:
+        return {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                for table in ('vehicles', 'service_types', 'parts', 'alt_parts', 'services', 'service_parts', 'service_service_types')}
+    finally:
+        conn.close()
+
+# Columns the suite sorts by, as positions in the row values the Parts and
+# Service Records views sort on (see part_rows/service_rows in pitstop.py and
+# _tree_rows below).
+PARTS_SORT_COLUMNS = {'Name': 1, 'Part Number': 3, 'Price': 5}
+SERVICES_SORT_COLUMNS = {'Vehicle': 1, 'Date': 3, 'Odometer': 4, 'Cost': 6, 'Next Service': 9}
+
+def _measure(results, name, func, *args, repeat=3):
+    # Best-of-N time plus the size of what the operation returned, when it returns rows
+    rows = []
+
+    def run():
+        rows[:] = [func(*args)]
+
+    ms = _timed(run, repeat=repeat)
+    value = rows[0]
+    results[name] = {'ms': round(ms, 3), 'rows': len(value) if isinstance(value, (list, tuple)) else None}
+
+def _copy_database(path, copy_path):
+    # The backup API copies what a connection sees, including changes still in the -wal file
+    source = sqlite3.connect(path)
+    target = sqlite3.connect(copy_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+def _tree_rows(parts, services):
+    # VirtualTreeview model rows shaped like part_rows()/service_rows(): alternatives
+    # as children of their part, services with typed sort values
+    part_rows = []
+    for values, alt_parts in parts:
+        part_rows.append((str(values[0]), values, (), '', None))
+        part_rows += [(f'alt-{alt_id}', (alt_id, '', manufacturer, part_number, '', '', values[6]), ('alt_part',), str(values[0]), None)
+                      for alt_id, manufacturer, part_number in alt_parts]
+    service_rows = [(str(row[0]), row, ('overdue',) if is_overdue else (), '', row + (next_date or '',))
+                    for row, next_date, _, is_overdue in services]
+    return part_rows, service_rows
+
+def _downgraded_copy(path, copy_path, version):
+    # A copy of the database as an older PitStop would have left it: without the
+    # indexes later migrations add, and with PRAGMA user_version set back
+    reference = sqlite3.connect(':memory:')
+    for step, migration in pitstop_db.MIGRATIONS:
+        if step <= version:
+            migration(reference.cursor())
+    keep = {name for (name,) in reference.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    reference.close()
+    _copy_database(path, copy_path)
+    conn = sqlite3.connect(copy_path)
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL").fetchall():
+        if name not in keep:
+            conn.execute(f'DROP INDEX {name}')
+    conn.execute(f'PRAGMA user_version = {version}')
+    conn.commit()
+    conn.close()
+
+def run_suite(path, repeat=3):
+    """Time every hot path against the database at path and return {name: {'ms', 'rows'}}.
+
+    Works on a copy for anything that writes, so path is left as it was. Whole-table
+    loads, exports and backups run once; the rest take the best of `repeat` runs.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        work_path = os.path.join(tmp, 'pitstop.db')
+        _copy_database(path, work_path)
+        conn = pitstop_db.connect(work_path)
+        vehicle_id = conn.execute('SELECT vehicle_id FROM services GROUP BY vehicle_id ORDER BY COUNT(*) DESC LIMIT 1').fetchone()
+        vehicle_id = vehicle_id[0] if vehicle_id else 1
+        part_number = conn.execute('SELECT part_number FROM parts ORDER BY id LIMIT 1 OFFSET (SELECT COUNT(*) / 2 FROM parts)').fetchone()
+        part_number = part_number[0] if part_number else 'PN'
+
+        def reopen(db_path):
+            db_conn = sqlite3.connect(db_path)
+            try:
+                return pitstop_db.migrate_database(db_conn)
+            finally:
+                db_conn.close()
+
+        _measure(results, 'migrate_database.fresh', lambda: reopen(os.path.join(tmp, f'fresh-{time.perf_counter_ns()}.db')), repeat=repeat)
+        _measure(results, 'migrate_database.current', reopen, work_path, repeat=repeat)
+        upgrade_path = os.path.join(tmp, 'upgrade.db')
+        _downgraded_copy(work_path, upgrade_path, 3)
+        _measure(results, 'migrate_database.from_3', reopen, upgrade_path, repeat=1)
+        os.remove(upgrade_path)
+
+        parts = pitstop_db.fetch_parts(conn)
+        _measure(results, 'parts.load_all', pitstop_db.fetch_parts, conn, repeat=1)
+        _measure(results, 'parts.load_vehicle', pitstop_db.fetch_parts, conn, vehicle_id, repeat=repeat)
+        _measure(results, 'parts.first_page', lambda: pitstop_db.fetch_parts_page(conn)[0], repeat=repeat)
+        _measure(results, 'parts.search_number', pitstop_db.fetch_parts, conn, None, part_number.lower(), repeat=repeat)
+        _measure(results, 'parts.search_name', pitstop_db.fetch_parts, conn, None, 'brake pad', repeat=repeat)
+        _measure(results, 'parts.picker_prefix', pitstop_db.search_part_choices, conn, part_number[:6], repeat=repeat)
+
+        services = pitstop_db.fetch_services(conn)
+        _measure(results, 'load_services.all', pitstop_db.fetch_services, conn, repeat=1)
+        _measure(results, 'load_services.vehicle', pitstop_db.fetch_services, conn, vehicle_id, repeat=repeat)
+        _measure(results, 'load_services.first_page', lambda: pitstop_db.fetch_services_page(conn)[0], repeat=repeat)
+        _measure(results, 'filter_services.text', pitstop_db.fetch_services, conn, None, 'oil filter', repeat=1)
+        _measure(results, 'filter_services.vehicle_text', pitstop_db.fetch_services, conn, vehicle_id, 'replaced', repeat=repeat)
+
+        # sort_column on an unpaged view sorts the loaded row model with sort_rows(), as
+        # VirtualTreeview.sort_by does; on a paged one it fetches the first page in the new order
+        part_rows, service_rows = _tree_rows(parts, services)
+        for column, position in PARTS_SORT_COLUMNS.items():
+            _measure(results, f'sort_column.parts.{column}', pitstop_db.sort_rows, part_rows, position, repeat=repeat)
+        for column, position in SERVICES_SORT_COLUMNS.items():
+            _measure(results, f'sort_column.services.{column}', pitstop_db.sort_rows, service_rows, position, repeat=repeat)
+        for column in ('Date', 'Odometer'):
+            _measure(results, f'sort_column.services_paged.{column}',
+                     lambda: pitstop_db.fetch_services_page(conn, sort_column=column, reverse=True)[0], repeat=repeat)
+        parts = part_rows = services = service_rows = None
+
+        _measure(results, 'export.parts_csv', pitstop_db.export_parts_csv, conn, os.path.join(tmp, 'parts.csv'), repeat=1)
+        _measure(results, 'export.services_csv', pitstop_db.export_services_csv, conn, os.path.join(tmp, 'services.csv'), repeat=1)
+
+        _measure(results, 'backup.copy', pitstop_db.backup_database, conn, os.path.join(tmp, 'backup.db'), repeat=1)
+        os.remove(os.path.join(tmp, 'backup.db'))
+        _measure(results, 'backup.compact', pitstop_db.backup_database, conn, os.path.join(tmp, 'backup.db'), True, repeat=1)
+        os.remove(os.path.join(tmp, 'backup.db'))
+        snapshots = os.path.join(tmp, 'snapshots')
+        _measure(results, 'backup.snapshot_full', pitstop_db.snapshot_backup, conn, snapshots, repeat=1)
+        pitstop_db.add_vehicle(conn, 'Benchmark', 2026, 'Snapshot')
+        _measure(results, 'backup.snapshot_incremental', pitstop_db.snapshot_backup, conn, snapshots, repeat=1)
+        conn.close()
+    return results
+
+def bench_suite(scale='small', seed=0, path=None, repeat=3, progress=None):
+    """Run run_suite() on path, or on a freshly generated database of the given scale; return a JSON-ready report."""
+    with tempfile.TemporaryDirectory() as tmp:
+        generate_s = None
+        if path is None:
+            path = os.path.join(tmp, f'{scale}.db')
+            start = time.perf_counter()
+            generate_database(path, seed=seed, progress=progress, **SCALES[scale])
+            generate_s = round(time.perf_counter() - start, 3)
+        return {
+            'format': SUITE_FORMAT,
+            'created': datetime.now().astimezone().isoformat(timespec='seconds'),
+            'schema_version': pitstop_db.SCHEMA_VERSION,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'scale': scale if generate_s is not None else None,
+            'seed': seed if generate_s is not None else None,
+            'database': None if generate_s is not None else os.path.abspath(path),
+            'generate_s': generate_s,
+            'sizes': table_counts(path),
+            'repeat': repeat,
+            'results': run_suite(path, repeat),
+        }
+
+def compare_reports(baseline, current, threshold=1.25, min_ms=1.0):
+    """Return [(name, baseline_ms, current_ms, ratio), ...] for every result slower than threshold x baseline.
+
+    Results under min_ms in both reports are ignored; at that size timer noise dominates.
+    """
+    slower = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None or max(before['ms'], result['ms']) < min_ms:
+            continue
+        ratio = result['ms'] / max(before['ms'], 0.001)
+        if ratio > threshold:
+            slower.append((name, before['ms'], result['ms'], ratio))
+    return slower
+
+def run_plans():
+    regressions = check_query_plans()
+    for regression in regressions:
+        print(f"{regression['query']}: {regression['sql']}")
+        for detail in regression['plan']:
+            print(f"    {'!!' if detail in regression['problems'] else '  '} {detail}")
+    print(f'{len(regressions)} query plan regression(s)')
+    return 1 if regressions else 0
+
+def run_snapshots():
+    mismatches = check_snapshot_round_trip()
+    for table in mismatches:
+        print(f'{table}: restored rows differ from the snapshot')
+    print(f'{len(mismatches)} table(s) differ after a snapshot round trip')
+    return 1 if mismatches else 0
+
+def run_comparisons():
+    result = bench_commit_latency()
+    print(f"commit latency:    {result['commits']:>7} commits  "
+          f"default median {result['default_median_ms']:6.2f} ms p95 {result['default_p95_ms']:6.2f} ms  "
+          f"wal median {result['wal_median_ms']:6.2f} ms p95 {result['wal_p95_ms']:6.2f} ms")
+    if importlib.util.find_spec('numpy'):
+        result = bench_analytics_export()
+        print(f"analytics export:  {result['services']:>7} services  "
+              f"csv export {result['csv_export_ms']:8.2f} ms load {result['csv_load_ms']:8.2f} ms  "
+              f"npz export {result['npz_export_ms']:8.2f} ms load {result['npz_load_ms']:8.2f} ms")
+    result = bench_csv_import()
+    print(f"csv import:        {result['parts']:>7} parts  {result['parts_rows_per_s']:9.0f} rows/s  "
+          f"{result['services']:>7} services  {result['services_rows_per_s']:9.0f} rows/s")
+    for size in (1000, 100000, 400000):
+        result = bench_startup_migration(size)
+        print(f"startup migration: {result['parts']:>7} parts  {result['startup_ms']:8.2f} ms")
+    # The per-row path scans alt_parts once per part, so keep these sizes modest
+    for size in (1000, 5000, 10000):
+        result = bench_parts_loader(size)
+        print(f"parts loader:      {result['parts']:>7} parts  "
+              f"per-row {result['per_row_queries']:>7} queries {result['per_row_ms']:9.2f} ms  "
+              f"batched {result['batched_queries']:>3} queries {result['batched_ms']:8.2f} ms")
+    for size in (10000, 100000, 500000):
+        result = bench_parts_search(size)
+        print(f"parts search:      {result['parts']:>7} parts  like {result['like_ms']:8.2f} ms  fts {result['fts_ms']:8.2f} ms")
+    for size in (10000, 100000, 500000):
+        result = bench_part_picker(size)
+        print(f"part picker:       {result['parts']:>7} parts  load all {result['load_all_ms']:8.2f} ms  "
+              f"prefix {result['prefix_ms']:6.2f} ms  word {result['word_ms']:6.2f} ms")
+    for size in (10000, 100000, 1000000):
+        result = bench_paging(size)
+        print(f"services paging:   {result['services']:>7} services  full {result['full_ms']:9.2f} ms  "
+              f"first page {result['first_page_ms']:6.2f} ms  deep page {result['deep_page_ms']:6.2f} ms  date page {result['date_page_ms']:6.2f} ms")
+    for size in (1000, 10000, 20000):
+        result = bench_overdue(size)
+        print(f"overdue:           {result['services']:>7} services  "
+              f"per-row {result['per_row_queries']:>6} queries {result['per_row_ms']:9.2f} ms  "
+              f"single-pass {result['single_pass_queries']:>2} queries {result['single_pass_ms']:8.2f} ms")
+    return 0
+
+def _progress(label):
+    if not sys.stderr.isatty():
+        return None
+
+    def report(done, total):
+        sys.stderr.write(f'\r{label} {done * 100 // max(total, 1)}%')
+        if done >= total:
+            sys.stderr.write('\n')
+        sys.stderr.flush()
+    return report
+
+def run_generate(args):
+    sizes = dict(SCALES[args.scale])
+    sizes.update({table: getattr(args, table) for table in sizes if getattr(args, table) is not None})
+    try:
+        counts = generate_database(args.path, seed=args.seed, progress=_progress('Generating'), **sizes)
+    except FileExistsError as e:
+        print(f'pitstop_bench: error: {e}', file=sys.stderr)
+        return 1
+    print(', '.join(f'{count} {table}' for table, count in counts.items()))
+    return 0
+
+def run_suite_command(args):
+    report = bench_suite(args.scale, args.seed, args.db, args.repeat, _progress('Generating'))
+    text = json.dumps(report, indent=2)
+    if not args.output:
+        print(text)
+        return 0
+    with open(args.output, 'w', encoding='utf-8') as output:
+        output.write(text + '\n')
+    for name, result in report['results'].items():
+        rows = '' if result['rows'] is None else f"{result['rows']:>9} rows"
+        print(f"{name:<40} {result['ms']:10.2f} ms  {rows}")
+    return 0
+
+def run_compare(args):
+    reports = []
+    for path in (args.baseline, args.current):
+        with open(path, encoding='utf-8') as report:
+            reports.append(json.load(report))
+    if reports[0]['sizes'] != reports[1]['sizes']:
+        print('warning: the reports were measured on databases of different sizes', file=sys.stderr)
+    slower = compare_reports(*reports, threshold=args.threshold)
+    for name, before, after, ratio in slower:
+        print(f'{name:<40} {before:10.2f} ms -> {after:10.2f} ms  x{ratio:.2f}')
+    print(f'{len(slower)} result(s) slower than x{args.threshold:g} the baseline')
+    return 1 if slower else 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='pitstop_bench', description='Headless PitStop benchmarks. Without a command, runs the before/after comparisons.')
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+
+    commands.add_parser('plans', help='check that no query the app issues scans a large table')
+    commands.add_parser('snapshots', help='check that an ANALYZEd database survives snapshot_backup/restore_snapshot')
+
+    command = commands.add_parser('generate', help='build a database filled with synthetic data')
+    command.add_argument('path')
+    command.add_argument('--scale', choices=sorted(SCALES), default='small', help='base sizes (default: small)')
+    for table in SCALES['small']:
+        command.add_argument(f"--{table.replace('_', '-')}", type=int, help=f"number of {table.replace('_', ' ')}, instead of the scale's")
+    command.add_argument('--seed', type=int, default=0, help='random seed (default: 0)')
+
+    command = commands.add_parser('suite', help='time every hot path on a generated database and report JSON')
+    command.add_argument('--scale', choices=sorted(SCALES), default='small', help='size of the generated database (default: small)')
+    command.add_argument('--seed', type=int, default=0, help='random seed (default: 0)')
+    command.add_argument('--db', help='time this database instead of a generated one; it is copied, not modified')
+    command.add_argument('--repeat', type=int, default=3, help='runs per quick measurement, best one kept (default: 3)')
+    command.add_argument('-o', '--output', help='write the JSON report here and print a summary (default: JSON on stdout)')
+
+    command = commands.add_parser('compare', help='list results in a suite report that regressed against a baseline report')
+    command.add_argument('baseline')
+    command.add_argument('current')
+    command.add_argument('--threshold', type=float, default=1.25, help='slowdown ratio that counts as a regression (default: 1.25)')
+    return parser
+
+def main(argv):
+    args = build_parser().parse_args(argv)
+    if args.command == 'plans':
+        return run_plans()
+    if args.command == 'snapshots':
+        return run_snapshots()
+    if args.command == 'generate':
+        return run_generate(args)
+    if args.command == 'suite':
+        return run_suite_command(args)
+    if args.command == 'compare':
+        return run_compare(args)
+    return run_comparisons()
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
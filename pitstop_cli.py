@@ -0,0 +1,189 @@
+"""Headless command-line interface to a PitStop database.
+
+Runs the same pitstop_db code as the GUI against the same database file, but
+never imports tkinter, so scripts and nightly jobs start without a display:
+
+    pitstop export services services.csv
+    pitstop import parts catalogue.csv
+    pitstop backup --snapshot ~/pitstop-backups
+    pitstop overdue
+"""
+import argparse
+import csv
+import os
+import sys
+
+import pitstop_db as db
+
+def _progress(label, args):
+    # Percentages on stderr for interactive use; silent when piped or with --quiet
+    if args.quiet or not sys.stderr.isatty():
+        return None
+
+    def report(done, total):
+        sys.stderr.write(f'\r{label} {done * 100 // max(total, 1)}%')
+        if done >= total:
+            sys.stderr.write('\n')
+        sys.stderr.flush()
+    return report
+
+def _write_rows(header, rows):
+    writer = csv.writer(sys.stdout)
+    writer.writerow(header)
+    writer.writerows(rows)
+
+def cmd_export(conn, args):
+    progress = _progress('Exporting', args)
+    if args.what == 'parts':
+        count = db.export_parts_csv(conn, args.path, progress)
+        print(f'{count} parts exported to {args.path}')
+    elif args.what == 'services':
+        count = db.export_services_csv(conn, args.path, progress)
+        print(f'{count} services exported to {args.path}')
+    else:
+        for path in db.export_analytics(conn, args.path, args.format, progress):
+            print(path)
+
+def cmd_import(conn, args):
+    rejects_path = args.rejects or os.path.splitext(args.path)[0] + '.rejects.csv'
+    imported, rejected = db.import_csv(conn, args.kind, args.path, rejects_path, _progress('Importing', args))
+    print(f'{imported} rows imported')
+    if rejected:
+        print(f'{rejected} rows rejected, see {rejects_path}')
+        return 2
+
+def cmd_backup(conn, args):
+    if args.snapshot:
+        print(db.snapshot_backup(conn, args.path, _progress('Snapshot', args)))
+    else:
+        db.backup_database(conn, args.path, args.compact, progress=_progress('Backing up', args))
+        print(f'Database backed up to {args.path}')
+
+def cmd_restore(conn, args):
+    if args.snapshot:
+        manifest_path = args.path
+        if os.path.isdir(manifest_path):
+            # A backup directory restores its newest snapshot
+            snapshots = db.list_snapshots(manifest_path)
+            if not snapshots:
+                raise db.PitStopError(f'No snapshots in {manifest_path}')
+            manifest_path = snapshots[-1]
+        version = db.restore_snapshot(conn, manifest_path, _progress('Restoring', args))
+    else:
+        manifest_path = args.path
+        version = db.restore_database(conn, args.path)
+    print(f'Database restored from {manifest_path} (schema version {version})')
+
+def cmd_search(conn, args):
+    if args.what == 'parts':
+        parts = db.fetch_parts(conn, args.vehicle, args.term)
+        _write_rows(db.PARTS_EXPORT_HEADER + ['Alternatives'],
+                    (list(values) + ['; '.join(f'{alt[1]} {alt[2]}' for alt in alts)] for values, alts in parts[:args.limit]))
+    else:
+        services = db.fetch_services(conn, args.vehicle, args.term.lower())
+        _write_rows(db.SERVICES_EXPORT_HEADER + ['Next Date', 'Next Odometer', 'Overdue'],
+                    _service_rows(services[:args.limit]))
+
+def _service_rows(services):
+    for values, next_date, next_odometer, is_overdue in services:
+        yield list(values) + [next_date.date().isoformat() if next_date else '', next_odometer or '', 'yes' if is_overdue else '']
+
+def cmd_overdue(conn, args):
+    services = [service for service in db.fetch_services(conn, args.vehicle) if service[3]]
+    _write_rows(db.SERVICES_EXPORT_HEADER + ['Next Date', 'Next Odometer', 'Overdue'], _service_rows(services))
+    return 3 if services and args.exit_code else None
+
+def cmd_migrate(conn, args):
+    # connect() has already applied any pending migrations
+    print(f'Schema version {db.migrate_database(conn)}')
+
+def cmd_vacuum(conn, args):
+    size = os.path.getsize(args.db)
+    conn.execute('VACUUM')
+    conn.execute('PRAGMA optimize')
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    print(f'{args.db}: {size} -> {os.path.getsize(args.db)} bytes')
+
+def cmd_bench(conn, args):
+    import pitstop_bench
+    return pitstop_bench.main(args.bench_args)
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='pitstop', description='Headless PitStop database operations. Run without arguments for the GUI.')
+    parser.add_argument('--db', default=None, help='database file (default: the GUI database)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='no progress output')
+    parser.add_argument('--trace', action='store_true',
+                        help=f'time every SQL statement, print a summary on stderr and log slow ones (also ${db.TRACE_ENV}=1)')
+    commands = parser.add_subparsers(dest='command', required=True, metavar='COMMAND')
+
+    command = commands.add_parser('export', help='export parts/services as CSV, or the service history as .npz/.parquet')
+    command.add_argument('what', choices=['parts', 'services', 'analytics'])
+    command.add_argument('path', help='CSV file, or the output directory for analytics')
+    command.add_argument('--format', choices=db.ANALYTICS_FORMATS, default='npz', help='analytics file format (default: npz)')
+    command.set_defaults(func=cmd_export)
+
+    command = commands.add_parser('import', help='bulk-import a CSV file')
+    command.add_argument('kind', choices=sorted(db.IMPORTERS))
+    command.add_argument('path')
+    command.add_argument('--rejects', help='where to list rejected rows (default: <path>.rejects.csv)')
+    command.set_defaults(func=cmd_import)
+
+    command = commands.add_parser('backup', help='back up the database to a file, or add a snapshot to a directory')
+    command.add_argument('path')
+    command.add_argument('--compact', action='store_true', help='write a compacted copy with VACUUM INTO')
+    command.add_argument('--snapshot', action='store_true', help='add an incremental snapshot to the directory at path')
+    command.set_defaults(func=cmd_backup)
+
+    command = commands.add_parser('restore', help='restore from a backup file or a snapshot')
+    command.add_argument('path', help='backup file, snapshot manifest, or snapshot directory (newest snapshot)')
+    command.add_argument('--snapshot', action='store_true', help='path is a snapshot manifest or directory')
+    command.set_defaults(func=cmd_restore)
+
+    command = commands.add_parser('search', help='search parts or services and print CSV')
+    command.add_argument('what', choices=['parts', 'services'])
+    command.add_argument('term')
+    command.add_argument('--vehicle', type=int, help='only this vehicle id')
+    command.add_argument('--limit', type=int, default=None)
+    command.set_defaults(func=cmd_search)
+
+    command = commands.add_parser('overdue', help='print overdue services as CSV')
+    command.add_argument('--vehicle', type=int, help='only this vehicle id')
+    command.add_argument('--exit-code', action='store_true', help='exit with status 3 when any service is overdue')
+    command.set_defaults(func=cmd_overdue)
+
+    command = commands.add_parser('migrate', help='bring the database up to the current schema')
+    command.set_defaults(func=cmd_migrate)
+
+    command = commands.add_parser('vacuum', help='compact the database and refresh planner statistics')
+    command.set_defaults(func=cmd_vacuum)
+
+    command = commands.add_parser('bench', help='run pitstop_bench: plans, generate, suite or compare')
+    command.add_argument('bench_args', nargs=argparse.REMAINDER)
+    command.set_defaults(func=cmd_bench)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == 'bench':
+        # Benchmarks build their own scratch databases
+        return args.func(None, args)
+    args.db = args.db or db.database_path()
+    if args.trace or db.instrumentation_requested():
+        db.enable_instrumentation(args.db)
+    try:
+        conn = db.connect(args.db)
+        try:
+            with db.timed('command', args.command):
+                return args.func(conn, args)
+        finally:
+            conn.close()
+            if db.instrumentation is not None:
+                print(db.instrumentation.summary(), file=sys.stderr)
+    except (db.PitStopError, OSError, db.sqlite3.Error) as e:
+        print(f'pitstop: error: {e}', file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        return 130
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,2093 @@
+"""PitStop's data-access layer: schema migrations, loaders and writes.
+
+Nothing here imports tkinter, so the same code backs the GUI, scripts and
+benchmarks. Functions take an open sqlite3 connection; writes commit and
+return the ids they touched, and refuse bad data with PitStopError.
+"""
+
+import bisect
+import contextlib
+import csv
+import functools
+import hashlib
+import importlib.util
+import io
+import itertools
+import json
+import logging.handlers
+import operator
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+import urllib.parse
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+def _table_sql(cursor, table):
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    row = cursor.fetchone()
+    return ''.join(row[0].lower().split()) if row else ''
+
+def _migration_1_baseline(cursor):
+    # Bring pre-versioning databases (user_version 0) to the current layout.
+    # Each legacy rebuild is only done when the old table shape is actually present.
+    parts_sql = _table_sql(cursor, 'parts')
+    if parts_sql and 'unique(part_number,vehicle_id)' not in parts_sql:
+        # Rebuild parts with UNIQUE constraint on (part_number, vehicle_id)
+        cursor.execute('''
+            CREATE TABLE parts_temp (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                manufacturer TEXT,
+                part_number TEXT NOT NULL,
+                description TEXT,
+                price INTEGER DEFAULT 0,
+                vehicle_id INTEGER NOT NULL,
+                FOREIGN KEY (vehicle_id) REFERENCES vehicles(id),
+                UNIQUE (part_number, vehicle_id)
+            )
+        ''')
+        cursor.execute('''
+            INSERT INTO parts_temp (id, name, manufacturer, part_number, description, price, vehicle_id)
+            SELECT id, name, manufacturer, part_number, description, COALESCE(price, 0), vehicle_id
+            FROM parts
+        ''')
+        cursor.execute('DROP TABLE parts')
+        cursor.execute('ALTER TABLE parts_temp RENAME TO parts')
+
+    alt_parts_sql = _table_sql(cursor, 'alt_parts')
+    if alt_parts_sql and 'unique(part_number,part_id)' not in alt_parts_sql:
+        # Rebuild alt_parts with UNIQUE constraint on (part_number, part_id)
+        cursor.execute('''
+            CREATE TABLE alt_parts_temp (
+                alt_id TEXT PRIMARY KEY,
+                part_id INTEGER NOT NULL,
+                manufacturer TEXT,
+                part_number TEXT NOT NULL,
+                FOREIGN KEY (part_id) REFERENCES parts(id),
+                UNIQUE (part_number, part_id)
+            )
+        ''')
+        cursor.execute('''
+            INSERT INTO alt_parts_temp (alt_id, part_id, manufacturer, part_number)
+            SELECT alt_id, part_id, manufacturer, part_number
+            FROM alt_parts
+        ''')
+        cursor.execute('DROP TABLE alt_parts')
+        cursor.execute('ALTER TABLE alt_parts_temp RENAME TO alt_parts')
+
+    # Move services.service_type_id into the service_service_types junction
+    cursor.execute("PRAGMA table_info(services)")
+    columns = [col[1] for col in cursor.fetchall()]
+    if 'service_type_id' in columns:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS service_service_types (
+                service_id INTEGER,
+                service_type_id INTEGER,
+                PRIMARY KEY (service_id, service_type_id),
+                FOREIGN KEY (service_id) REFERENCES services(id),
+                FOREIGN KEY (service_type_id) REFERENCES service_types(id)
+            )
+        ''')
+        cursor.execute('''
+            INSERT OR IGNORE INTO service_service_types (service_id, service_type_id)
+            SELECT id, service_type_id FROM services WHERE service_type_id IS NOT NULL
+        ''')
+        cursor.execute('''
+            CREATE TABLE services_temp (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                vehicle_id INTEGER NOT NULL,
+                date TEXT NOT NULL,
+                odometer INTEGER,
+                description TEXT,
+                cost INTEGER DEFAULT 0,
+                service_interval_miles INTEGER,
+                service_interval_days INTEGER,
+                FOREIGN KEY (vehicle_id) REFERENCES vehicles(id)
+            )
+        ''')
+        cursor.execute('''
+            INSERT INTO services_temp (id, vehicle_id, date, odometer, description, cost, service_interval_miles, service_interval_days)
+            SELECT id, vehicle_id, date, odometer, description, COALESCE(cost, 0), service_interval_miles, service_interval_days
+            FROM services
+        ''')
+        cursor.execute('DROP TABLE services')
+        cursor.execute('ALTER TABLE services_temp RENAME TO services')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS parts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            manufacturer TEXT,
+            part_number TEXT NOT NULL,
+            description TEXT,
+            price INTEGER DEFAULT 0,
+            vehicle_id INTEGER NOT NULL,
+            FOREIGN KEY (vehicle_id) REFERENCES vehicles(id),
+            UNIQUE (part_number, vehicle_id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS alt_parts (
+            alt_id TEXT PRIMARY KEY,
+            part_id INTEGER NOT NULL,
+            manufacturer TEXT,
+            part_number TEXT NOT NULL,
+            FOREIGN KEY (part_id) REFERENCES parts(id),
+            UNIQUE (part_number, part_id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS vehicles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            year INTEGER,
+            model TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS service_types (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS services (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            vehicle_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            odometer INTEGER,
+            description TEXT,
+            cost INTEGER DEFAULT 0,
+            service_interval_miles INTEGER,
+            service_interval_days INTEGER,
+            FOREIGN KEY (vehicle_id) REFERENCES vehicles(id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS service_service_types (
+            service_id INTEGER,
+            service_type_id INTEGER,
+            PRIMARY KEY (service_id, service_type_id),
+            FOREIGN KEY (service_id) REFERENCES services(id),
+            FOREIGN KEY (service_type_id) REFERENCES service_types(id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS service_parts (
+            service_id INTEGER,
+            part_id INTEGER,
+            alt_part_id TEXT,
+            quantity_used INTEGER,
+            PRIMARY KEY (service_id, part_id, alt_part_id),
+            FOREIGN KEY (service_id) REFERENCES services(id),
+            FOREIGN KEY (part_id) REFERENCES parts(id),
+            FOREIGN KEY (alt_part_id) REFERENCES alt_parts(alt_id)
+        )
+    ''')
+
+def _migration_2_parts_fts(cursor):
+    # Full-text index over part name/number, alternative parts and vehicle for the
+    # Parts Inventory search box. rowid is the part id; triggers keep it in sync.
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE parts_fts USING fts5(
+                name, part_number, alt_parts, vehicle,
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '2 3'
+            )
+        ''')
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5; fetch_parts falls back to LIKE scans
+        return
+    # The alt_parts triggers below look up siblings by part_id
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_alt_parts_part_id ON alt_parts (part_id)')
+    cursor.execute('''
+        INSERT INTO parts_fts (rowid, name, part_number, alt_parts, vehicle)
+        SELECT p.id, p.name, p.part_number, a.alt_parts, v.name || ' ' || COALESCE(v.model, '')
+        FROM parts p
+        LEFT JOIN (
+            SELECT part_id, group_concat(COALESCE(manufacturer, '') || ' ' || part_number, ' ') AS alt_parts
+            FROM alt_parts GROUP BY part_id
+        ) a ON a.part_id = p.id
+        LEFT JOIN vehicles v ON p.vehicle_id = v.id
+    ''')
+    part_row = '''
+        INSERT INTO parts_fts (rowid, name, part_number, alt_parts, vehicle)
+        SELECT NEW.id, NEW.name, NEW.part_number,
+               (SELECT group_concat(COALESCE(manufacturer, '') || ' ' || part_number, ' ') FROM alt_parts WHERE part_id = NEW.id),
+               (SELECT name || ' ' || COALESCE(model, '') FROM vehicles WHERE id = NEW.vehicle_id);
+    '''
+    alt_parts_of = '''
+        UPDATE parts_fts
+        SET alt_parts = (SELECT group_concat(COALESCE(manufacturer, '') || ' ' || part_number, ' ') FROM alt_parts WHERE part_id = {0}.part_id)
+        WHERE rowid = {0}.part_id;
+    '''
+    cursor.execute(f'CREATE TRIGGER parts_fts_ai AFTER INSERT ON parts BEGIN {part_row} END')
+    cursor.execute(f'CREATE TRIGGER parts_fts_au AFTER UPDATE ON parts BEGIN DELETE FROM parts_fts WHERE rowid = OLD.id; {part_row} END')
+    cursor.execute('CREATE TRIGGER parts_fts_ad AFTER DELETE ON parts BEGIN DELETE FROM parts_fts WHERE rowid = OLD.id; END')
+    cursor.execute(f'CREATE TRIGGER alt_parts_fts_ai AFTER INSERT ON alt_parts BEGIN {alt_parts_of.format("NEW")} END')
+    cursor.execute(f'CREATE TRIGGER alt_parts_fts_au AFTER UPDATE ON alt_parts BEGIN {alt_parts_of.format("OLD")} {alt_parts_of.format("NEW")} END')
+    cursor.execute(f'CREATE TRIGGER alt_parts_fts_ad AFTER DELETE ON alt_parts BEGIN {alt_parts_of.format("OLD")} END')
+    cursor.execute('''
+        CREATE TRIGGER vehicles_fts_au AFTER UPDATE OF name, model ON vehicles BEGIN
+            UPDATE parts_fts SET vehicle = NEW.name || ' ' || COALESCE(NEW.model, '')
+            WHERE rowid IN (SELECT id FROM parts WHERE vehicle_id = NEW.id);
+        END
+    ''')
+
+def _migration_3_iso_service_dates(cursor):
+    # services.date moves from DD/MM/YYYY text to ISO-8601 (YYYY-MM-DD) so it sorts
+    # correctly and (vehicle_id, date) can be served from an index.
+    cursor.execute('SELECT id, date FROM services')
+    updates = []
+    for service_id, value in cursor.fetchall():
+        try:
+            updates.append((datetime.strptime(value, '%d/%m/%Y').date().isoformat(), service_id))
+        except (TypeError, ValueError):
+            continue
+    cursor.executemany('UPDATE services SET date = ? WHERE id = ?', updates)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_services_vehicle_date ON services (vehicle_id, date)')
+
+def _migration_4_foreign_key_indexes(cursor):
+    # Secondary indexes for every foreign key lookup the app does; services.vehicle_id
+    # is already the leading column of idx_services_vehicle_date.
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_parts_vehicle_id ON parts (vehicle_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_alt_parts_part_id ON alt_parts (part_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_service_parts_part_id ON service_parts (part_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_service_parts_alt_part_id ON service_parts (alt_part_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_service_service_types_type_id ON service_service_types (service_type_id)')
+
+def _migration_5_part_number_prefix_indexes(cursor):
+    # Case-insensitive part number indexes so the part picker can answer prefix
+    # lookups with a range scan instead of loading the whole catalogue.
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_parts_part_number_nocase ON parts (part_number COLLATE NOCASE)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_alt_parts_part_number_nocase ON alt_parts (part_number COLLATE NOCASE)')
+
+def _migration_6_page_sort_indexes(cursor):
+    # Paged listings read one page from an index: names sort case-insensitively and
+    # vehicles by the label the views show (parts and services label them differently),
+    # like the unpaged views; services of one vehicle are walked in id order, which
+    # idx_services_vehicle_date (by date) can't give.
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_parts_name_nocase ON parts (name COLLATE NOCASE)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_services_date ON services (date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_services_vehicle_id ON services (vehicle_id)')
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_vehicles_parts_label ON vehicles (
+        (name || (CASE WHEN year IS NOT NULL AND model IS NOT NULL THEN ' (' || year || ' ' || model || ')' ELSE '' END)) COLLATE NOCASE, id)''')
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_vehicles_services_label ON vehicles (
+        (name || (CASE WHEN model IS NOT NULL THEN ' (' || model || ')' ELSE '' END)) COLLATE NOCASE, id)''')
+
+# Numbered schema migrations. Each step runs once, in its own transaction, and
+# bumps PRAGMA user_version so an up-to-date database skips straight past this list.
+# Append new steps to the end; never renumber or edit a released step.
+MIGRATIONS = [
+    (1, _migration_1_baseline),
+    (2, _migration_2_parts_fts),
+    (3, _migration_3_iso_service_dates),
+    (4, _migration_4_foreign_key_indexes),
+    (5, _migration_5_part_number_prefix_indexes),
+    (6, _migration_6_page_sort_indexes),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def migrate_database(conn):
+    """Apply any pending schema migrations and return the resulting schema version."""
+    cursor = conn.cursor()
+    version = cursor.execute('PRAGMA user_version').fetchone()[0]
+    if version > SCHEMA_VERSION:
+        raise PitStopError(f'Database schema version {version} is newer than this PitStop ({SCHEMA_VERSION})')
+    if version == SCHEMA_VERSION:
+        return version
+    if conn.in_transaction:
+        conn.commit()
+    # The legacy table rebuilds drop and rename tables, which foreign key enforcement refuses
+    foreign_keys = cursor.execute('PRAGMA foreign_keys').fetchone()[0]
+    cursor.execute('PRAGMA foreign_keys = OFF')
+    try:
+        for step, migration in MIGRATIONS:
+            if step <= version:
+                continue
+            cursor.execute('BEGIN')
+            try:
+                migration(cursor)
+                cursor.execute(f'PRAGMA user_version = {step}')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            version = step
+    finally:
+        cursor.execute(f'PRAGMA foreign_keys = {foreign_keys}')
+    return version
+
+def fts_query(search_term):
+    # Turn free text into an FTS5 query: every word must match as a prefix
+    words = [word.replace('"', '') for word in search_term.split()]
+    return ' '.join(f'"{word}"*' for word in words if word)
+
+def has_table(conn, name):
+    return conn.execute('SELECT 1 FROM sqlite_master WHERE name = ?', (name,)).fetchone() is not None
+
+def id_list(ids):
+    # Bind a list of ids as a single parameter: "id IN (SELECT value FROM json_each(?))"
+    return json.dumps([int(id_) for id_ in ids])
+
+def sort_key(value):
+    # Typed sort key: empty cells first, then numbers/dates, then case-insensitive text
+    if value is None or value == '':
+        return (0, 0)
+    if isinstance(value, str):
+        return (2, value.lower())
+    return (1, value)
+
+def group_rows(rows):
+    # Split tree rows (iid, values, tags, parent, sort_values) into [parent, *children] groups
+    groups = []
+    for row in rows:
+        if row[3] and groups:
+            groups[-1].append(row)
+        else:
+            groups.append([row])
+    return groups
+
+def sort_rows(rows, column, reverse=False):
+    """Return tree rows sorted by sort_key() of column (in sort_values, else values); children stay right after their parent."""
+    groups = group_rows(rows)
+    groups.sort(key=lambda group: sort_key((group[0][4] or group[0][1])[column]), reverse=reverse)
+    return [row for group in groups for row in group]
+
+def fetch_parts(conn, vehicle_id=None, search_term=None, part_ids=None):
+    """Return [(part_values, [(alt_id, manufacturer, part_number), ...]), ...].
+
+    Parts and their alternatives come back from a single joined query and are
+    grouped here, instead of one alt_parts lookup per part. Plain listings are
+    ordered by part id; searches go through parts_fts and are ordered by rank.
+    part_ids narrows the result to those parts, for patching rows after a write.
+    """
+    query = '''
+        SELECT p.id, p.name, p.manufacturer, p.part_number, p.description, p.price,
+               COALESCE(v.name || (CASE WHEN v.year IS NOT NULL AND v.model IS NOT NULL THEN ' (' || v.year || ' ' || v.model || ')' ELSE '' END), 'N/A'),
+               ap.alt_id, ap.manufacturer, ap.part_number
+        FROM parts p
+    '''
+    conditions = []
+    params = []
+    order_by = 'p.id ASC, ap.alt_id ASC'
+    match = fts_query(search_term) if search_term else ''
+    if match and has_table(conn, 'parts_fts'):
+        # Weighted bm25: part number and name hits outrank vehicle hits
+        query += '''
+            JOIN (
+                SELECT rowid AS part_id, bm25(parts_fts, 5.0, 10.0, 5.0, 1.0) AS score
+                FROM parts_fts WHERE parts_fts MATCH ?
+            ) m ON m.part_id = p.id
+        '''
+        params.append(match)
+        order_by = 'm.score ASC, ' + order_by
+    elif match:
+        conditions.append('''p.id IN (
+            SELECT p.id
+            FROM parts p
+            LEFT JOIN alt_parts ap ON p.id = ap.part_id
+            LEFT JOIN vehicles v ON p.vehicle_id = v.id
+            WHERE lower(p.name) LIKE ? OR lower(p.part_number) LIKE ?
+            OR lower(ap.manufacturer) LIKE ? OR lower(ap.part_number) LIKE ?
+            OR lower(v.name) LIKE ? OR lower(v.model) LIKE ?
+        )''')
+        params += [f'%{search_term}%'] * 6
+    query += '''
+        LEFT JOIN vehicles v ON p.vehicle_id = v.id
+        LEFT JOIN alt_parts ap ON ap.part_id = p.id
+    '''
+    if vehicle_id is not None:
+        conditions.append('p.vehicle_id = ?')
+        params.append(vehicle_id)
+    if part_ids is not None:
+        conditions.append('p.id IN (SELECT value FROM json_each(?))')
+        params.append(id_list(part_ids))
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY ' + order_by
+    parts = []
+    for row in conn.execute(query, params):
+        if not parts or parts[-1][0][0] != row[0]:
+            parts.append((tuple('' if x is None else x for x in row[:7]), []))
+        if row[7] is not None:
+            parts[-1][1].append(row[7:])
+    return parts
+
+DISPLAY_DATE_FORMAT = '%d/%m/%Y'
+
+@functools.lru_cache(maxsize=8192)
+def parse_service_date(value):
+    # Service dates are stored as ISO-8601 (YYYY-MM-DD)
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+def to_display_date(value):
+    service_date = parse_service_date(value)
+    return service_date.strftime(DISPLAY_DATE_FORMAT) if service_date else value
+
+def from_display_date(value):
+    return datetime.strptime(value, DISPLAY_DATE_FORMAT).date().isoformat()
+
+def latest_services_by_vehicle(conn, vehicle_id=None):
+    """Map vehicle id -> its two most recent services as [(date, service_id, odometer), ...], newest first.
+
+    Two are kept so every service can find the latest *other* service of its
+    vehicle; each vehicle costs one probe of idx_services_vehicle_date.
+    """
+    query = '''
+        SELECT s.vehicle_id, s.id, s.date, s.odometer
+        FROM vehicles v
+        JOIN services s ON s.id IN (
+            SELECT id FROM services WHERE vehicle_id = v.id ORDER BY date DESC, id DESC LIMIT 2
+        )
+    '''
+    params = []
+    if vehicle_id:
+        query += ' WHERE v.id = ?'
+        params.append(vehicle_id)
+    query += ' ORDER BY s.vehicle_id, s.date DESC, s.id DESC'
+    latest = {}
+    for row_vehicle_id, service_id, date, odometer in conn.execute(query, params):
+        service_date = parse_service_date(date)
+        if service_date is not None:
+            latest.setdefault(row_vehicle_id, []).append((service_date, service_id, odometer))
+    return latest
+
+def service_status(service_id, vehicle_id, date, odometer, interval_miles, interval_days, latest, today):
+    """Return (next_date, next_odometer, is_overdue) for one service row, given latest_services_by_vehicle()."""
+    service_date = parse_service_date(date)
+    if service_date is None:
+        return None, None, False
+    next_date = service_date + timedelta(days=interval_days) if interval_days else None
+    next_odometer = int(odometer) + interval_miles if interval_miles and odometer else None
+    is_overdue = False
+    if interval_days or interval_miles:
+        last_service = next((entry for entry in latest.get(vehicle_id, ()) if entry[1] != service_id), None)
+        if last_service:
+            last_date, _, last_odometer = last_service
+            if interval_days and (today - last_date).days > interval_days:
+                is_overdue = True
+            if interval_miles and last_odometer and odometer and (int(odometer) - int(last_odometer)) > interval_miles:
+                is_overdue = True
+        elif interval_days and (today - service_date).days > interval_days:
+            is_overdue = True
+    return next_date, next_odometer, is_overdue
+
+def service_ids_for_vehicle(conn, vehicle_id):
+    return [row[0] for row in conn.execute('SELECT id FROM services WHERE vehicle_id = ?', (vehicle_id,))]
+
+def fetch_services(conn, vehicle_id=None, search_term=None, service_ids=None):
+    """Return [(row_values, next_date, next_odometer, is_overdue), ...] ordered by id.
+
+    row_values holds the raw column values (ISO date); formatting is left to the caller.
+    service_ids narrows the result to those services, for patching rows after a write.
+    """
+    query_base = '''
+        SELECT s.id, COALESCE(v.name || (CASE WHEN v.model IS NOT NULL THEN ' (' || v.model || ')' ELSE '' END), v.name) AS vehicle_display,
+               GROUP_CONCAT(st.name, ', ') AS service_types, s.date, s.odometer, s.description, s.cost, s.service_interval_miles, s.service_interval_days,
+               s.vehicle_id
+        FROM services s
+        JOIN vehicles v ON s.vehicle_id = v.id
+        LEFT JOIN service_service_types sst ON s.id = sst.service_id
+        LEFT JOIN service_types st ON sst.service_type_id = st.id
+        {where_clause}
+        GROUP BY s.id
+        ORDER BY s.id ASC
+    '''
+    conditions = []
+    params = []
+    if search_term:
+        conditions.append('''(lower(v.name) LIKE ? OR lower(v.model) LIKE ? OR lower(s.description) LIKE ?
+            OR s.id IN (SELECT service_id FROM service_service_types
+                        WHERE service_type_id IN (SELECT id FROM service_types WHERE lower(name) LIKE ?)))''')
+        params += [f'%{search_term}%'] * 4
+    if vehicle_id:
+        conditions.append('s.vehicle_id = ?')
+        params.append(vehicle_id)
+    if service_ids is not None:
+        conditions.append('s.id IN (SELECT value FROM json_each(?))')
+        params.append(id_list(service_ids))
+    where_clause = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+    rows = conn.execute(query_base.format(where_clause=where_clause), params).fetchall()
+    if service_ids is not None and not vehicle_id:
+        # Only probe the vehicles the patched services belong to
+        latest = {}
+        for row_vehicle_id in {row[9] for row in rows}:
+            latest.update(latest_services_by_vehicle(conn, row_vehicle_id))
+    else:
+        latest = latest_services_by_vehicle(conn, vehicle_id)
+    today = datetime.now()
+    services = []
+    for row in rows:
+        service_id, vehicle_name, service_types, date, odometer, description, cost, interval_miles, interval_days, row_vehicle_id = (
+            '' if x is None else x for x in row)
+        status = service_status(service_id, row_vehicle_id, date, odometer, interval_miles, interval_days, latest, today)
+        services.append(((service_id, vehicle_name, service_types, date, odometer, description, cost, interval_miles, interval_days),) + status)
+    return services
+
+
+# Keyset paging
+
+PAGE_ROWS = 200
+
+# Sort keys of the paged views, ordered like db.sort_key() orders the same column
+# unpaged: text case-insensitively on its displayed value. Vehicle keys on the
+# vehicle label (v is joined in for it), then the vehicle id, so the page can be
+# walked vehicle by vehicle through the label index; vehicles that share a label
+# are not interleaved as they are unpaged. Nullable columns are folded to a value
+# so that keyset comparisons never meet a NULL; ties are broken by id.
+PARTS_PAGE_KEYS = {
+    'ID': 'p.id',
+    'Name': 'p.name COLLATE NOCASE',
+    'Manufacturer': "IFNULL(p.manufacturer, '') COLLATE NOCASE",
+    'Part Number': 'p.part_number COLLATE NOCASE',
+    'Description': "IFNULL(p.description, '') COLLATE NOCASE",
+    'Price': 'IFNULL(p.price, 0)',
+    'Vehicle': ("(v.name || (CASE WHEN v.year IS NOT NULL AND v.model IS NOT NULL THEN ' (' || v.year || ' ' || v.model || ')' ELSE '' END)) COLLATE NOCASE", 'v.id'),
+}
+SERVICES_PAGE_KEYS = {
+    'ID': 's.id',
+    'Vehicle': ("(v.name || (CASE WHEN v.model IS NOT NULL THEN ' (' || v.model || ')' ELSE '' END)) COLLATE NOCASE", 'v.id'),
+    'Date': 's.date',
+    'Odometer': 'IFNULL(s.odometer, 0)',
+    'Description': "IFNULL(s.description, '') COLLATE NOCASE",
+    'Cost': 'IFNULL(s.cost, 0)',
+    'Interval Miles': 'IFNULL(s.service_interval_miles, 0)',
+    'Interval Days': 'IFNULL(s.service_interval_days, 0)',
+}
+# Columns whose page keys are numbers; a jump value for them has to be one
+NUMERIC_PAGE_COLUMNS = {'ID', 'Price', 'Odometer', 'Cost', 'Interval Miles', 'Interval Days'}
+
+def _page_keys(conn, table, key, vehicle_id, reverse, after, before, start, end, limit):
+    # Return ([(sort key[, tie-breaker], id), ...] in display order, has_prev, has_next) for one page of table
+    alias = table[0]
+    columns = (key if isinstance(key, tuple) else (key,)) + (f'{alias}.id',)
+    row_value = f'({", ".join(columns)})'
+    placeholders = f'({", ".join("?" * len(columns))})'
+    backward = before is not None or end
+    descending = reverse != backward
+    filters = []
+    params = []
+    if vehicle_id:
+        filters.append(f'{alias}.vehicle_id = ?')
+        params.append(vehicle_id)
+
+    join = f' JOIN vehicles v ON v.id = {alias}.vehicle_id' if 'v.' in columns[0] else ''
+
+    def beyond(edge, descending):
+        # Rows past edge; the plain range term lets SQLite seek an index on a COLLATE key, the row value alone doesn't
+        return ([f'{columns[0]} {"<=" if descending else ">="} ?', f'{row_value} {"<" if descending else ">"} {placeholders}'],
+                [edge[0]] + list(edge))
+
+    def page(conditions, condition_params, order, count):
+        where_clause = ' WHERE ' + ' AND '.join(filters + conditions) if filters or conditions else ''
+        order_by = ', '.join(f'{column} {order}' for column in columns)
+        return conn.execute(f'SELECT {", ".join(columns)} FROM {table} {alias}{join}{where_clause} ORDER BY {order_by} LIMIT ?',
+                            params + condition_params + [count]).fetchall()
+
+    conditions = []
+    condition_params = []
+    if after is not None or before is not None:
+        conditions, condition_params = beyond(after if after is not None else before, descending)
+    elif start is not None:
+        conditions.append(f'{columns[0]} {"<=" if reverse else ">="} ?')
+        condition_params.append(start)
+    keys = page(conditions, condition_params, 'DESC' if descending else 'ASC', limit + 1)
+    more = len(keys) > limit
+    keys = keys[:limit]
+    if backward:
+        keys.reverse()
+        return keys, more, before is not None
+    has_prev = after is not None
+    if start is not None and keys:
+        # A jump can land anywhere; probe for a row before the first one
+        has_prev = bool(page(*beyond(keys[0], not reverse), 'ASC' if reverse else 'DESC', 1))
+    return keys, has_prev, more
+
+def fetch_parts_page(conn, vehicle_id=None, sort_column='ID', reverse=False, after=None, before=None, start=None, end=False, limit=PAGE_ROWS):
+    """Return (parts, first, last, has_prev, has_next) for one keyset page of the parts listing.
+
+    parts is shaped like fetch_parts(), in sort_column order. first and last are the
+    keys of the page's edge rows, (sort key, id) or (sort key, tie-breaker, id); pass
+    them back as before/after for the neighbouring pages. start jumps to the first row whose sort key is at or past it,
+    and end=True returns the final page. Only the page's rows and their alternatives
+    are read, so the cost does not grow with the catalogue when the sort key is indexed.
+    """
+    keys, has_prev, has_next = _page_keys(conn, 'parts', PARTS_PAGE_KEYS[sort_column], vehicle_id, reverse,
+                                          after, before, start, end, limit)
+    order = {key[-1]: position for position, key in enumerate(keys)}
+    parts = sorted(fetch_parts(conn, part_ids=list(order)), key=lambda part: order[part[0][0]])
+    return parts, keys[0] if keys else None, keys[-1] if keys else None, has_prev, has_next
+
+def fetch_services_page(conn, vehicle_id=None, sort_column='ID', reverse=False, after=None, before=None, start=None, end=False, limit=PAGE_ROWS):
+    """Return (services, first, last, has_prev, has_next) for one keyset page of the services listing.
+
+    Like fetch_parts_page(); services is shaped like fetch_services(), and only the
+    vehicles on the page are probed for overdue status.
+    """
+    keys, has_prev, has_next = _page_keys(conn, 'services', SERVICES_PAGE_KEYS[sort_column], vehicle_id, reverse,
+                                          after, before, start, end, limit)
+    order = {key[-1]: position for position, key in enumerate(keys)}
+    services = sorted(fetch_services(conn, service_ids=list(order)), key=lambda service: order[service[0][0]])
+    return services, keys[0] if keys else None, keys[-1] if keys else None, has_prev, has_next
+
+def estimate_rows(conn, table, vehicle_id=None):
+    """Return about how many rows parts or services hold (one vehicle's, if given), for the pager.
+
+    A vehicle's rows are counted through its index. The whole table is taken from the
+    ANALYZE statistics when there are any and from the id range otherwise, so neither
+    walks the table.
+    """
+    if vehicle_id:
+        return conn.execute(f'SELECT COUNT(*) FROM {table} WHERE vehicle_id = ?', (vehicle_id,)).fetchone()[0]
+    if has_table(conn, 'sqlite_stat1'):
+        row = conn.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = ? LIMIT 1', (table,)).fetchone()
+        if row:
+            return int(row[0].split()[0])
+    # Separate subqueries so each is answered from the end of the rowid b-tree
+    low, high = conn.execute(f'SELECT (SELECT min(id) FROM {table}), (SELECT max(id) FROM {table})').fetchone()
+    return high - low + 1 if high is not None else 0
+
+class PitStopError(Exception):
+    """A data rule refused an operation (duplicate part number, record still in use, database from a newer PitStop, ...)."""
+
+class OperationCancelled(PitStopError):
+    """Raised from a progress callback to stop a long export, backup or restore."""
+
+def database_path():
+    db_dir = os.path.join(os.environ.get('XDG_DATA_HOME', os.path.expanduser('~/.local/share')), 'pitstop')
+    os.makedirs(db_dir, exist_ok=True)
+    return os.path.join(db_dir, 'pitstop.db')
+
+# Instrumentation. Off unless enable_instrumentation() is called (PITSTOP_TRACE=1
+# or --trace); connections opened afterwards time every statement they run.
+
+TRACE_ENV = 'PITSTOP_TRACE'
+SLOW_MS = 100
+SLOW_LOG_BYTES = 1024 * 1024
+SLOW_LOG_BACKUPS = 3
+# Upper bounds of the histogram buckets in milliseconds; the last bucket takes anything slower
+HISTOGRAM_BOUNDS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+instrumentation = None
+
+class Histogram:
+    """Timings of one operation, counted per HISTOGRAM_BOUNDS bucket."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.statements = 0
+
+    def add(self, ms, statements=0):
+        self.buckets[bisect.bisect_left(HISTOGRAM_BOUNDS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+        self.statements += statements
+
+    def percentile(self, fraction):
+        # Upper bound of the bucket that holds the fraction-th timing, capped at the slowest one
+        seen = 0
+        for bound, count in zip(HISTOGRAM_BOUNDS + (self.max,), self.buckets):
+            seen += count
+            if count and seen >= fraction * self.count:
+                return min(bound, self.max)
+        return self.max
+
+class Instrumentation:
+    """Timing histograms for SQL statements, database jobs and view refreshes.
+
+    record(category, name, ms) files a timing under (category, name); anything
+    that took slow_ms or longer also goes to the rotating slow log at log_path.
+    trace(conn) times every statement run on a connection opened with
+    factory=TracedConnection and counts the statements each thread starts, so
+    timer() can report how many statements a job issued. Thread-safe.
+    """
+
+    def __init__(self, slow_ms=SLOW_MS, log_path=None, max_bytes=SLOW_LOG_BYTES, backups=SLOW_LOG_BACKUPS):
+        self.slow_ms = slow_ms
+        self.log_path = log_path
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._log = None
+        if log_path:
+            self._log = logging.Logger('pitstop.slow')
+            handler = logging.handlers.RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8', delay=True)
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            self._log.addHandler(handler)
+
+    def record(self, category, name, ms, statements=0):
+        with self._lock:
+            histogram = self._histograms.get((category, name))
+            if histogram is None:
+                histogram = self._histograms[(category, name)] = Histogram()
+            histogram.add(ms, statements)
+        if self._log is not None and ms >= self.slow_ms:
+            self._log.warning('%8.1f ms  %-8s %s%s', ms, category, name, f'  [{statements} statements]' if statements else '')
+
+    @contextmanager
+    def timer(self, category, name):
+        statements = self.statements()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(category, name, (time.perf_counter() - start) * 1000, self.statements() - statements)
+
+    @contextmanager
+    def operation(self, name):
+        # Times a loader; jobs it submits on this thread are filed under its name
+        outer = self.current_operation()
+        self._local.operation = name
+        try:
+            with self.timer('loader', name):
+                yield
+        finally:
+            self._local.operation = outer
+
+    def current_operation(self):
+        return getattr(self._local, 'operation', None)
+
+    def statements(self):
+        # Statements started on this thread so far
+        return getattr(self._local, 'statements', 0)
+
+    def _count_statement(self, sql):
+        # Trigger bodies are reported as "-- TRIGGER name"; they belong to the statement that fired them
+        if not sql.startswith('--'):
+            self._local.statements = self.statements() + 1
+
+    def trace(self, conn):
+        conn.instrumentation = self
+        conn.set_trace_callback(self._count_statement)
+
+    def stats(self):
+        """Return one dict per (category, name), most total time first."""
+        with self._lock:
+            stats = [{'category': category, 'name': name, 'count': h.count, 'total_ms': h.total,
+                      'mean_ms': h.total / h.count, 'p50_ms': h.percentile(0.5), 'p95_ms': h.percentile(0.95),
+                      'max_ms': h.max, 'statements': h.statements, 'buckets': list(h.buckets)}
+                     for (category, name), h in self._histograms.items()]
+        stats.sort(key=lambda stat: stat['total_ms'], reverse=True)
+        return stats
+
+    def summary(self, limit=20):
+        lines = [f"{'total ms':>10} {'count':>7} {'mean':>8} {'p95':>8} {'max':>8}  operation"]
+        for stat in self.stats()[:limit]:
+            lines.append(f"{stat['total_ms']:10.1f} {stat['count']:7} {stat['mean_ms']:8.2f} {stat['p95_ms']:8.2f} {stat['max_ms']:8.2f}  "
+                         f"{stat['category']} {stat['name'][:100]}")
+        return '\n'.join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+
+    def close(self):
+        if self._log is not None:
+            for handler in self._log.handlers:
+                handler.close()
+
+class TracedCursor(sqlite3.Cursor):
+    # Times each statement from execute() until its rows have been fetched
+    _statement = None
+
+    def execute(self, sql, parameters=()):
+        return self._run(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(super().executemany, sql, seq_of_parameters)
+
+    def _run(self, run, sql, parameters):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return run(sql, parameters)
+        finally:
+            self._statement = [sql, time.perf_counter() - start]
+            if self.description is None:
+                self._finish()
+
+    def _fetch(self, fetch, *args):
+        start = time.perf_counter()
+        rows = fetch(*args)
+        if self._statement is not None:
+            self._statement[1] += time.perf_counter() - start
+        return rows
+
+    def fetchone(self):
+        row = self._fetch(super().fetchone)
+        self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._fetch(super().fetchmany, size)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(super().fetchall)
+        self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Rows read by iterating over the cursor are not timed, only the execute() call
+        self._finish()
+
+    def _finish(self):
+        statement, self._statement = self._statement, None
+        instrumentation = self.connection.instrumentation
+        if statement is not None and instrumentation is not None:
+            instrumentation.record('sql', ' '.join(statement[0].split()), statement[1] * 1000)
+
+class TracedConnection(sqlite3.Connection):
+    instrumentation = None
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def instrumentation_requested():
+    return os.environ.get(TRACE_ENV, '') not in ('', '0')
+
+def enable_instrumentation(db_path, slow_ms=None, log_path=None):
+    """Turn instrumentation on for connections opened from now on and return it.
+
+    slow_ms and log_path default to $PITSTOP_SLOW_MS and $PITSTOP_SLOW_LOG, else
+    SLOW_MS and slow.log next to db_path, the database being traced.
+    """
+    global instrumentation
+    if instrumentation is None:
+        if slow_ms is None:
+            slow_ms = float(os.environ.get('PITSTOP_SLOW_MS', SLOW_MS))
+        log_path = log_path or os.environ.get('PITSTOP_SLOW_LOG') or os.path.join(os.path.dirname(os.path.abspath(db_path)), 'slow.log')
+        instrumentation = Instrumentation(slow_ms, log_path)
+    return instrumentation
+
+@contextmanager
+def timed(category, name):
+    # Times the block when instrumentation is on; costs next to nothing when it is off
+    if instrumentation is None:
+        yield
+    else:
+        with instrumentation.timer(category, name):
+            yield
+
+@contextmanager
+def loader(name):
+    if instrumentation is None:
+        yield
+    else:
+        with instrumentation.operation(name):
+            yield
+
+# Applied to every connection. WAL only fsyncs at checkpoints with synchronous=NORMAL,
+# and lets readers carry on while the writer commits.
+PRAGMAS = [
+    ('synchronous', 'NORMAL'),
+    ('mmap_size', 256 * 1024 * 1024),
+    ('cache_size', -32 * 1024),  # KiB
+    ('temp_store', 'MEMORY'),
+    ('foreign_keys', 'ON'),
+]
+
+def connect(db_path=None, readonly=False):
+    """Open a tuned connection to the database.
+
+    The writer connection (the default) switches the file to WAL and brings it
+    up to the current schema; readonly=True opens it with mode=ro. Connections
+    may be handed between threads, but only used by one thread at a time.
+    With instrumentation enabled, every statement the connection runs is timed.
+    """
+    db_path = db_path or database_path()
+    factory = sqlite3.Connection if instrumentation is None else TracedConnection
+    if readonly:
+        conn = sqlite3.connect(f'file:{urllib.parse.quote(db_path)}?mode=ro', uri=True, check_same_thread=False, factory=factory)
+    else:
+        conn = sqlite3.connect(db_path, check_same_thread=False, factory=factory)
+    if instrumentation is not None:
+        instrumentation.trace(conn)
+    if not readonly:
+        conn.execute('PRAGMA journal_mode = WAL')
+        migrate_database(conn)
+    for name, value in PRAGMAS:
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+class ConnectionPool:
+    """One writer connection plus a pool of read-only connections.
+
+    with pool.writer() as conn: serializes writes on the single writer and rolls
+    back if the block fails. with pool.reader() as conn: borrows one of up to
+    `readers` read-only connections, opened on first use; under WAL these run
+    alongside the writer instead of waiting for its commits. Callbacks passed to
+    watch() are called with the writer connection at the end of every writer block.
+    """
+
+    def __init__(self, db_path=None, readers=2):
+        self.db_path = db_path or database_path()
+        self._writer = connect(self.db_path)
+        self._write_lock = threading.Lock()
+        self._watchers = []
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(readers)
+        self._readers = []
+
+    def watch(self, callback):
+        self._watchers.append(callback)
+
+    @contextmanager
+    def writer(self):
+        with self._write_lock:
+            try:
+                yield self._writer
+            except BaseException:
+                if self._writer.in_transaction:
+                    self._writer.rollback()
+                raise
+            finally:
+                for callback in self._watchers:
+                    callback(self._writer)
+
+    @contextmanager
+    def reader(self):
+        with self._slots:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = connect(self.db_path, readonly=True)
+                self._readers.append(conn)
+            try:
+                yield conn
+            finally:
+                # End the read transaction so the next checkpoint is not held back
+                if conn.in_transaction:
+                    conn.rollback()
+                self._idle.put(conn)
+
+    def close(self):
+        for conn in self._readers:
+            conn.close()
+        self._readers = []
+        self._idle = queue.LifoQueue()
+        self._writer.close()
+
+PART_CACHE_SIZE = 10000
+
+class LookupCache:
+    """Vehicles, service types and part headers kept in memory for the Tk thread.
+
+    Lookups are answered from memory and only go to SQLite on a miss. Writes made
+    by the app call invalidate() with the ids they touched; commits from anywhere
+    else (the command line, another instance) change PRAGMA data_version on the
+    cache's own read-only connection and drop everything. hits and misses count
+    the lookups answered each way.
+
+    data_version only says that something committed since the last look, not how
+    many commits, so invalidate() can't tell the app's commit from one made beside
+    it. Register after_write() with ConnectionPool.watch(): the writer's own
+    data_version moves only for other connections' commits. Without it,
+    invalidate() drops everything.
+    """
+
+    def __init__(self, db_path=None):
+        self._conn = connect(db_path, readonly=True)
+        self._lock = threading.Lock()
+        self._data_version = None
+        self._written_version = None
+        self._writer_version = None
+        self._foreign = False
+        self._tables = {'vehicles': None, 'service_types': None}
+        self._stale = {'vehicles': set(), 'service_types': set()}
+        self._parts = {}
+        self.hits = self.misses = 0
+
+    def _check_version(self):
+        version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        if version != self._data_version:
+            self._data_version = version
+            self._clear()
+
+    def _clear(self):
+        self._tables = dict.fromkeys(self._tables)
+        self._parts = {}
+        self._foreign = False
+
+    def _table(self, kind, fetch):
+        self._check_version()
+        rows = self._tables[kind]
+        if rows is None:
+            self.misses += 1
+            rows = self._tables[kind] = {row[0]: row for row in fetch(self._conn)}
+            self._stale[kind] = set()
+        elif self._stale[kind]:
+            # Refetch only the rows written since the last lookup
+            self.misses += 1
+            ids, self._stale[kind] = self._stale[kind], set()
+            for id_ in ids:
+                rows.pop(id_, None)
+            rows.update((row[0], row) for row in fetch(self._conn, ids))
+            rows = self._tables[kind] = dict(sorted(rows.items()))
+        else:
+            self.hits += 1
+        return rows
+
+    def vehicles(self):
+        """Return [(id, name, year, model), ...] ordered by id, like fetch_vehicles()."""
+        with self._lock:
+            return list(self._table('vehicles', fetch_vehicles).values())
+
+    def vehicle(self, vehicle_id):
+        with self._lock:
+            return self._table('vehicles', fetch_vehicles).get(int(vehicle_id))
+
+    def service_types(self):
+        """Return [(id, name), ...] ordered by id, like fetch_service_types()."""
+        with self._lock:
+            return list(self._table('service_types', fetch_service_types).values())
+
+    def part(self, part_id):
+        """Return (id, name, part_number, vehicle_id) for one part, or None."""
+        part_id = int(part_id)
+        with self._lock:
+            self._check_version()
+            part = self._parts.get(part_id)
+            if part:
+                self.hits += 1
+                return part
+            self.misses += 1
+            part = self._conn.execute('SELECT id, name, part_number, vehicle_id FROM parts WHERE id = ?', (part_id,)).fetchone()
+            if part:
+                if len(self._parts) >= PART_CACHE_SIZE:
+                    del self._parts[next(iter(self._parts))]
+                self._parts[part_id] = part
+            return part
+
+    def invalidate(self, kind, ids=None):
+        """Forget the given ids of kind ('vehicles', 'service_types' or 'parts'), or all of them."""
+        with self._lock:
+            if kind == 'parts':
+                if ids is None:
+                    self._parts = {}
+                for id_ in ids or ():
+                    self._parts.pop(int(id_), None)
+            elif ids is None:
+                self._tables[kind] = None
+            else:
+                self._stale[kind].update(int(id_) for id_ in ids)
+            # The ids above account for the app's own commits; anything else means starting over
+            version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+            if version != self._data_version and (self._foreign or version != self._written_version):
+                self._clear()
+            self._data_version = version
+
+    def after_write(self, writer):
+        """Note an app write that just ended on writer (a ConnectionPool.watch() callback)."""
+        with self._lock:
+            # Read the cache's version first: a commit by someone else that lands before
+            # it also moves the writer's version read after it
+            self._written_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+            writer_version = writer.execute('PRAGMA data_version').fetchone()[0]
+            if writer_version != self._writer_version:
+                # Also true for the first write, when nothing has been seen yet
+                self._foreign = True
+            self._writer_version = writer_version
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'vehicles': len(self._tables['vehicles'] or ()),
+                    'service_types': len(self._tables['service_types'] or ()), 'parts': len(self._parts)}
+
+    def close(self):
+        self._conn.close()
+
+# Parts and alternative parts
+
+def part_vehicle_id(conn, part_id):
+    row = conn.execute('SELECT vehicle_id FROM parts WHERE id = ?', (part_id,)).fetchone()
+    return row[0] if row else None
+
+def part_ids_for_vehicle(conn, vehicle_id):
+    return [row[0] for row in conn.execute('SELECT id FROM parts WHERE vehicle_id = ?', (vehicle_id,))]
+
+def add_part(conn, name, manufacturer, part_number, description, price, vehicle_id):
+    """Insert a part and return its id."""
+    try:
+        cursor = conn.execute('INSERT INTO parts (name, manufacturer, part_number, description, price, vehicle_id) VALUES (?, ?, ?, ?, ?, ?)',
+                              (name, manufacturer, part_number, description or None, price, vehicle_id))
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        raise PitStopError('Part number already exists for this vehicle. Please use a unique part number.')
+    conn.commit()
+    return cursor.lastrowid
+
+def update_part(conn, part_id, name, manufacturer, part_number, description, price, vehicle_id):
+    # The new part_number must stay unique for this vehicle (excluding the part itself)
+    if conn.execute('SELECT id FROM parts WHERE part_number = ? AND vehicle_id = ? AND id != ?',
+                    (part_number, vehicle_id, part_id)).fetchone():
+        raise PitStopError('Part number already exists for this vehicle. Please use a unique part number.')
+    conn.execute('UPDATE parts SET name=?, manufacturer=?, part_number=?, description=?, price=?, vehicle_id=? WHERE id=?',
+                 (name, manufacturer, part_number, description or None, price, vehicle_id, part_id))
+    conn.commit()
+    return part_id
+
+def delete_part(conn, part_id):
+    conn.execute('DELETE FROM service_parts WHERE part_id=?', (part_id,))
+    conn.execute('DELETE FROM alt_parts WHERE part_id=?', (part_id,))
+    conn.execute('DELETE FROM parts WHERE id=?', (part_id,))
+    conn.commit()
+    return part_id
+
+def fetch_alt_parts(conn, part_id):
+    """Return [(alt_id, manufacturer, part_number), ...] for one part."""
+    return conn.execute('SELECT alt_id, manufacturer, part_number FROM alt_parts WHERE part_id = ? ORDER BY alt_id ASC',
+                        (part_id,)).fetchall()
+
+def add_alt_part(conn, part_id, manufacturer, part_number):
+    """Insert an alternative for part_id and return its alt_id (e.g. 1a, 1b, ...)."""
+    vehicle_id = part_vehicle_id(conn, part_id)
+    # The part number must be unique for this vehicle across parts and alt_parts
+    if conn.execute('SELECT id FROM parts WHERE part_number = ? AND vehicle_id = ?', (part_number, vehicle_id)).fetchone():
+        raise PitStopError('Part number already exists for this vehicle in main parts.')
+    if conn.execute('SELECT alt_id FROM alt_parts WHERE part_number = ? AND part_id IN (SELECT id FROM parts WHERE vehicle_id = ?)',
+                    (part_number, vehicle_id)).fetchone():
+        raise PitStopError('Part number already exists for this vehicle in alternative parts.')
+    used_letters = [alt_id[len(str(part_id)):] for alt_id, _, _ in fetch_alt_parts(conn, part_id) if alt_id.startswith(str(part_id))]
+    next_letter = 'a'
+    while next_letter in used_letters:
+        next_letter = chr(ord(next_letter) + 1)
+    alt_id = f"{part_id}{next_letter}"
+    conn.execute('INSERT INTO alt_parts (alt_id, part_id, manufacturer, part_number) VALUES (?, ?, ?, ?)',
+                 (alt_id, part_id, manufacturer, part_number))
+    conn.commit()
+    return alt_id
+
+def remove_alt_part(conn, alt_id):
+    """Delete an alternative part and return the id of its main part."""
+    if conn.execute('SELECT COUNT(*) FROM service_parts WHERE alt_part_id = ?', (alt_id,)).fetchone()[0] > 0:
+        raise PitStopError('Cannot delete alternative part used in services')
+    row = conn.execute('SELECT part_id FROM alt_parts WHERE alt_id = ?', (alt_id,)).fetchone()
+    conn.execute('DELETE FROM alt_parts WHERE alt_id = ?', (alt_id,))
+    conn.commit()
+    return row[0] if row else None
+
+PART_CHOICES_LIMIT = 50
+
+def search_part_choices(conn, search_term=None, vehicle_id=None, limit=PART_CHOICES_LIMIT):
+    """Return up to limit [(part_id, alt_id, name, part_number, alt_manufacturer, alt_part_number), ...] for the part picker.
+
+    Main and alternative part numbers starting with search_term come first, from
+    the NOCASE part number indexes, then parts with a word in their name, number
+    or alternatives starting with it, from parts_fts in id order (ranking would
+    score every match of a common word). alt_id and the alt columns are None for
+    main parts. Without a search term the first parts by id are
+    listed with their alternatives.
+    """
+    vehicle_filter = ' AND p.vehicle_id = ?' if vehicle_id else ''
+    vehicle_params = [vehicle_id] if vehicle_id else []
+    if not search_term:
+        where_clause = ' WHERE p.vehicle_id = ?' if vehicle_id else ''
+        choices = conn.execute(f'SELECT p.id, NULL, p.name, p.part_number, NULL, NULL FROM parts p{where_clause} ORDER BY p.id LIMIT ?',
+                               vehicle_params + [limit]).fetchall()
+        choices += conn.execute('''
+            SELECT ap.part_id, ap.alt_id, p.name, p.part_number, ap.manufacturer, ap.part_number
+            FROM alt_parts ap
+            JOIN parts p ON ap.part_id = p.id
+            WHERE ap.part_id IN (SELECT value FROM json_each(?))
+        ''', (id_list(choice[0] for choice in choices),)).fetchall()
+        choices.sort(key=lambda choice: (choice[0], choice[1] or ''))
+        return choices[:limit]
+    # Everything from the prefix up to the prefix followed by the highest code point
+    prefix_range = [search_term, search_term + '\U0010ffff']
+    lookups = [
+        (f'''SELECT p.id, NULL, p.name, p.part_number, NULL, NULL FROM parts p
+            WHERE p.part_number >= ? COLLATE NOCASE AND p.part_number < ? COLLATE NOCASE{vehicle_filter}
+            ORDER BY p.part_number COLLATE NOCASE LIMIT ?''', prefix_range + vehicle_params + [limit]),
+        (f'''SELECT ap.part_id, ap.alt_id, p.name, p.part_number, ap.manufacturer, ap.part_number
+            FROM alt_parts ap
+            JOIN parts p ON ap.part_id = p.id
+            WHERE ap.part_number >= ? COLLATE NOCASE AND ap.part_number < ? COLLATE NOCASE{vehicle_filter}
+            ORDER BY ap.part_number COLLATE NOCASE LIMIT ?''', prefix_range + vehicle_params + [limit]),
+    ]
+    match = fts_query(search_term)
+    if match and has_table(conn, 'parts_fts'):
+        lookups.append((f'''SELECT p.id, NULL, p.name, p.part_number, NULL, NULL
+            FROM parts_fts CROSS JOIN parts p ON p.id = parts_fts.rowid
+            WHERE parts_fts MATCH ?{vehicle_filter}
+            LIMIT ?''', [f'{{name part_number alt_parts}} : ({match})'] + vehicle_params + [limit]))
+    else:
+        lookups.append((f'SELECT p.id, NULL, p.name, p.part_number, NULL, NULL FROM parts p WHERE lower(p.name) LIKE ?{vehicle_filter} LIMIT ?',
+                        [f'%{search_term.lower()}%'] + vehicle_params + [limit]))
+    choices = {}
+    for query, params in lookups:
+        for choice in conn.execute(query, params):
+            choices.setdefault(choice[:2], choice)
+            if len(choices) == limit:
+                return list(choices.values())
+    return list(choices.values())
+
+# Vehicles
+
+def fetch_vehicles(conn, vehicle_ids=None):
+    """Return [(id, name, year, model), ...] ordered by id, optionally only vehicle_ids."""
+    query = 'SELECT id, name, year, model FROM vehicles'
+    params = []
+    if vehicle_ids is not None:
+        query += ' WHERE id IN (SELECT value FROM json_each(?))'
+        params.append(id_list(vehicle_ids))
+    return conn.execute(query + ' ORDER BY id ASC', params).fetchall()
+
+def add_vehicle(conn, name, year, model):
+    cursor = conn.execute('INSERT INTO vehicles (name, year, model) VALUES (?, ?, ?)', (name, year, model or None))
+    conn.commit()
+    return cursor.lastrowid
+
+def update_vehicle(conn, vehicle_id, name, year, model):
+    conn.execute('UPDATE vehicles SET name=?, year=?, model=? WHERE id=?', (name, year, model or None, vehicle_id))
+    conn.commit()
+    return vehicle_id
+
+def delete_vehicle(conn, vehicle_id):
+    if conn.execute('SELECT COUNT(*) FROM parts WHERE vehicle_id=?', (vehicle_id,)).fetchone()[0] > 0:
+        raise PitStopError('Cannot delete vehicle with associated parts')
+    if conn.execute('SELECT COUNT(*) FROM services WHERE vehicle_id=?', (vehicle_id,)).fetchone()[0] > 0:
+        raise PitStopError('Cannot delete vehicle with associated services')
+    conn.execute('DELETE FROM vehicles WHERE id=?', (vehicle_id,))
+    conn.commit()
+    return vehicle_id
+
+# Service types
+
+def fetch_service_types(conn, type_ids=None):
+    """Return [(id, name), ...] ordered by id, optionally only type_ids."""
+    query = 'SELECT id, name FROM service_types'
+    params = []
+    if type_ids is not None:
+        query += ' WHERE id IN (SELECT value FROM json_each(?))'
+        params.append(id_list(type_ids))
+    return conn.execute(query + ' ORDER BY id ASC', params).fetchall()
+
+def service_ids_for_type(conn, type_id):
+    return [row[0] for row in conn.execute('SELECT service_id FROM service_service_types WHERE service_type_id = ?', (type_id,))]
+
+def add_service_type(conn, name):
+    cursor = conn.execute('INSERT INTO service_types (name) VALUES (?)', (name,))
+    conn.commit()
+    return cursor.lastrowid
+
+def update_service_type(conn, type_id, name):
+    conn.execute('UPDATE service_types SET name=? WHERE id=?', (name, type_id))
+    conn.commit()
+    return type_id
+
+def delete_service_type(conn, type_id):
+    if conn.execute('SELECT COUNT(*) FROM service_service_types WHERE service_type_id=?', (type_id,)).fetchone()[0] > 0:
+        raise PitStopError('Cannot delete service type used in services')
+    conn.execute('DELETE FROM service_types WHERE id=?', (type_id,))
+    conn.commit()
+    return type_id
+
+# Services and service parts
+
+def service_vehicle_id(conn, service_id):
+    row = conn.execute('SELECT vehicle_id FROM services WHERE id = ?', (service_id,)).fetchone()
+    return row[0] if row else None
+
+def service_type_ids(conn, service_id):
+    return [row[0] for row in conn.execute('SELECT service_type_id FROM service_service_types WHERE service_id = ?', (service_id,))]
+
+def service_links(conn, service_id):
+    """Return (vehicle_id, [service_type_id, ...]) for one service."""
+    return service_vehicle_id(conn, service_id), service_type_ids(conn, service_id)
+
+def _set_service_types(conn, service_id, type_ids):
+    conn.execute('DELETE FROM service_service_types WHERE service_id=?', (service_id,))
+    conn.executemany('INSERT INTO service_service_types (service_id, service_type_id) VALUES (?, ?)',
+                     [(service_id, type_id) for type_id in type_ids])
+
+def add_service(conn, vehicle_id, date, odometer, description, cost, interval_miles, interval_days, type_ids=()):
+    """Insert a service (date in ISO-8601) and return the ids of every service whose row changed.
+
+    That is all services of the vehicle: their overdue status depends on its latest service.
+    """
+    cursor = conn.execute('INSERT INTO services (vehicle_id, date, odometer, description, cost, service_interval_miles, service_interval_days) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                          (vehicle_id, date, odometer, description or None, cost, interval_miles, interval_days))
+    _set_service_types(conn, cursor.lastrowid, type_ids)
+    conn.commit()
+    return service_ids_for_vehicle(conn, vehicle_id)
+
+def update_service(conn, service_id, vehicle_id, date, odometer, description, cost, interval_miles, interval_days, type_ids=()):
+    """Update a service and return the ids of every service whose row changed (see add_service)."""
+    old_vehicle_id = service_vehicle_id(conn, service_id)
+    conn.execute('UPDATE services SET vehicle_id=?, date=?, odometer=?, description=?, cost=?, service_interval_miles=?, service_interval_days=? WHERE id=?',
+                 (vehicle_id, date, odometer, description or None, cost, interval_miles, interval_days, service_id))
+    _set_service_types(conn, service_id, type_ids)
+    conn.commit()
+    affected = set(service_ids_for_vehicle(conn, vehicle_id))
+    if old_vehicle_id != vehicle_id:
+        affected.update(service_ids_for_vehicle(conn, old_vehicle_id))
+    return sorted(affected)
+
+def delete_service(conn, service_id):
+    """Delete a service and return the ids of every service whose row changed, including service_id."""
+    vehicle_id = service_vehicle_id(conn, service_id)
+    conn.execute('DELETE FROM service_parts WHERE service_id=?', (service_id,))
+    conn.execute('DELETE FROM service_service_types WHERE service_id=?', (service_id,))
+    conn.execute('DELETE FROM services WHERE id=?', (service_id,))
+    conn.commit()
+    return [int(service_id)] + service_ids_for_vehicle(conn, vehicle_id)
+
+def fetch_service_parts(conn, service_id):
+    """Return [(part_or_alt_id, name, manufacturer, part_number, quantity_used), ...] for one service."""
+    return conn.execute('''
+        SELECT COALESCE(sp.alt_part_id, sp.part_id) AS part_id, p.name,
+               COALESCE(ap.manufacturer, p.manufacturer) AS manufacturer,
+               COALESCE(ap.part_number, p.part_number) AS part_number,
+               sp.quantity_used
+        FROM service_parts sp
+        JOIN parts p ON sp.part_id = p.id
+        LEFT JOIN alt_parts ap ON sp.alt_part_id = ap.alt_id
+        WHERE sp.service_id = ?
+        ORDER BY sp.part_id ASC, sp.alt_part_id ASC
+    ''', (service_id,)).fetchall()
+
+def add_service_part(conn, service_id, part_id, alt_part_id, quantity):
+    # A part (main or alternative) can only be added to a service once
+    if alt_part_id:
+        query, params = 'SELECT COUNT(*) FROM service_parts WHERE service_id = ? AND alt_part_id = ?', (service_id, alt_part_id)
+    else:
+        query, params = 'SELECT COUNT(*) FROM service_parts WHERE service_id = ? AND part_id = ? AND alt_part_id IS NULL', (service_id, part_id)
+    if conn.execute(query, params).fetchone()[0] > 0:
+        raise PitStopError('This part or alternative part is already added to the service')
+    try:
+        conn.execute('INSERT INTO service_parts (service_id, part_id, alt_part_id, quantity_used) VALUES (?, ?, ?, ?)',
+                     (service_id, part_id, alt_part_id, quantity))
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        raise PitStopError('An unexpected error occurred while adding the part to the service')
+    conn.commit()
+    return service_id
+
+def remove_service_part(conn, service_id, part_id):
+    # part_id is a main part id (digits) or an alternative part's alt_id
+    if str(part_id).isdigit():
+        conn.execute('DELETE FROM service_parts WHERE service_id=? AND part_id=? AND alt_part_id IS NULL', (service_id, part_id))
+    else:
+        conn.execute('DELETE FROM service_parts WHERE service_id=? AND alt_part_id=?', (service_id, part_id))
+    conn.commit()
+    return service_id
+
+# CSV exports
+
+PARTS_EXPORT_HEADER = ['ID', 'Name', 'Manufacturer', 'Part Number', 'Description', 'Price', 'Vehicle']
+SERVICES_EXPORT_HEADER = ['ID', 'Vehicle', 'Types', 'Date', 'Odometer', 'Description', 'Cost', 'Interval Miles', 'Interval Days']
+
+def export_parts_rows(conn):
+    return conn.execute('''
+        SELECT p.id, p.name, p.manufacturer, p.part_number, p.description, p.price,
+               COALESCE(v.name || (CASE WHEN v.year IS NOT NULL AND v.model IS NOT NULL THEN ' (' || v.year || ' ' || v.model || ')' ELSE '' END), 'N/A')
+        FROM parts p
+        LEFT JOIN vehicles v ON p.vehicle_id = v.id
+    ''')
+
+def export_services_rows(conn):
+    return conn.execute('''
+        SELECT s.id, COALESCE(v.name || (CASE WHEN v.model IS NOT NULL THEN ' (' || v.model || ')' ELSE '' END), v.name) AS vehicle_display,
+               GROUP_CONCAT(st.name, ', ') AS service_types, COALESCE(strftime('%d/%m/%Y', s.date), s.date), s.odometer, s.description, s.cost, s.service_interval_miles, s.service_interval_days
+        FROM services s
+        JOIN vehicles v ON s.vehicle_id = v.id
+        LEFT JOIN service_service_types sst ON s.id = sst.service_id
+        LEFT JOIN service_types st ON sst.service_type_id = st.id
+        GROUP BY s.id
+    ''')
+
+EXPORT_BATCH_ROWS = 5000
+
+def write_csv(file_path, header, cursor, total=None, progress=None, batch_rows=EXPORT_BATCH_ROWS):
+    """Stream cursor's rows to file_path in fetchmany() batches and return how many were written.
+
+    Only one batch is held in memory. The file is written under a temporary
+    name and replaces file_path once complete, so an export aborted by
+    progress(done, total) raising, or by an interrupt, leaves nothing behind.
+    """
+    temp_path = f'{file_path}.part'
+    done = 0
+    try:
+        with open(temp_path, 'w', newline='', encoding='utf-8', buffering=1024 * 1024) as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(header)
+            while True:
+                rows = cursor.fetchmany(batch_rows)
+                if not rows:
+                    break
+                writer.writerows(rows)
+                done += len(rows)
+                if progress:
+                    progress(done, max(done, total or 0))
+        os.replace(temp_path, file_path)
+    finally:
+        cursor.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return done
+
+def export_parts_csv(conn, file_path, progress=None):
+    total = conn.execute('SELECT COUNT(*) FROM parts').fetchone()[0]
+    return write_csv(file_path, PARTS_EXPORT_HEADER, export_parts_rows(conn), total, progress)
+
+def export_services_csv(conn, file_path, progress=None):
+    total = conn.execute('SELECT COUNT(*) FROM services').fetchone()[0]
+    return write_csv(file_path, SERVICES_EXPORT_HEADER, export_services_rows(conn), total, progress)
+
+# Columnar exports
+
+# Column kinds: 'int' (never NULL), 'number' (nullable integer), 'date' (ISO text or NULL), 'text'.
+# Dates that are not ISO-8601 (left behind by migration 3) export as missing.
+ANALYTICS_TABLES = {
+    'services': ('''
+        SELECT id, vehicle_id,
+               CASE WHEN date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]' THEN date END,
+               odometer, cost, service_interval_miles, service_interval_days, description
+        FROM services ORDER BY id
+    ''', [('id', 'int'), ('vehicle_id', 'int'), ('date', 'date'), ('odometer', 'number'), ('cost', 'number'),
+          ('interval_miles', 'number'), ('interval_days', 'number'), ('description', 'text')]),
+    'service_parts': ('SELECT service_id, part_id, alt_part_id, quantity_used FROM service_parts ORDER BY service_id',
+                      [('service_id', 'int'), ('part_id', 'int'), ('alt_part_id', 'text'), ('quantity_used', 'number')]),
+    'service_service_types': ('SELECT service_id, service_type_id FROM service_service_types ORDER BY service_id',
+                              [('service_id', 'int'), ('service_type_id', 'int')]),
+}
+ANALYTICS_FORMATS = ('npz', 'parquet')
+ANALYTICS_BATCH_ROWS = 50000
+
+# NULL numbers become NaN and NULL dates NaT in .npz, which is how pandas reads them back
+NUMPY_DTYPES = {'int': 'int64', 'number': 'float64', 'date': 'datetime64[D]', 'text': 'str'}
+
+def _numpy_columns(numpy, columns, rows):
+    arrays = {}
+    for (name, kind), values in zip(columns, zip(*rows)):
+        if kind == 'text':
+            values = ['' if value is None else value for value in values]
+        arrays[name] = numpy.array(values, dtype=NUMPY_DTYPES[kind])
+    return arrays
+
+def _arrow_schema(pyarrow, columns):
+    # Arrow has real nulls, so nullable numbers stay integers in Parquet
+    types = {'int': pyarrow.int64(), 'number': pyarrow.int64(), 'date': pyarrow.date32(), 'text': pyarrow.string()}
+    return pyarrow.schema([(name, types[kind]) for name, kind in columns])
+
+def _arrow_batch(pyarrow, schema, columns, rows):
+    arrays = []
+    for (name, kind), field, values in zip(columns, schema, zip(*rows)):
+        if kind == 'date':
+            values = [datetime.fromisoformat(value).date() if value else None for value in values]
+        arrays.append(pyarrow.array(values, type=field.type))
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+def _write_npz(cursor, columns, path, report):
+    import numpy
+    chunks = []
+    while True:
+        rows = cursor.fetchmany(ANALYTICS_BATCH_ROWS)
+        if not rows:
+            break
+        chunks.append(_numpy_columns(numpy, columns, rows))
+        report(len(rows))
+    if not chunks:
+        chunks.append({name: numpy.empty(0, dtype=NUMPY_DTYPES[kind]) for name, kind in columns})
+    arrays = {name: numpy.concatenate([chunk[name] for chunk in chunks]) for name, _ in columns}
+    # Uncompressed, so numpy.load() reads the arrays back without inflating them
+    with open(path, 'wb') as output:
+        numpy.savez(output, **arrays)
+
+def _write_parquet(cursor, columns, path, report):
+    import pyarrow
+    import pyarrow.parquet
+    schema = _arrow_schema(pyarrow, columns)
+    # Each batch becomes a row group, so only one batch is held in memory
+    with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+        while True:
+            rows = cursor.fetchmany(ANALYTICS_BATCH_ROWS)
+            if not rows:
+                break
+            writer.write_table(pyarrow.Table.from_batches([_arrow_batch(pyarrow, schema, columns, rows)]))
+            report(len(rows))
+
+def export_analytics(conn, directory, file_format='npz', progress=None):
+    """Write services, service_parts and service_service_types as typed columns and return the file paths.
+
+    'npz' needs numpy and writes one .npz of named arrays per table (numpy.load);
+    'parquet' needs pyarrow and writes one .parquet per table (pandas.read_parquet).
+    Rows are read ANALYTICS_BATCH_ROWS at a time from one read transaction.
+    progress(done, total) counts rows and may raise to abort.
+    """
+    if file_format not in ANALYTICS_FORMATS:
+        raise PitStopError(f'Unknown export format {file_format!r}')
+    module = 'numpy' if file_format == 'npz' else 'pyarrow'
+    if importlib.util.find_spec(module) is None:
+        raise PitStopError(f'Exporting .{file_format} files needs the {module} package')
+    write = _write_npz if file_format == 'npz' else _write_parquet
+    conn.execute('BEGIN')
+    try:
+        total = sum(conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] for table in ANALYTICS_TABLES)
+        done = 0
+
+        def report(rows):
+            nonlocal done
+            done += rows
+            if progress:
+                progress(done, max(done, total))
+
+        paths = []
+        for table, (query, columns) in ANALYTICS_TABLES.items():
+            path = os.path.join(directory, f'{table}.{file_format}')
+            temp_path = f'{path}.part'
+            try:
+                write(conn.execute(query), columns, temp_path, report)
+                os.replace(temp_path, path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            paths.append(path)
+    finally:
+        conn.rollback()
+    return paths
+
+# CSV imports
+
+VEHICLES_IMPORT_HEADER = ['Name', 'Year', 'Model']
+SERVICE_TYPES_IMPORT_HEADER = ['Name']
+ALT_PARTS_IMPORT_HEADER = ['Part Number', 'Vehicle', 'Alt Manufacturer', 'Alt Part Number']
+IMPORT_BATCH_ROWS = 10000
+
+def _optional_int(value, field):
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'{field} must be an integer')
+
+def _import_date(value):
+    # DD/MM/YYYY as exported, or ISO-8601; split by hand since strptime dominates the row cost
+    try:
+        if '/' in value:
+            day, month, year = value.split('/')
+            return datetime(int(year), int(month), int(day)).date().isoformat()
+        return datetime.fromisoformat(value).date().isoformat()
+    except ValueError:
+        raise ValueError('Date must be in DD/MM/YYYY format')
+
+def _vehicle_lookup(conn):
+    # Every way an export names a vehicle -> its id; a name shared by several vehicles maps to None
+    lookup = {}
+    def add(key, vehicle_id):
+        lookup[key] = vehicle_id if lookup.get(key, vehicle_id) == vehicle_id else None
+    for vehicle_id, name, year, model in conn.execute('SELECT id, name, year, model FROM vehicles'):
+        add(name, vehicle_id)
+        if model is not None:
+            add(f'{name} ({model})', vehicle_id)
+            if year is not None:
+                add(f'{name} ({year} {model})', vehicle_id)
+    return lookup
+
+def _lookup_vehicle(vehicles, value):
+    if value not in vehicles:
+        raise ValueError(f'Unknown vehicle {value!r}')
+    if vehicles[value] is None:
+        raise ValueError(f'Vehicle {value!r} matches more than one vehicle')
+    return vehicles[value]
+
+class _Importer:
+    # One per CSV kind: header lists the columns read, parse() turns a record into
+    # insert parameters or raises ValueError with the reject reason, insert() writes a batch.
+    header = []
+    required = []
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def insert(self, batch):
+        raise NotImplementedError
+
+    def finish(self):
+        pass
+
+class _VehiclesImporter(_Importer):
+    header = VEHICLES_IMPORT_HEADER
+    required = ['Name']
+
+    def parse(self, name, year, model):
+        if not name:
+            raise ValueError('Name is required')
+        return name, _optional_int(year, 'Year'), model or None
+
+    def insert(self, batch):
+        self.conn.executemany('INSERT INTO vehicles (name, year, model) VALUES (?, ?, ?)', batch)
+
+class _ServiceTypesImporter(_Importer):
+    header = SERVICE_TYPES_IMPORT_HEADER
+    required = ['Name']
+
+    def __init__(self, conn):
+        super().__init__(conn)
+        self.names = {name.lower() for name, in conn.execute('SELECT name FROM service_types')}
+
+    def parse(self, name):
+        if not name:
+            raise ValueError('Name is required')
+        # Service records name their types, so names have to stay unambiguous
+        if name.lower() in self.names:
+            raise ValueError(f'Service type {name!r} already exists')
+        self.names.add(name.lower())
+        return name,
+
+    def insert(self, batch):
+        self.conn.executemany('INSERT INTO service_types (name) VALUES (?)', batch)
+
+class _PartsImporter(_Importer):
+    header = PARTS_EXPORT_HEADER
+    required = ['Name', 'Part Number', 'Vehicle']
+
+    def __init__(self, conn):
+        super().__init__(conn)
+        self.vehicles = _vehicle_lookup(conn)
+        self.keys = set(conn.execute('SELECT part_number, vehicle_id FROM parts'))
+        self.last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM parts').fetchone()[0]
+        # The per-row FTS trigger is replaced by one INSERT ... SELECT over the new parts in finish()
+        self.fts_trigger = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'parts_fts_ai'").fetchone()
+        if self.fts_trigger:
+            conn.execute('DROP TRIGGER parts_fts_ai')
+
+    def parse(self, part_id, name, manufacturer, part_number, description, price, vehicle):
+        if not name or not part_number or not vehicle:
+            raise ValueError('Name, Part Number and Vehicle are required')
+        vehicle_id = _lookup_vehicle(self.vehicles, vehicle)
+        if (part_number, vehicle_id) in self.keys:
+            raise ValueError('Part number already exists for this vehicle')
+        self.keys.add((part_number, vehicle_id))
+        return name, manufacturer or None, part_number, description or None, _optional_int(price, 'Price') or 0, vehicle_id
+
+    def insert(self, batch):
+        self.conn.executemany('INSERT INTO parts (name, manufacturer, part_number, description, price, vehicle_id) VALUES (?, ?, ?, ?, ?, ?)', batch)
+
+    def finish(self):
+        if self.fts_trigger:
+            self.conn.execute('''
+                INSERT INTO parts_fts (rowid, name, part_number, alt_parts, vehicle)
+                SELECT p.id, p.name, p.part_number, NULL, v.name || ' ' || COALESCE(v.model, '')
+                FROM parts p
+                LEFT JOIN vehicles v ON p.vehicle_id = v.id
+                WHERE p.id > ?
+            ''', (self.last_id,))
+            self.conn.execute(self.fts_trigger[0])
+
+class _AltPartsImporter(_Importer):
+    header = ALT_PARTS_IMPORT_HEADER
+    required = ['Part Number', 'Vehicle', 'Alt Part Number']
+
+    def __init__(self, conn):
+        super().__init__(conn)
+        self.vehicles = _vehicle_lookup(conn)
+        self.parts = {(part_number, vehicle_id): part_id for part_id, part_number, vehicle_id in conn.execute('SELECT id, part_number, vehicle_id FROM parts')}
+        # A part number is unique for a vehicle across parts and alternative parts, as in add_alt_part()
+        self.keys = set(self.parts)
+        self.keys.update(conn.execute('SELECT a.part_number, p.vehicle_id FROM alt_parts a JOIN parts p ON a.part_id = p.id'))
+        self.used_letters = {}
+        for part_id, alt_id in conn.execute('SELECT part_id, alt_id FROM alt_parts'):
+            self.used_letters.setdefault(part_id, set()).add(alt_id[len(str(part_id)):])
+
+    def parse(self, part_number, vehicle, manufacturer, alt_part_number):
+        if not part_number or not vehicle or not alt_part_number:
+            raise ValueError('Part Number, Vehicle and Alt Part Number are required')
+        vehicle_id = _lookup_vehicle(self.vehicles, vehicle)
+        part_id = self.parts.get((part_number, vehicle_id))
+        if part_id is None:
+            raise ValueError(f'Unknown part {part_number!r} for this vehicle')
+        if (alt_part_number, vehicle_id) in self.keys:
+            raise ValueError('Part number already exists for this vehicle')
+        self.keys.add((alt_part_number, vehicle_id))
+        used = self.used_letters.setdefault(part_id, set())
+        letter = 'a'
+        while letter in used:
+            letter = chr(ord(letter) + 1)
+        used.add(letter)
+        return f'{part_id}{letter}', part_id, manufacturer or None, alt_part_number
+
+    def insert(self, batch):
+        self.conn.executemany('INSERT INTO alt_parts (alt_id, part_id, manufacturer, part_number) VALUES (?, ?, ?, ?)', batch)
+
+class _ServicesImporter(_Importer):
+    header = SERVICES_EXPORT_HEADER
+    required = ['Vehicle', 'Date']
+
+    def __init__(self, conn):
+        super().__init__(conn)
+        self.vehicles = _vehicle_lookup(conn)
+        self.types = {}
+        for type_id, name in conn.execute('SELECT id, name FROM service_types'):
+            self.types.setdefault(name.lower(), type_id)
+        # Ids are assigned here so the service type links can go in with executemany too
+        self.next_id = 1 + conn.execute('''
+            SELECT MAX(COALESCE((SELECT MAX(id) FROM services), 0),
+                       COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'services'), 0))
+        ''').fetchone()[0]
+
+    def parse(self, service_id, vehicle, types, service_date, odometer, description, cost, interval_miles, interval_days):
+        vehicle_id = _lookup_vehicle(self.vehicles, vehicle)
+        type_ids = []
+        for name in filter(None, (name.strip() for name in types.split(','))):
+            if name.lower() not in self.types:
+                raise ValueError(f'Unknown service type {name!r}')
+            type_ids.append(self.types[name.lower()])
+        row = (self.next_id, vehicle_id, _import_date(service_date), _optional_int(odometer, 'Odometer'), description or None,
+               _optional_int(cost, 'Cost'), _optional_int(interval_miles, 'Interval Miles'), _optional_int(interval_days, 'Interval Days'))
+        self.next_id += 1
+        return row, type_ids
+
+    def insert(self, batch):
+        self.conn.executemany('INSERT INTO services (id, vehicle_id, date, odometer, description, cost, service_interval_miles, service_interval_days) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                              [row for row, _ in batch])
+        self.conn.executemany('INSERT OR IGNORE INTO service_service_types (service_id, service_type_id) VALUES (?, ?)',
+                              [(row[0], type_id) for row, type_ids in batch for type_id in type_ids])
+
+IMPORTERS = {
+    'vehicles': _VehiclesImporter,
+    'service_types': _ServiceTypesImporter,
+    'parts': _PartsImporter,
+    'alt_parts': _AltPartsImporter,
+    'services': _ServicesImporter,
+}
+
+def _import_batches(reader, importer, pick, width, batch_rows, reject):
+    # Validate the records in one streaming pass and yield insert parameters in batches
+    padding = [''] * (width + 1)
+    batch = []
+    for line, record in enumerate(reader, start=2):
+        if not record:
+            continue
+        try:
+            batch.append(importer.parse(*pick(record + padding)))
+        except ValueError as e:
+            reject(line, str(e), record)
+            continue
+        if len(batch) >= batch_rows:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def import_csv(conn, kind, file_path, rejects_path=None, progress=None, batch_rows=IMPORT_BATCH_ROWS):
+    """Bulk-load a CSV of `kind` (a key of IMPORTERS) and return (imported, rejected).
+
+    Parts and services read the files export_parts_csv()/export_services_csv()
+    write; columns are matched by header name, and an ID column is ignored.
+    Rows are validated in one streaming pass against in-memory lookup maps and
+    inserted with executemany() in batch_rows batches, all in one transaction.
+    Parsing runs on a helper thread; conn is only used on the calling thread.
+    A row that fails validation is written to rejects_path with its line number
+    and reason instead of aborting the import (the file is removed again if no
+    row was rejected). progress(done, total) counts
+    bytes read and may raise to abort, which rolls the whole import back.
+    """
+    importer_class = IMPORTERS[kind]
+    with contextlib.ExitStack() as stack:
+        raw = stack.enter_context(open(file_path, 'rb'))
+        reader = csv.reader(stack.enter_context(io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')))
+        file_header = next(reader, [])
+        columns = {name.strip().lower(): index for index, name in enumerate(file_header)}
+        missing = [name for name in importer_class.required if name.lower() not in columns]
+        if missing:
+            raise PitStopError(f'{os.path.basename(file_path)} has no {", ".join(missing)} column')
+        # Columns the file lacks read as empty strings
+        indexes = [columns.get(name.lower(), len(file_header)) for name in importer_class.header]
+        pick = operator.itemgetter(*indexes) if len(indexes) > 1 else lambda fields: (fields[indexes[0]],)
+        rejected = 0
+
+        def reject(line, reason, record):
+            nonlocal rejected
+            rejected += 1
+            if reject_writer:
+                reject_writer.writerow([line, reason] + record)
+
+        reject_writer = None
+        if rejects_path:
+            reject_writer = csv.writer(stack.enter_context(open(rejects_path, 'w', newline='', encoding='utf-8')))
+            reject_writer.writerow(['Line', 'Reason'] + file_header)
+        total = os.fstat(raw.fileno()).st_size
+        imported = 0
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute('BEGIN')
+        # A helper thread parses the next batch while this one inserts the previous batch (sqlite3
+        # releases the GIL while it steps); conn is only used here, so plain connections work
+        importer = importer_class(conn)
+        batches = queue.Queue(maxsize=2)
+        stop = threading.Event()
+
+        def parse():
+            try:
+                for batch in _import_batches(reader, importer, pick, len(file_header), batch_rows, reject):
+                    batches.put((batch, raw.tell()))
+                    if stop.is_set():
+                        return
+            finally:
+                batches.put(None)
+
+        parser = stack.enter_context(ThreadPoolExecutor(max_workers=1)).submit(parse)
+        try:
+            for batch, done in iter(batches.get, None):
+                importer.insert(batch)
+                imported += len(batch)
+                if progress:
+                    progress(done, total)
+            parser.result()
+            importer.finish()
+            conn.commit()
+        except BaseException:
+            if not parser.done():
+                # Unblock the parser so it sees stop and puts its final None
+                stop.set()
+                while batches.get() is not None:
+                    pass
+            conn.rollback()
+            raise
+    if rejects_path and not rejected:
+        os.remove(rejects_path)
+    if progress:
+        progress(total, total)
+    return imported, rejected
+
+# Backup and restore
+
+def backup_database(conn, file_path, compact=False, pages=1024, progress=None):
+    """Write a consistent copy of the database behind conn to file_path.
+
+    The backup API copies `pages` pages per step from one read snapshot, so
+    under WAL other connections keep reading and writing while it runs.
+    compact=True writes it with VACUUM INTO instead, leaving out free pages.
+    progress(done, total) may raise to abort. The copy is integrity-checked
+    before it replaces file_path.
+    """
+    fd, temp_path = tempfile.mkstemp(prefix='.pitstop-backup-', suffix='.db', dir=os.path.dirname(os.path.abspath(file_path)))
+    os.close(fd)
+    try:
+        if compact:
+            os.remove(temp_path)  # VACUUM INTO will not overwrite a file
+            if progress:
+                progress(0, 1)
+            conn.execute('VACUUM INTO ?', (temp_path,))
+            if progress:
+                progress(1, 1)
+        else:
+            target = sqlite3.connect(temp_path)
+            try:
+                # Without an open read transaction every commit elsewhere would restart the copy
+                conn.execute('BEGIN')
+                conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+                conn.backup(target, pages=pages,
+                            progress=(lambda status, remaining, total: progress(total - remaining, total)) if progress else None)
+            finally:
+                conn.rollback()
+                target.close()
+        _check_backup(temp_path)
+        os.replace(temp_path, file_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return file_path
+
+def _check_backup(path):
+    # A backup should be a single self-contained file that reads back cleanly
+    backup = sqlite3.connect(path)
+    try:
+        backup.execute('PRAGMA journal_mode = DELETE')
+        problems = [row[0] for row in backup.execute('PRAGMA integrity_check')]
+    finally:
+        backup.close()
+    if problems != ['ok']:
+        raise PitStopError('The backup failed its integrity check: ' + '; '.join(problems[:5]))
+
+def restore_database(conn, source_path):
+    """Replace the database behind conn with the backup at source_path and migrate it.
+
+    Goes through the SQLite backup API, so other open connections stay valid.
+    """
+    source = sqlite3.connect(source_path)
+    try:
+        source.execute('PRAGMA schema_version').fetchone()  # fails early if this is not a database
+        source.backup(conn)
+    finally:
+        source.close()
+    # The copied header carries the backup's journal mode
+    conn.execute('PRAGMA journal_mode = WAL')
+    return migrate_database(conn)
+
+# Incremental snapshots
+
+SNAPSHOT_BLOCK_ROWS = 1024
+
+def _snapshot_encode(value):
+    # json.dumps default= hook; the schema has no BLOB columns, but keep them round-trippable
+    if isinstance(value, bytes):
+        return {'blob': value.hex()}
+    raise TypeError(f'Cannot store {type(value).__name__} in a snapshot')
+
+def _snapshot_decode(row):
+    return [bytes.fromhex(value['blob']) if isinstance(value, dict) else value for value in row]
+
+def _write_file(path, data):
+    # Write to a temporary name first so a crash never leaves a half-written chunk or manifest
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as output:
+        output.write(data)
+    os.replace(temp_path, path)
+
+def _chunk_path(backup_dir, digest):
+    return os.path.join(backup_dir, 'chunks', digest[:2], digest)
+
+def _snapshot_tables(schema):
+    # Tables whose rows are stored: FTS shadow tables are rebuilt by their virtual table,
+    # and ANALYZE statistics (sqlite_stat*) by the next ANALYZE or PRAGMA optimize
+    virtual = [name for kind, name, sql in schema if kind == 'table' and (sql or '').upper().startswith('CREATE VIRTUAL TABLE')]
+    return [name for kind, name, sql in schema
+            if kind == 'table' and not name.startswith('sqlite_stat') and not any(name.startswith(f'{vtab}_') for vtab in virtual)]
+
+def snapshot_backup(conn, backup_dir, progress=None):
+    """Add an incremental snapshot of the database to backup_dir and return its manifest path.
+
+    Each table is cut into blocks of SNAPSHOT_BLOCK_ROWS rowids, serialized and
+    stored once under chunks/ by SHA-256, so a snapshot only writes the blocks
+    that changed since any earlier one. snapshots/<time>.json lists the schema
+    and every table's blocks. Everything is read in one read transaction, so
+    conn can be a pool reader while writes carry on. progress(done, total)
+    counts rowids and may raise to abort.
+    """
+    conn.execute('BEGIN')
+    try:
+        schema = conn.execute("SELECT type, name, sql FROM sqlite_master WHERE name NOT LIKE 'sqlite_autoindex_%' ORDER BY rowid").fetchall()
+        tables = _snapshot_tables(schema)
+        last_rowids = [conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM "{table}"').fetchone()[0] for table in tables]
+        total = sum(last_rowids)
+        manifest = {
+            'format': 1,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'user_version': conn.execute('PRAGMA user_version').fetchone()[0],
+            'schema': schema,
+            'tables': {},
+        }
+        done = new_chunks = new_bytes = 0
+        for table, last_rowid in zip(tables, last_rowids):
+            cursor = conn.execute(f'SELECT rowid, * FROM "{table}" ORDER BY rowid')
+            columns = [column[0] for column in cursor.description][1:]
+            blocks = []
+            for block, rows in itertools.groupby(cursor, key=lambda row: row[0] // SNAPSHOT_BLOCK_ROWS):
+                rows = list(rows)
+                data = json.dumps(rows, default=_snapshot_encode, separators=(',', ':')).encode('utf-8')
+                digest = hashlib.sha256(data).hexdigest()
+                path = _chunk_path(backup_dir, digest)
+                if not os.path.exists(path):
+                    _write_file(path, zlib.compress(data))
+                    new_chunks += 1
+                    new_bytes += len(data)
+                blocks.append([block, digest])
+                if progress:
+                    progress(done + rows[-1][0], total)
+            manifest['tables'][table] = {'columns': columns, 'blocks': blocks}
+            done += last_rowid
+    finally:
+        conn.rollback()
+    manifest['new_chunks'], manifest['new_bytes'] = new_chunks, new_bytes
+    path = os.path.join(backup_dir, 'snapshots', datetime.now().strftime('%Y%m%dT%H%M%S%f') + '.json')
+    _write_file(path, json.dumps(manifest, indent=1).encode('utf-8'))
+    return path
+
+def list_snapshots(backup_dir):
+    """Return the manifest paths in backup_dir, oldest first."""
+    snapshots_dir = os.path.join(backup_dir, 'snapshots')
+    if not os.path.isdir(snapshots_dir):
+        return []
+    return [os.path.join(snapshots_dir, name) for name in sorted(os.listdir(snapshots_dir)) if name.endswith('.json')]
+
+def restore_snapshot(conn, manifest_path, progress=None):
+    """Rebuild the snapshot described by manifest_path and restore it into the database behind conn.
+
+    The chunks are checked against their hashes and loaded into a scratch
+    database next to the backup, which then goes through restore_database().
+    """
+    with open(manifest_path, encoding='utf-8') as manifest_file:
+        manifest = json.load(manifest_file)
+    if manifest.get('format') != 1:
+        raise PitStopError(f'{os.path.basename(manifest_path)} is not a PitStop snapshot manifest')
+    backup_dir = os.path.dirname(os.path.dirname(os.path.abspath(manifest_path)))
+    schema = manifest['schema']
+    tables = _snapshot_tables(schema)
+    total = sum(len(manifest['tables'][table]['blocks']) for table in tables)
+    fd, temp_path = tempfile.mkstemp(prefix='.pitstop-restore-', suffix='.db', dir=backup_dir)
+    os.close(fd)
+    try:
+        target = sqlite3.connect(temp_path)
+        try:
+            # Tables first, then rows, then indexes and triggers so the FTS triggers do not fire twice
+            for kind, name, sql in schema:
+                if name in tables and not name.startswith('sqlite_'):
+                    target.execute(sql)
+            done = 0
+            for table in sorted(tables, key=lambda name: name == 'sqlite_sequence'):
+                if table == 'sqlite_sequence':
+                    # Filled in by the inserts above; the snapshot's counters win
+                    target.execute('DELETE FROM sqlite_sequence')
+                columns = ['rowid'] + [f'"{column}"' for column in manifest['tables'][table]['columns']]
+                insert = f'INSERT INTO "{table}" ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})'
+                for block, digest in manifest['tables'][table]['blocks']:
+                    try:
+                        with open(_chunk_path(backup_dir, digest), 'rb') as chunk:
+                            data = zlib.decompress(chunk.read())
+                    except FileNotFoundError:
+                        raise PitStopError(f'Snapshot chunk {digest} is missing from {backup_dir}')
+                    if hashlib.sha256(data).hexdigest() != digest:
+                        raise PitStopError(f'Snapshot chunk {digest} is damaged')
+                    target.executemany(insert, (_snapshot_decode(row) for row in json.loads(data)))
+                    done += 1
+                    if progress:
+                        progress(done, total)
+            for kind, name, sql in schema:
+                if kind in ('index', 'trigger', 'view') and sql:
+                    target.execute(sql)
+            target.execute(f"PRAGMA user_version = {int(manifest['user_version'])}")
+            target.commit()
+        finally:
+            target.close()
+        _check_backup(temp_path)
+        return restore_database(conn, temp_path)
+    finally:
+        os.remove(temp_path)
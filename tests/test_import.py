@@ -0,0 +1,35 @@
+import csv
+
+import pitstop_db as db
+
+def write_csv(path, header, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+def test_import_writes_rejected_rows(conn, tmp_path):
+    db.add_vehicle(conn, 'Golf', 2004, 'Mk4')
+    source = tmp_path / 'parts.csv'
+    rejects = tmp_path / 'rejects.csv'
+    write_csv(source, ['Name', 'Manufacturer', 'Part Number', 'Price', 'Vehicle'], [
+        ['Oil filter', '', 'W712', '5', 'Golf (2004 Mk4)'],
+        ['Air filter', 'Mann', 'C2', 'cheap', 'Golf (2004 Mk4)'],
+        ['', 'Mann', 'C3', '5', 'Golf (2004 Mk4)'],
+        ['Spark plug', 'NGK', 'BKR6', '3', 'No such car'],
+    ])
+    assert db.import_csv(conn, 'parts', str(source), str(rejects)) == (1, 3)
+    assert conn.execute('SELECT name, manufacturer, part_number FROM parts').fetchall() == [('Oil filter', None, 'W712')]
+    with open(rejects, newline='', encoding='utf-8') as f:
+        rejected = list(csv.reader(f))
+    assert rejected[0][:2] == ['Line', 'Reason']
+    assert [row[0] for row in rejected[1:]] == ['3', '4', '5']
+    assert all(row[1] for row in rejected[1:])
+
+def test_import_removes_empty_rejects_file(conn, tmp_path):
+    db.add_vehicle(conn, 'Golf', 2004, 'Mk4')
+    source = tmp_path / 'parts.csv'
+    rejects = tmp_path / 'rejects.csv'
+    write_csv(source, ['Name', 'Part Number', 'Vehicle'], [['Oil filter', 'W712', 'Golf (2004 Mk4)']])
+    assert db.import_csv(conn, 'parts', str(source), str(rejects)) == (1, 0)
+    assert not rejects.exists()
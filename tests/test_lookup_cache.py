@@ -0,0 +1,53 @@
+import pytest
+
+import pitstop_db as db
+
+@pytest.fixture
+def app_db(tmp_path):
+    # The app's pool with the cache watching its writes, plus another process's connection
+    path = str(tmp_path / 'pitstop.db')
+    pool = db.ConnectionPool(path)
+    with pool.writer() as conn:
+        first = db.add_vehicle(conn, 'Golf', 2004, 'Mk4')
+        db.add_vehicle(conn, 'Polo', 2010, None)
+        db.add_part(conn, 'Oil filter', None, 'W712', '', 5, first)
+    cache = db.LookupCache(path)
+    pool.watch(cache.after_write)
+    other = db.connect(path)
+    yield pool, cache, other
+    other.close()
+    cache.close()
+    pool.close()
+
+def app_rename(pool, cache, vehicle_id, name):
+    with pool.writer() as conn:
+        db.update_vehicle(conn, vehicle_id, name, None, None)
+    cache.invalidate('vehicles', [vehicle_id])
+
+def names(cache):
+    return [vehicle[1] for vehicle in cache.vehicles()]
+
+def test_own_write_refreshes_only_its_ids(app_db):
+    pool, cache, other = app_db
+    app_rename(pool, cache, 1, 'Warm-up')
+    cache.vehicles()
+    cache.part(1)
+    app_rename(pool, cache, 1, 'Golf GTI')
+    assert names(cache) == ['Golf GTI', 'Polo']
+    misses = cache.misses
+    cache.part(1)
+    assert cache.misses == misses
+
+@pytest.mark.parametrize('other_commits', ['before', 'after'])
+def test_other_commit_around_own_write_clears_everything(app_db, other_commits):
+    pool, cache, other = app_db
+    app_rename(pool, cache, 1, 'Warm-up')
+    assert names(cache) == ['Warm-up', 'Polo']
+    if other_commits == 'before':
+        db.update_vehicle(other, 2, 'Polo GTI', None, None)
+    with pool.writer() as conn:
+        db.update_vehicle(conn, 1, 'Golf GTI', None, None)
+    if other_commits == 'after':
+        db.update_vehicle(other, 2, 'Polo GTI', None, None)
+    cache.invalidate('vehicles', [1])
+    assert names(cache) == ['Golf GTI', 'Polo GTI']
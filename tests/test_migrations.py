@@ -0,0 +1,50 @@
+import sqlite3
+
+import pytest
+
+import pitstop_db as db
+
+def legacy_database(path):
+    # The layout PitStop used before schema versions: no UNIQUE constraints, one
+    # service type per service and DD/MM/YYYY dates
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE vehicles (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, year INTEGER, model TEXT);
+        CREATE TABLE service_types (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL);
+        CREATE TABLE parts (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, manufacturer TEXT, part_number TEXT NOT NULL,
+                            description TEXT, price INTEGER, vehicle_id INTEGER NOT NULL);
+        CREATE TABLE alt_parts (alt_id TEXT PRIMARY KEY, part_id INTEGER NOT NULL, manufacturer TEXT, part_number TEXT NOT NULL);
+        CREATE TABLE services (id INTEGER PRIMARY KEY AUTOINCREMENT, vehicle_id INTEGER NOT NULL, service_type_id INTEGER, date TEXT NOT NULL,
+                               odometer INTEGER, description TEXT, cost INTEGER, service_interval_miles INTEGER, service_interval_days INTEGER);
+        INSERT INTO vehicles (name, year, model) VALUES ('Golf', 2004, 'Mk4');
+        INSERT INTO service_types (name) VALUES ('Oil change');
+        INSERT INTO parts (name, manufacturer, part_number, description, price, vehicle_id) VALUES ('Oil filter', 'Mann', 'W712', NULL, NULL, 1);
+        INSERT INTO alt_parts VALUES ('1a', 1, 'Bosch', 'P7012');
+        INSERT INTO services (vehicle_id, service_type_id, date, odometer, description, cost) VALUES (1, 1, '31/01/2020', 150000, 'Oil', NULL);
+        INSERT INTO services (vehicle_id, service_type_id, date, odometer, description, cost) VALUES (1, NULL, '05/12/2021', 160000, 'Check', 40);
+    ''')
+    conn.close()
+
+def test_migrates_unversioned_database(tmp_path):
+    path = str(tmp_path / 'legacy.db')
+    legacy_database(path)
+    conn = sqlite3.connect(path)
+    assert db.migrate_database(conn) == db.SCHEMA_VERSION
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == db.SCHEMA_VERSION
+    assert conn.execute('SELECT date, cost FROM services ORDER BY id').fetchall() == [('2020-01-31', 0), ('2021-12-05', 40)]
+    assert conn.execute('SELECT service_id, service_type_id FROM service_service_types').fetchall() == [(1, 1)]
+    assert conn.execute('SELECT price FROM parts').fetchall() == [(0,)]
+    assert conn.execute('PRAGMA integrity_check').fetchone() == ('ok',)
+    # A second run has nothing left to do
+    assert db.migrate_database(conn) == db.SCHEMA_VERSION
+    conn.close()
+
+def test_refuses_database_from_newer_version(tmp_path):
+    path = str(tmp_path / 'newer.db')
+    conn = sqlite3.connect(path)
+    conn.execute(f'PRAGMA user_version = {db.SCHEMA_VERSION + 1}')
+    conn.close()
+    conn = sqlite3.connect(path)
+    with pytest.raises(db.PitStopError, match='newer'):
+        db.migrate_database(conn)
+    conn.close()
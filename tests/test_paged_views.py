@@ -0,0 +1,50 @@
+import types
+
+import pytest
+
+ttk = pytest.importorskip('ttkbootstrap')
+tkinter = pytest.importorskip('tkinter')
+
+import pitstop
+import pitstop_db as db
+
+@pytest.fixture
+def root():
+    try:
+        root = ttk.Window()
+    except tkinter.TclError:
+        pytest.skip('no display')
+    root.withdraw()
+    yield root
+    root.destroy()
+
+def paged_parts_view(root, conn):
+    # Just enough of CarManagementApp for refresh_part_rows(), with jobs run inline
+    def read_db(func, *args, key=None, debounce=False, on_done=None, on_error=None):
+        result = func(conn, *args)
+        if on_done:
+            on_done(result)
+
+    app = types.SimpleNamespace(read_db=read_db, parts_tab='parts', tab_built=lambda tab: True)
+    tree = pitstop.VirtualTreeview(root, columns=('ID', 'Name', 'Manufacturer', 'Part Number', 'Description', 'Price', 'Vehicle'))
+    app.parts_tree = tree
+    app.parts_pager = pitstop.Pager(root, app, tree, 'parts', 'parts', db.fetch_parts_page, db.PARTS_PAGE_KEYS, lambda: None,
+                                    lambda parts, vehicle_id: tree.set_rows(pitstop.CarManagementApp.part_rows(app, parts)))
+    app.parts_pager.enabled.set(True)
+    return app
+
+def test_write_on_paged_view_reloads_the_page(root, conn):
+    vehicle_id = db.add_vehicle(conn, 'Car', 2020, 'Model')
+    for index in range(db.PAGE_ROWS * 2):
+        db.add_part(conn, f'Part {index}', None, f'PN-{index:04}', '', 1, vehicle_id)
+    app = paged_parts_view(root, conn)
+    app.parts_pager.load()
+    app.parts_pager.next()
+    page = [row[0] for row in app.parts_tree.rows()]
+    assert len(page) == db.PAGE_ROWS
+
+    # Every part of the vehicle is refreshed, as vehicle_updated() does
+    db.update_vehicle(conn, vehicle_id, 'Renamed', 2020, 'Model')
+    pitstop.CarManagementApp.refresh_part_rows(app, db.part_ids_for_vehicle(conn, vehicle_id))
+    assert [row[0] for row in app.parts_tree.rows()] == page
+    assert all(row[1][6].startswith('Renamed') for row in app.parts_tree.rows())
@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+import pitstop_db as db
+
+PARTS_HEADER = ['ID', 'Name', 'Manufacturer', 'Part Number', 'Description', 'Price', 'Vehicle']
+
+@pytest.fixture
+def parts_conn(conn):
+    rng = random.Random(3)
+    for _ in range(8):
+        db.add_vehicle(conn, rng.choice(['alpha', 'Beta', 'gamma', 'Zed']), rng.choice([None, 2001]), rng.choice([None, 'X', 'y']))
+    for index in range(500):
+        conn.execute('INSERT INTO parts (name, manufacturer, part_number, description, price, vehicle_id) VALUES (?, ?, ?, ?, ?, ?)',
+                     (rng.choice(['bolt', 'Bolt', 'NUT', 'nut', 'Axle']) + str(rng.randint(0, 5)), rng.choice([None, 'acme', 'Bosch']),
+                      f'PN{index}', rng.choice([None, 'a', 'B']), rng.randint(1, 20), rng.randint(1, 8)))
+    conn.commit()
+    return conn
+
+def walk(conn, column, reverse, limit=37):
+    ids = []
+    after = None
+    while True:
+        parts, first, last, has_prev, has_next = db.fetch_parts_page(conn, sort_column=column, reverse=reverse, after=after, limit=limit)
+        ids += [values[0] for values, _ in parts]
+        after = last
+        if not has_next:
+            return ids
+
+def walk_back(conn, column, reverse, limit=37):
+    parts, first, last, has_prev, has_next = db.fetch_parts_page(conn, sort_column=column, reverse=reverse, end=True, limit=limit)
+    ids = [values[0] for values, _ in parts]
+    while has_prev:
+        parts, first, last, has_prev, has_next = db.fetch_parts_page(conn, sort_column=column, reverse=reverse, before=first, limit=limit)
+        ids = [values[0] for values, _ in parts] + ids
+    return ids
+
+@pytest.mark.parametrize('reverse', [False, True])
+@pytest.mark.parametrize('column', sorted(db.PARTS_PAGE_KEYS))
+def test_pages_follow_the_unpaged_sort_order(parts_conn, column, reverse):
+    # Keyset pages, walked either way, list every part once in the order sort_key()
+    # puts the displayed values in (ties may be broken differently)
+    position = PARTS_HEADER.index(column)
+    values = {part[0]: part for part, _ in db.fetch_parts(parts_conn)}
+
+    def shown(ids):
+        return [db.sort_key(values[id_][position]) for id_ in ids]
+
+    expected = sorted(values, key=lambda id_: db.sort_key(values[id_][position]), reverse=reverse)
+    ids = walk(parts_conn, column, reverse)
+    assert sorted(ids) == sorted(expected)
+    assert shown(ids) == shown(expected)
+    assert walk_back(parts_conn, column, reverse) == ids
+
+def test_jump_compares_text_case_insensitively(parts_conn):
+    parts, first, last, has_prev, has_next = db.fetch_parts_page(parts_conn, sort_column='Name', start='BOLT3', limit=5)
+    assert has_prev and all(values[1].lower() >= 'bolt3' for values, _ in parts)
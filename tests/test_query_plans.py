@@ -0,0 +1,5 @@
+import pitstop_bench
+
+def test_no_query_scans_a_large_table():
+    regressions = pitstop_bench.check_query_plans(parts=5000, services=5000)
+    assert regressions == [], '\n'.join(f"{r['query']}: {r['problems']}" for r in regressions)
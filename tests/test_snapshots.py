@@ -0,0 +1,4 @@
+import pitstop_bench
+
+def test_snapshot_round_trip_after_analyze():
+    assert pitstop_bench.check_snapshot_round_trip(parts=500, services=500) == []